@@ -0,0 +1,275 @@
+"""
+Local stand-ins for Garmin Connect and Fittrackee, serving synthetic
+activities built from the files of tests/files.
+"""
+
+import bisect
+import io
+import json
+import multiprocessing
+import random
+import re
+import socket
+import threading
+import time
+import zipfile
+from collections import Counter
+from copy import deepcopy
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+FILES = Path(__file__).resolve().parent.parent / "tests" / "files"
+
+# Garmin sport type id, and if the activity has GPS data
+SPORTS = [(1, True), (2, True), (5, True), (18, False), (25, False), (143, True)]
+
+
+def load_payloads() -> dict:
+    """
+    Activity files by Garmin download format. The fake Fittrackee
+    server doesn't parse them, only their size matters.
+    """
+    gpx = (FILES / "Saint-Herblain_58_4km.gpx").read_bytes()
+    original = io.BytesIO()
+    with zipfile.ZipFile(original, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("activity.gpx", gpx)
+    return {"GPX": gpx, "TCX": gpx, "ORIGINAL": original.getvalue()}
+
+
+def synthetic_activities(count: int, start: datetime, end: datetime, seed: int = 0):
+    """
+    count activities evenly spread between start and end, oldest first.
+    """
+    rng = random.Random(seed)
+    step = (end - start) / max(count, 1)
+    activities = []
+    for i in range(count):
+        type_id, has_gps = SPORTS[rng.randrange(len(SPORTS))]
+        started = start + step * i
+        activities.append(
+            {
+                "activityId": 10_000_000_000 + i,
+                "activityName": f"Synthetic activity {i}",
+                "startTimeGMT": started.strftime("%Y-%m-%d %H:%M:%S"),
+                "activityType": {"typeId": type_id},
+                "hasPolyline": has_gps,
+            }
+        )
+    return activities
+
+
+class FakeGarmin:
+    """
+    Garmin client answering from synthetic activities, waiting latency
+    seconds (plus up to jitter seconds) on each call.
+    """
+
+    def __init__(
+        self,
+        activities: list,
+        payloads: dict = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+    ):
+        self.activities = activities
+        self.dates = [activity["startTimeGMT"][:10] for activity in activities]
+        self.payloads = payloads or load_payloads()
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def _wait(self, call: str):
+        with self.lock:
+            self.calls[call] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def login(self, tokenstore: str = None):
+        self._wait("login")
+
+    def get_activities_by_date(self, startdate: str, enddate: str, *args):
+        self._wait("get_activities_by_date")
+        first = bisect.bisect_left(self.dates, startdate)
+        last = bisect.bisect_right(self.dates, enddate)
+        # Garmin returns the newest first
+        return list(reversed(self.activities[first:last]))
+
+    def download_activity(self, activity_id, dl_fmt):
+        self._wait("download_activity")
+        payload = self.payloads[dl_fmt.name]
+        with self.lock:
+            self.bytes_sent += len(payload)
+        return payload
+
+
+class FittrackeeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    workout_path = re.compile(r"^/api/workouts/(?P<id>[^/]+)$")
+
+    def setup(self):
+        super().setup()
+        # Like production servers, don't wait for ACKs between headers and body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, data: dict = None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _count(self, endpoint: str, received: int = 0):
+        state = self.server.state
+        with state["lock"]:
+            state["requests"][f"{self.command} {endpoint}"] += 1
+            state["bytes_received"] += received
+        delay = state["latency"] + random.uniform(0, state["jitter"])
+        if delay > 0:
+            time.sleep(delay)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        state = self.server.state
+        if url.path == "/_stats":
+            with state["lock"]:
+                self._send(
+                    200,
+                    {
+                        "requests": dict(state["requests"]),
+                        "bytes_received": state["bytes_received"],
+                        "workouts": len(state["workouts"]),
+                    },
+                )
+            return
+        if url.path == "/api/config":
+            self._count(url.path)
+            self._send(200, json.loads((FILES / "get_config.json").read_text()))
+            return
+        if url.path == "/api/sports":
+            self._count(url.path)
+            self._send(200, json.loads((FILES / "get_sports.json").read_text()))
+            return
+        if url.path != "/api/workouts":
+            self._send(404, {"status": "not found"})
+            return
+        self._count(url.path)
+        params = parse_qs(url.query)
+        page = int(params.get("page", ["1"])[0])
+        per_page = int(params.get("per_page", ["5"])[0])
+        with state["lock"]:
+            workouts = list(state["workouts"].values())
+        if params.get("order", ["desc"])[0] == "desc":
+            workouts.reverse()
+        pages = max(1, -(-len(workouts) // per_page))
+        self._send(
+            200,
+            {
+                "status": "success",
+                "data": {"workouts": workouts[(page - 1) * per_page : page * per_page]},
+                "pagination": {
+                    "has_next": page < pages,
+                    "has_prev": page > 1,
+                    "page": page,
+                    "pages": pages,
+                    "total": len(workouts),
+                },
+            },
+        )
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if url.path != "/api/workouts":
+            self._send(404, {"status": "not found"})
+            return
+        self._count(url.path, received=length)
+        state = self.server.state
+        with state["lock"]:
+            state["next_id"] += 1
+            workout = deepcopy(state["template"])
+            workout["id"] = f"bench{state['next_id']}"
+            workout["workout_date"] = datetime.now().strftime(
+                "%a, %d %b %Y %H:%M:%S GMT"
+            )
+            state["workouts"][workout["id"]] = workout
+        self._send(201, {"status": "created", "data": {"workouts": [workout]}})
+
+    def do_DELETE(self):
+        match = self.workout_path.match(urlparse(self.path).path)
+        if match is None:
+            self._send(404, {"status": "not found"})
+            return
+        self._count("/api/workouts/{id}")
+        with self.server.state["lock"]:
+            deleted = self.server.state["workouts"].pop(match["id"], None)
+        self._send(204 if deleted else 404)
+
+
+def serve_fittrackee(ports, latency: float = 0.0, jitter: float = 0.0):
+    """
+    Run a fake Fittrackee API on a free port, sent back through ports.
+    """
+    template = json.loads((FILES / "post_gpx_responses.json").read_text())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FittrackeeHandler)
+    server.daemon_threads = True
+    server.state = {
+        "lock": threading.Lock(),
+        "requests": Counter(),
+        "bytes_received": 0,
+        "workouts": {},
+        "next_id": 0,
+        "template": template["data"]["workouts"][0],
+        "latency": latency,
+        "jitter": jitter,
+    }
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+class FakeFittrackee:
+    """
+    Fake Fittrackee API running in its own process, so it doesn't
+    count in the memory and CPU time of the benchmarked sync.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.process = None
+        self.url = None
+
+    def __enter__(self):
+        ports = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=serve_fittrackee,
+            args=(ports, self.latency, self.jitter),
+            daemon=True,
+        )
+        self.process.start()
+        self.url = f"http://127.0.0.1:{ports.get(timeout=10)}"
+        return self
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        self.process.join()
+
+    def stats(self) -> dict:
+        from urllib.request import urlopen
+
+        with urlopen(f"{self.url}/_stats") as response:
+            return json.loads(response.read())
+
+
+def date_range(years: int) -> tuple:
+    end = datetime.now().replace(microsecond=0) - timedelta(days=1)
+    return end - timedelta(days=365 * years), end
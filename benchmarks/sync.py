@@ -0,0 +1,194 @@
+"""
+End-to-end benchmark of `garmin2fittrackee sync` against local fakes.
+
+    python -m benchmarks.sync --activities 10000 --garmin-latency 0.02
+
+Prints throughput, peak RSS and request counts, and appends them as one
+JSON line to --output to compare runs over time.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+from benchmarks.fakes import (
+    FakeFittrackee,
+    FakeGarmin,
+    date_range,
+    load_payloads,
+    synthetic_activities,
+)
+
+
+def write_config(config_path: Path, fittrackee_url: str):
+    """
+    Configuration of setup garmin and setup fittrackee, without logins.
+    config.yml and the database are created by setup config-tool.
+    """
+    (config_path / "garmintoken").mkdir(parents=True)
+    fittrackee = {
+        "fittrackee": {
+            "host": fittrackee_url,
+            "client_id": "benchmark",
+            "client_secret": "benchmark",
+        },
+        "tokens": {
+            "access_token": "benchmark",
+            "refresh_token": "benchmark",
+            "token_type": "Bearer",
+            "expires_in": 10**9,
+            "expires_at": time.time() + 10**9,
+        },
+    }
+    (config_path / "fittrackee.yml").write_text(yaml.dump(fittrackee))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--activities", type=int, default=10_000)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--garmin-latency", type=float, default=0.0)
+    parser.add_argument("--fittrackee-latency", type=float, default=0.0)
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="Random latency added, in seconds"
+    )
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--download-workers", type=int, default=2)
+    parser.add_argument("--upload-workers", type=int, default=2)
+    parser.add_argument(
+        "--rate-limit", type=float, default=0, help="0 is unlimited, like Fittrackee"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", type=Path, help="Append results to this file")
+    return parser.parse_args(argv)
+
+
+def run(args) -> dict:
+    start, end = date_range(args.years)
+    activities = synthetic_activities(args.activities, start, end)
+    garmin = FakeGarmin(
+        activities,
+        payloads=load_payloads(),
+        latency=args.garmin_latency,
+        jitter=args.jitter,
+    )
+
+    with FakeFittrackee(latency=args.fittrackee_latency, jitter=args.jitter) as api:
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = Path(tmp)
+            write_config(config_path, api.url)
+            os.environ["CONFIG_PATH"] = str(config_path)
+            os.environ["TMP_PATH"] = str(config_path)
+            os.environ["CACHE_PATH"] = str(config_path / "cache")
+            # The fake API is served over plain http
+            os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
+
+            import garminconnect
+
+            class Garmin(FakeGarmin):
+                ActivityDownloadFormat = garminconnect.Garmin.ActivityDownloadFormat
+
+                def __new__(cls, *args, **kwargs):
+                    return garmin
+
+            garminconnect.Garmin = Garmin
+
+            from garmin_to_fittrackee import metrics
+            from garmin_to_fittrackee.logs import configure_logging
+            from garmin_to_fittrackee.main import app
+
+            configure_logging(level=args.log_level, force=True)
+            app(
+                [
+                    "setup",
+                    "config-tool",
+                    "--database-path",
+                    str(config_path),
+                    "--verbose-level",
+                    args.log_level,
+                ],
+                standalone_mode=False,
+            )
+            started = time.perf_counter()
+            app(
+                [
+                    "sync",
+                    "--no-interactive",
+                    "--start-year",
+                    str(start.year),
+                    "--engine",
+                    args.engine,
+                    "--download-workers",
+                    str(args.download_workers),
+                    "--upload-workers",
+                    str(args.upload_workers),
+                    "--rate-limit",
+                    str(args.rate_limit),
+                ],
+                standalone_mode=False,
+            )
+            elapsed = time.perf_counter() - started
+        stats = api.stats()
+
+    uploaded = metrics.ACTIVITIES.get(result="uploaded")
+    return {
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "options": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+        },
+        "seconds": round(elapsed, 3),
+        "uploaded": uploaded,
+        "failed": metrics.ACTIVITIES.get(result="failed"),
+        "throughput": round(uploaded / elapsed, 2) if elapsed else None,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+        ),
+        "garmin_calls": dict(garmin.calls),
+        "garmin_bytes": garmin.bytes_sent,
+        "fittrackee_requests": stats["requests"],
+        "fittrackee_bytes": stats["bytes_received"],
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with args.output.open("a", encoding="utf-8") as file:
+            file.write(json.dumps(results) + "\n")
+    if results["uploaded"] != args.activities:
+        print(
+            f"Only {results['uploaded']} of {args.activities} activities uploaded",
+            file=sys.stderr,
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import time
+from collections import deque
+from pathlib import Path
+from typing import NamedTuple
+
+import yaml
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+
+class Account(NamedTuple):
+    name: str
+    config_path: str
+    start_year: int = None
+
+
+def load_accounts(path: Path) -> list:
+    """
+    Read the accounts of sync-all, a YAML file like:
+
+        accounts:
+          - name: alice
+            config_path: /srv/garmin-to-fittrackee/alice
+            start_year: 2015
+    """
+    with Path(path).open(encoding="utf-8") as file:
+        data = yaml.safe_load(file) or {}
+    accounts = []
+    for entry in data.get("accounts") or []:
+        if not isinstance(entry, dict) or not entry.get("config_path"):
+            raise ValueError(f"Account without config_path in {path}: {entry}")
+        name = str(entry.get("name") or Path(entry["config_path"]).name)
+        if name in [account.name for account in accounts]:
+            raise ValueError(f"Account {name} is defined twice in {path}")
+        accounts.append(
+            Account(
+                name=name,
+                config_path=str(entry["config_path"]),
+                start_year=entry.get("start_year"),
+            )
+        )
+    return accounts
+
+
+class AccountRouter:
+    """
+    Share one pipeline between the synchronizers of several accounts.
+    Jobs are taken from each account in turn, so no account waits for
+    another one to be done, and transfers and results are sent back to
+    the synchronizer of the activity. With a deadline (time.monotonic()),
+    no job is started after it and remaining accounts resume next run.
+    """
+
+    def __init__(self, synchronizers: dict, deadline: float = None):
+        self.synchronizers = synchronizers
+        self.deadline = deadline
+        # Account name by job activity object: accounts may share
+        # activity IDs, the activity dict of a job is its own
+        self.owners = {}
+
+    def _owner(self, activity: dict):
+        return self.synchronizers[self.owners[id(activity)]]
+
+    def jobs(self, streams: dict):
+        active = deque(streams.items())
+        while active:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                for name, _ in active:
+                    log.warning(f"Time budget spent, {name} will resume next run")
+                    self.synchronizers[name].incomplete = True
+                return
+            name, stream = active.popleft()
+            try:
+                job = next(stream)
+            except StopIteration:
+                continue
+            except Exception as e:
+                log.error(f"Failed to list activities of {name}: {e}")
+                self.synchronizers[name].incomplete = True
+                continue
+            self.owners[id(job.activity)] = name
+            active.append((name, stream))
+            yield job
+
+    def download(self, activity: dict, fileformat: str):
+        return self._owner(activity).download(activity, fileformat)
+
+    def upload(self, activity: dict, file):
+        return self._owner(activity).upload(activity, file)
+
+    def on_result(self, job):
+        self._owner(job.activity).on_result(job)
+        del self.owners[id(job.activity)]
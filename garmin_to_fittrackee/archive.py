@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Activity metadata kept with the files, enough to upload them again
+ACTIVITY_FIELDS = [
+    "activityId",
+    "activityName",
+    "activityType",
+    "startTimeGMT",
+    "hasPolyline",
+]
+
+
+class ArchivedFile(NamedTuple):
+    digest: str
+    codec: str
+    size: int
+    stored: int
+
+
+def default_codec() -> str:
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    return data
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError(
+                "Archive compressed with zstd, install it with "
+                'pip install "garmin-to-fittrackee[archive]"'
+            )
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+class ActivityArchive:
+    """
+    Activity files downloaded from Garmin, stored once by SHA-256 of their
+    content under path/objects and compressed with zstd (zlib when
+    zstandard isn't installed). The archive table of the tool database
+    maps a Garmin ID and a download format to a stored file.
+
+    store() and read() can be called from worker threads. The index is
+    kept in memory and new rows are only written by flush(), from the
+    thread owning the database.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        entries: dict = None,
+        codec: str = None,
+        batch_size: int = 50,
+        interval: float = 5.0,
+    ):
+        self.path = Path(path)
+        self.codec = codec or default_codec()
+        self.entries = entries or {}
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = []
+        self.pending_activities = []
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def _create(db: sqlite3.Connection):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS archive("
+            "garmin_id INTEGER NOT NULL, format TEXT NOT NULL, "
+            "digest TEXT NOT NULL, codec TEXT NOT NULL, "
+            "size INTEGER NOT NULL, stored INTEGER NOT NULL, "
+            "PRIMARY KEY (garmin_id, format))"
+        )
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS archived_activities("
+            "garmin_id INTEGER PRIMARY KEY, activity TEXT NOT NULL)"
+        )
+
+    @classmethod
+    def load(cls, path: str, db: sqlite3.Connection, **kwargs):
+        cls._create(db)
+        rows = db.execute(
+            "SELECT garmin_id, format, digest, codec, size, stored FROM archive"
+        )
+        entries = {
+            (garmin_id, fileformat): ArchivedFile(*entry)
+            for garmin_id, fileformat, *entry in rows
+        }
+        archive = cls(path, entries=entries, **kwargs)
+        log.debug(f"{len(archive)} activity files in archive {path}")
+        return archive
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key) -> bool:
+        garmin_id, fileformat = key
+        return (int(garmin_id), fileformat) in self.entries
+
+    def _object_path(self, entry: ArchivedFile) -> Path:
+        suffix = {"zstd": ".zst", "zlib": ".zz"}.get(entry.codec, "")
+        return self.path / "objects" / entry.digest[:2] / f"{entry.digest}{suffix}"
+
+    def formats(self, garmin_id) -> list:
+        return [
+            fileformat
+            for (archived_id, fileformat) in list(self.entries)
+            if archived_id == int(garmin_id)
+        ]
+
+    def garmin_ids(self) -> list:
+        return sorted({garmin_id for garmin_id, _ in self.entries})
+
+    def activities(self, db: sqlite3.Connection) -> list:
+        """
+        Metadata of the archived activities, oldest first.
+        """
+        self._create(db)
+        rows = db.execute("SELECT activity FROM archived_activities")
+        activities = [json.loads(activity) for (activity,) in rows]
+        return sorted(activities, key=lambda activity: activity.get("startTimeGMT", ""))
+
+    def store(
+        self, garmin_id, fileformat: str, data: bytes, activity: dict = None
+    ) -> ArchivedFile:
+        """
+        Archive data, written only if no file has the same content yet,
+        with the metadata of its activity.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        compressed = compress(data, self.codec)
+        codec = self.codec
+        if len(compressed) >= len(data):
+            # Already compressed, like the zip of original files
+            compressed, codec = data, "raw"
+        entry = ArchivedFile(
+            digest=digest, codec=codec, size=len(data), stored=len(compressed)
+        )
+        path = self._object_path(entry)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Written aside then renamed, a crash never leaves half a file
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(compressed)
+            os.replace(tmp, path)
+        else:
+            log.debug(f"Activity {garmin_id} ({fileformat}) already archived")
+        with self.lock:
+            self.entries[(int(garmin_id), fileformat)] = entry
+            self.pending.append((int(garmin_id), fileformat, *entry))
+            if activity is not None:
+                fields = {
+                    key: activity[key] for key in ACTIVITY_FIELDS if key in activity
+                }
+                self.pending_activities.append((int(garmin_id), json.dumps(fields)))
+        return entry
+
+    def read(self, garmin_id, fileformat: str) -> bytes:
+        """
+        Return the archived data, or None when it isn't in the archive
+        or the stored file is missing or corrupted.
+        """
+        entry = self.entries.get((int(garmin_id), fileformat))
+        if entry is None:
+            return None
+        try:
+            data = decompress(self._object_path(entry).read_bytes(), entry.codec)
+        except (OSError, zlib.error, RuntimeError) as e:
+            log.warning(f"Archived activity {garmin_id} ({fileformat}) unreadable: {e}")
+            return None
+        if hashlib.sha256(data).hexdigest() != entry.digest:
+            log.warning(f"Archived activity {garmin_id} ({fileformat}) is corrupted")
+            return None
+        return data
+
+    def commit(self, db: sqlite3.Connection):
+        """
+        Flush new rows every batch_size rows or every interval seconds.
+        """
+        if (
+            len(self.pending) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.interval
+        ):
+            self.flush(db)
+
+    def flush(self, db: sqlite3.Connection):
+        self.last_flush = time.monotonic()
+        with self.lock:
+            rows, self.pending = self.pending, []
+            activities, self.pending_activities = self.pending_activities, []
+        if not rows and not activities:
+            return
+        log.debug(f"Indexing {len(rows)} archived activity files")
+        self._create(db)
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO archive "
+                "(garmin_id, format, digest, codec, size, stored) "
+                "VALUES(?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO archived_activities (garmin_id, activity) "
+                "VALUES(?, ?)",
+                activities,
+            )
@@ -0,0 +1,180 @@
+"""
+Asynchronous Fittrackee client used by `sync --engine async`.
+Needs httpx (the async extra), which is imported with this module.
+"""
+
+import asyncio
+import json
+
+import httpx
+
+from garmin_to_fittrackee.fittrackee import Fittrackee
+from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.metrics import REQUEST_SECONDS, RETRIES, endpoint
+from garmin_to_fittrackee.retry import (
+    IDEMPOTENT_METHODS,
+    CircuitBreaker,
+    RetryPolicy,
+    TokenBucket,
+)
+from garmin_to_fittrackee.workout import Workout
+
+log = Log(__name__)
+
+
+class AsyncFittrackee:
+    """
+    Async counterpart of Fittrackee for upload, list, delete and last
+    workout. Authentication stays handled by the Fittrackee instance.
+    """
+
+    def __init__(
+        self,
+        fittrackee: Fittrackee,
+        max_connections: int = 100,
+        policy: RetryPolicy = None,
+        bucket: TokenBucket = None,
+        breaker: CircuitBreaker = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.fittrackee = fittrackee
+        self.api_url = fittrackee.api_url
+        self.policy = policy or fittrackee.requester.policy
+        self.bucket = bucket or fittrackee.requester.bucket
+        self.breaker = breaker or fittrackee.requester.breaker
+        self.retries = 0
+        # One token refresh at a time, the others wait for its result
+        self.token_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            transport=transport,
+            timeout=httpx.Timeout(60.0),
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _headers(self, force_refresh: bool = False):
+        token = self.fittrackee.access_token(force_refresh=force_refresh)
+        return {"Authorization": f"Bearer {token}"}
+
+    async def _auth_headers(self, force_refresh: bool = False):
+        # access_token() may refresh the token with a blocking request
+        async with self.token_lock:
+            return await asyncio.to_thread(self._headers, force_refresh)
+
+    async def _request(self, method: str, url: str, **kwargs):
+        attempt = 0
+        refreshed = False
+        while True:
+            if not self.breaker.allow():
+                log.error(f"Too many failures, not sending {method} {url}")
+                return
+            while (wait := self.bucket.reserve()) > 0:
+                await asyncio.sleep(wait)
+            response = None
+            headers = await self._auth_headers()
+            try:
+                with REQUEST_SECONDS.time(
+                    service="fittrackee", method=method, endpoint=endpoint(url)
+                ):
+                    response = await self.client.request(
+                        method, url, headers=headers, **kwargs
+                    )
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                retry = method in IDEMPOTENT_METHODS or isinstance(
+                    e, httpx.ConnectError
+                )
+                if not retry or attempt >= self.policy.retries:
+                    log.error(f"{method} {url} failed: {e}")
+                    return
+            else:
+                if response.status_code == 401 and not refreshed:
+                    await self._auth_headers(force_refresh=True)
+                    refreshed = True
+                    continue
+                if response.status_code < 500:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+            delay = self.policy.delay(attempt, response)
+            if response is not None:
+                if response.status_code == 429:
+                    self.bucket.pause(delay)
+                if attempt >= self.policy.retries or not self.policy.should_retry(
+                    method, response=response
+                ):
+                    return response
+            log.warning(f"{method} {url} failed, retry in {delay:.1f}s")
+            self.retries += 1
+            RETRIES.inc(service="fittrackee")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _workout(data: dict) -> Workout:
+        workout = object.__new__(Workout)
+        workout.__dict__ = data
+        workout.set_present_in_fittrackee()
+        return workout
+
+    @staticmethod
+    def _failed(response, action: str) -> bool:
+        if response is None:
+            return True
+        if response.is_error:
+            log.error(
+                f"Failed to {action}."
+                f"Return code {response.status_code}. Error {response.text}"
+            )
+            return True
+        return False
+
+    async def upload_workout(
+        self, data: bytes, filename: str, sport_id: int, name: str = ""
+    ):
+        log.debug(f"posting {filename} to FitTrackee")
+        payload = {"sport_id": sport_id, "notes": "", "title": name}
+        r = await self._request(
+            "POST",
+            f"{self.api_url}/workouts",
+            files={"file": (filename, data)},
+            data={"data": json.dumps(payload)},
+        )
+        if self._failed(r, f"post {filename}"):
+            return
+        workout = self._workout(r.json()["data"]["workouts"][0])
+        workout.set_present_in_garmin()
+        log.info(f"Activity added on Fittrackee with id {workout.id}")
+        return workout
+
+    async def get_workouts(self, page: int = 1, per_page: int = 50, order=None):
+        params = {"per_page": per_page, "page": page}
+        if order:
+            params["order"] = order
+        r = await self._request("GET", f"{self.api_url}/workouts", params=params)
+        if self._failed(r, "get workouts"):
+            return
+        return [self._workout(workout) for workout in r.json()["data"]["workouts"]]
+
+    async def get_last_workout(self):
+        workouts = await self.get_workouts(per_page=1, order="desc")
+        if workouts:
+            return workouts[0]
+
+    async def delete_workout(self, workout_id: str) -> bool:
+        r = await self._request("DELETE", f"{self.api_url}/workouts/{workout_id}")
+        if self._failed(r, f"delete workout {workout_id}"):
+            return False
+        log.warning(f"Workout {workout_id} deleted")
+        return True
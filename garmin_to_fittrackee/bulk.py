@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+
+class Progress:
+    """
+    Log throughput and ETA of a long operation every interval seconds.
+    """
+
+    def __init__(self, total: int, label: str = "workouts", interval: float = 5.0):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def throughput(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self) -> float:
+        throughput = self.throughput()
+        if not throughput:
+            return None
+        return (self.total - self.done - self.failed) / throughput
+
+    def update(self, success: bool = True):
+        if success:
+            self.done += 1
+        else:
+            self.failed += 1
+        if time.monotonic() - self.reported >= self.interval:
+            self.report()
+
+    def report(self):
+        self.reported = time.monotonic()
+        eta = self.eta()
+        eta = f"{eta:.0f}s" if eta is not None else "unknown"
+        log.info(
+            f"{self.done}/{self.total} {self.label} processed, {self.failed} failed "
+            f"({self.throughput():.1f}/s, ETA {eta})"
+        )
+
+
+class BulkDeleter:
+    """
+    Delete workouts with a bounded pool of workers.
+    delete(workout_id) returns True when the workout is deleted.
+    on_deleted(workout_id) is called in the caller thread.
+    """
+
+    def __init__(self, delete, workers: int = 8, interval: float = 5.0):
+        if workers < 1:
+            raise ValueError(f"Bulk delete needs at least one worker, not {workers}")
+        self.delete = delete
+        self.workers = workers
+        self.interval = interval
+
+    def run(self, workout_ids: list, on_deleted=None) -> Progress:
+        progress = Progress(total=len(workout_ids), interval=self.interval)
+        ids = iter(workout_ids)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            while True:
+                for workout_id in ids:
+                    futures[executor.submit(self.delete, workout_id)] = workout_id
+                    if len(futures) >= 2 * self.workers:
+                        break
+                if not futures:
+                    break
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    workout_id = futures.pop(future)
+                    try:
+                        deleted = future.result()
+                    except Exception as e:
+                        log.error(f"Failed to delete workout {workout_id}: {e}")
+                        deleted = False
+                    if deleted and on_deleted is not None:
+                        on_deleted(workout_id)
+                    progress.update(success=bool(deleted))
+        progress.report()
+        return progress
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+
+class MetadataCache:
+    """
+    On-disk cache of Fittrackee instance metadata (/api/config,
+    /api/sports), shared by every command and account using the same
+    path. A response is used for ttl seconds, then revalidated with
+    If-None-Match when the instance sent an ETag. When the instance
+    can't be reached, the last response is used even if expired.
+    """
+
+    def __init__(self, path: str, ttl: float = 6 * 3600):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+    def _file(self, url: str) -> Path:
+        return self.path / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def _read(self, url: str) -> dict:
+        try:
+            with self._file(url).open(encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def _write(self, entry: dict):
+        self.path.mkdir(parents=True, exist_ok=True)
+        # Written aside then renamed, other processes never read half a file
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(entry, file)
+        os.replace(tmp, self._file(entry["url"]))
+
+    def get(self, url: str, fetch, max_age: float = None) -> dict:
+        """
+        JSON body of url. fetch(headers) sends the request and returns
+        the response; a 304 keeps the cached body. max_age (ttl by
+        default) is 0 to always revalidate.
+        """
+        if max_age is None:
+            max_age = self.ttl
+        with self.lock:
+            entry = self._read(url)
+            if entry is not None and time.time() - entry["fetched_at"] < max_age:
+                log.debug(f"{url} from cache")
+                return entry["body"]
+            headers = {}
+            if entry is not None and entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            try:
+                r = fetch(headers)
+                if r.status_code == 304 and entry is not None:
+                    log.debug(f"{url} not modified")
+                    entry["fetched_at"] = time.time()
+                    self._write(entry)
+                    return entry["body"]
+                r.raise_for_status()
+                body = r.json()
+            except (requests.RequestException, ValueError) as e:
+                if entry is None:
+                    raise
+                log.warning(f"Can't refresh {url} ({e}), using the cached response")
+                return entry["body"]
+            self._write(
+                {
+                    "url": url,
+                    "etag": r.headers.get("ETag"),
+                    "fetched_at": time.time(),
+                    "body": body,
+                }
+            )
+            return body
+
+    def clear(self):
+        for file in self.path.glob("*.json"):
+            file.unlink(missing_ok=True)
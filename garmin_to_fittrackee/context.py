@@ -0,0 +1,69 @@
+import os
+from functools import cached_property
+from pathlib import Path
+
+
+def default_config_path():
+    home = str(Path.home())
+    return f"{home}/.config/garmin-to-fittrackee"
+
+
+def default_cache_path():
+    home = str(Path.home())
+    return f"{home}/.cache/garmin-to-fittrackee"
+
+
+def default_database_path():
+    home = str(Path.home())
+    return f"{home}/.local/share/garmin_to_fittrackee"
+
+
+class AppContext:
+    """
+    Paths, configuration and database of the tool.
+    Nothing is read or opened before it's used, so commands which don't
+    need them (and --help) start fast.
+    """
+
+    def __init__(
+        self,
+        config_path: str = None,
+        database_path: str = None,
+        tmp_path: str = None,
+    ):
+        self.config_path = config_path or os.environ.get(
+            "CONFIG_PATH", default_config_path()
+        )
+        self.database_path = database_path or os.environ.get(
+            "DATABASE_PATH", default_database_path()
+        )
+        self.tmp_path = tmp_path or os.environ.get("TMP_PATH", "/tmp")
+        self.cache_path = os.environ.get("CACHE_PATH", default_cache_path())
+        self.metadata_ttl = float(os.environ.get("METADATA_TTL", 6 * 3600))
+        self.spool_max_size = int(os.environ.get("SPOOL_MAX_SIZE", 8 * 1024 * 1024))
+
+    @property
+    def config_file(self) -> Path:
+        return Path(f"{self.config_path}/config.yml")
+
+    def ensure_config_path(self):
+        Path(self.config_path).mkdir(parents=True, exist_ok=True)
+
+    @cached_property
+    def config(self) -> dict:
+        import yaml
+
+        with self.config_file.open() as file:
+            return yaml.safe_load(file) or {}
+
+    @cached_property
+    def db(self):
+        from garmin_to_fittrackee.database import connect
+
+        return connect(f"{self.config['sqlite']['path']}/db.sqlite3")
+
+    @cached_property
+    def metadata_cache(self):
+        from garmin_to_fittrackee.cache import MetadataCache
+
+        return MetadataCache(self.cache_path, ttl=self.metadata_ttl)
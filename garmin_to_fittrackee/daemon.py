@@ -0,0 +1,80 @@
+import signal
+import threading
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+
+class PollScheduler:
+    """
+    Adaptive polling interval: back to min_interval when new activities
+    are found, multiplied by factor after each idle poll, up to
+    max_interval. Errors back off the same way.
+    """
+
+    def __init__(
+        self, min_interval: float = 60, max_interval: float = 3600, factor: float = 2
+    ):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError(
+                f"Polling interval must be between {min_interval}s and "
+                f"{max_interval}s, with 0 < min <= max"
+            )
+        if factor < 1:
+            raise ValueError(f"Backoff factor must be at least 1, not {factor}")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.factor = factor
+        self.interval = min_interval
+
+    def next(self, found: int) -> float:
+        if found:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.factor, self.max_interval)
+        return self.interval
+
+
+class Daemon:
+    """
+    Call poll() until SIGTERM or SIGINT. poll() returns the number of new
+    activities, which sets the wait before the next call. A signal
+    received during a poll lets it finish, a second one interrupts it.
+    """
+
+    def __init__(self, poll, scheduler: PollScheduler = None):
+        self.poll = poll
+        self.scheduler = scheduler or PollScheduler()
+        self.stopping = threading.Event()
+        self.polls = 0
+
+    def stop(self, signum=None, frame=None):
+        if self.stopping.is_set():
+            raise KeyboardInterrupt
+        name = signal.Signals(signum).name if signum else "stop"
+        log.warning(f"{name} received, stopping after the current poll")
+        self.stopping.set()
+
+    def run(self):
+        previous = {
+            signum: signal.signal(signum, self.stop)
+            for signum in [signal.SIGTERM, signal.SIGINT]
+        }
+        try:
+            while not self.stopping.is_set():
+                self.polls += 1
+                try:
+                    found = self.poll()
+                except Exception as e:
+                    log.error(f"Poll failed: {e}")
+                    found = 0
+                interval = self.scheduler.next(found)
+                if self.stopping.is_set():
+                    break
+                log.info(f"{found} new activities, next poll in {interval:.0f}s")
+                self.stopping.wait(interval)
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        log.info("Daemon stopped")
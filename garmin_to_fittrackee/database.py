@@ -0,0 +1,443 @@
+import json
+import sqlite3
+import threading
+import time
+
+from garmin_to_fittrackee.archive import ACTIVITY_FIELDS
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """
+    Open the tool database in WAL mode. With WAL, synchronous=NORMAL only
+    syncs at checkpoints and stays safe against corruption.
+    """
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class ActivityIndex:
+    """
+    In-memory index of Garmin activities already sent to Fittrackee.
+    Loaded once from the activities_ids table, then kept up to date
+    with add() after each insert.
+    """
+
+    def __init__(self, garmin_ids=()):
+        self.garmin_ids = {int(garmin_id) for garmin_id in garmin_ids}
+
+    @classmethod
+    def load(cls, db: sqlite3.Connection):
+        cur = db.cursor()
+        rows = cur.execute("SELECT garmin_id FROM activities_ids")
+        index = cls(garmin_id for (garmin_id,) in rows if garmin_id is not None)
+        log.debug(f"{len(index)} Garmin activities already synchronised")
+        return index
+
+    def __contains__(self, garmin_id) -> bool:
+        return int(garmin_id) in self.garmin_ids
+
+    def __len__(self) -> int:
+        return len(self.garmin_ids)
+
+    def add(self, garmin_id):
+        self.garmin_ids.add(int(garmin_id))
+
+    def discard(self, garmin_id):
+        self.garmin_ids.discard(int(garmin_id))
+
+    def filter(self, activities: list) -> list:
+        """
+        Return activities of a page which are not synchronised yet.
+        """
+        return [
+            activity
+            for activity in activities
+            if int(activity["activityId"]) not in self.garmin_ids
+        ]
+
+
+class MappingWriter:
+    """
+    Write-behind buffer for the activities_ids table.
+    Rows are inserted or removed with one transaction every batch_size rows or every
+    interval seconds, and on close(). Use it as a context manager so the
+    buffer is flushed on exit and on KeyboardInterrupt.
+    """
+
+    def __init__(self, db: sqlite3.Connection, batch_size: int = 50, interval=5.0):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows = []
+        self.removed = []
+        self.last_flush = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, fittrackee_id: str, garmin_id: int):
+        self.rows.append((fittrackee_id, garmin_id))
+        if (
+            len(self.rows) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.interval
+        ):
+            self.flush()
+
+    def remove(self, fittrackee_id: str):
+        self.removed.append((fittrackee_id,))
+        if (
+            len(self.removed) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows and not self.removed:
+            return
+        rows, self.rows = self.rows, []
+        removed, self.removed = self.removed, []
+        log.debug(
+            f"Writing {len(rows)} workout and activity matches, removing {len(removed)}"
+        )
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO activities_ids (fittrackee_id, garmin_id) "
+                "VALUES(?, ?)",
+                rows,
+            )
+            self.db.executemany(
+                "DELETE FROM activities_ids WHERE fittrackee_id = ?", removed
+            )
+
+    def close(self):
+        self.flush()
+
+
+class SyncCursor:
+    """
+    Start time (GMT) and ID of the Garmin activity from which the next
+    sync lists activities. It moves to the newest activity listed,
+    failures are tried again from the WorkQueue.
+    """
+
+    def __init__(self, start_time: str = None, garmin_id: int = None):
+        self.start_time = start_time
+        self.garmin_id = garmin_id
+        self.newest = None
+
+    @staticmethod
+    def _create(db: sqlite3.Connection):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sync_cursor("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "start_time TEXT NOT NULL, garmin_id INTEGER)"
+        )
+
+    @classmethod
+    def load(cls, db: sqlite3.Connection):
+        cls._create(db)
+        row = db.execute(
+            "SELECT start_time, garmin_id FROM sync_cursor WHERE id = 0"
+        ).fetchone()
+        return cls(*row) if row else cls()
+
+    @staticmethod
+    def _position(activity: dict):
+        if not activity.get("startTimeGMT"):
+            return None
+        return activity["startTimeGMT"], int(activity["activityId"])
+
+    def begin(self):
+        """
+        Forget the activities of the previous run.
+        """
+        self.newest = None
+
+    def seen(self, activity: dict):
+        position = self._position(activity)
+        if position and (self.newest is None or position > self.newest):
+            self.newest = position
+
+    def save(self, db: sqlite3.Connection):
+        position = self.newest
+        if position is None:
+            return
+        self.start_time, self.garmin_id = position
+        log.debug(f"Next sync starts at {self.start_time} ({self.garmin_id})")
+        self._create(db)
+        with db:
+            db.execute(
+                "INSERT OR REPLACE INTO sync_cursor (id, start_time, garmin_id) "
+                "VALUES(0, ?, ?)",
+                position,
+            )
+
+    @classmethod
+    def clear(cls, db: sqlite3.Connection):
+        cls._create(db)
+        with db:
+            db.execute("DELETE FROM sync_cursor")
+
+
+class ReplayCheckpoint:
+    """
+    Garmin activities already sent again by replay, so an interrupted
+    replay carries on where it stopped. Each replayed workout replaces
+    the activity match in activities_ids in the same transaction.
+    Written every batch_size workouts or every interval seconds.
+    """
+
+    def __init__(
+        self,
+        db: sqlite3.Connection,
+        done=(),
+        batch_size: int = 50,
+        interval: float = 5.0,
+    ):
+        self.db = db
+        self.done = {int(garmin_id) for garmin_id in done}
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def _create(db: sqlite3.Connection):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS replay_checkpoint("
+            "garmin_id INTEGER PRIMARY KEY, fittrackee_id VARCHAR(255))"
+        )
+
+    @classmethod
+    def load(cls, db: sqlite3.Connection, **kwargs):
+        cls._create(db)
+        rows = db.execute("SELECT garmin_id FROM replay_checkpoint")
+        checkpoint = cls(db, done=(garmin_id for (garmin_id,) in rows), **kwargs)
+        if checkpoint.done:
+            log.info(f"Resume replay, {len(checkpoint.done)} activities already sent")
+        return checkpoint
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def __contains__(self, garmin_id) -> bool:
+        return int(garmin_id) in self.done
+
+    def add(self, garmin_id: int, fittrackee_id: str):
+        self.done.add(int(garmin_id))
+        self.rows.append((int(garmin_id), fittrackee_id))
+        if (
+            len(self.rows) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        log.debug(f"Checkpoint of {len(rows)} replayed activities")
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM activities_ids WHERE garmin_id = ?",
+                [(garmin_id,) for garmin_id, _ in rows],
+            )
+            self.db.executemany(
+                "INSERT INTO activities_ids (fittrackee_id, garmin_id) VALUES(?, ?)",
+                [(fittrackee_id, garmin_id) for garmin_id, fittrackee_id in rows],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO replay_checkpoint (garmin_id, fittrackee_id) "
+                "VALUES(?, ?)",
+                rows,
+            )
+
+    def clear(self):
+        self.rows = []
+        self.done = set()
+        self._create(self.db)
+        with self.db:
+            self.db.execute("DELETE FROM replay_checkpoint")
+
+
+class WorkQueue:
+    """
+    Persistent queue of the Garmin activities to synchronise. Listed
+    activities are planned as pending, then end uploaded, or back to
+    pending (download failed) or downloaded (upload failed) to be tried
+    again by the next sync, until max_attempts. They are then failed,
+    and only tried again after retry_failed().
+    The downloaded state keeps no file: the next attempt downloads the
+    activity again, unless the archive has it.
+    plan() only keeps the change in memory and may be called from the
+    listing thread; the database is written by uploaded(), failed()
+    and flush(), every batch_size changes or every interval seconds,
+    from the thread owning the connection.
+    """
+
+    STATES = ["pending", "downloaded", "uploaded", "failed"]
+    RETRIED_STATES = ["pending", "downloaded"]
+
+    def __init__(
+        self,
+        db: sqlite3.Connection,
+        states: dict = None,
+        max_attempts: int = 3,
+        batch_size: int = 50,
+        interval: float = 5.0,
+    ):
+        if max_attempts < 1:
+            raise ValueError(f"Max attempts must be at least 1, not {max_attempts}")
+        self.db = db
+        # (state, attempts) by Garmin ID
+        self.states = states or {}
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.interval = interval
+        self.rows = {}
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+
+    @staticmethod
+    def _create(db: sqlite3.Connection):
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS work_queue("
+            "garmin_id INTEGER PRIMARY KEY, activity TEXT NOT NULL, "
+            "state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "updated TEXT NOT NULL)"
+        )
+
+    @classmethod
+    def load(cls, db: sqlite3.Connection, **kwargs):
+        cls._create(db)
+        rows = db.execute("SELECT garmin_id, state, attempts FROM work_queue")
+        queue = cls(
+            db,
+            states={
+                garmin_id: (state, attempts) for garmin_id, state, attempts in rows
+            },
+            **kwargs,
+        )
+        log.debug(f"Work queue: {queue.counts()}")
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def __contains__(self, garmin_id) -> bool:
+        return int(garmin_id) in self.states
+
+    def state(self, garmin_id) -> str:
+        return self.states.get(int(garmin_id), (None, 0))[0]
+
+    def counts(self) -> dict:
+        counts = dict.fromkeys(self.STATES, 0)
+        for state, _ in self.states.values():
+            counts[state] += 1
+        return counts
+
+    def retried(self) -> list:
+        """
+        Activities left pending or downloaded by previous runs, oldest first.
+        """
+        self.flush()
+        placeholders = ", ".join("?" for _ in self.RETRIED_STATES)
+        rows = self.db.execute(
+            f"SELECT activity FROM work_queue WHERE state IN ({placeholders}) "
+            "ORDER BY garmin_id",
+            self.RETRIED_STATES,
+        )
+        return [json.loads(activity) for (activity,) in rows]
+
+    def _set(self, activity: dict, state: str, attempts: int):
+        garmin_id = int(activity["activityId"])
+        fields = {key: activity[key] for key in ACTIVITY_FIELDS if key in activity}
+        row = (
+            garmin_id,
+            json.dumps(fields),
+            state,
+            attempts,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        )
+        with self.lock:
+            self.states[garmin_id] = (state, attempts)
+            self.rows[garmin_id] = row
+
+    def commit(self):
+        if (
+            len(self.rows) >= self.batch_size
+            or time.monotonic() - self.last_flush >= self.interval
+        ):
+            self.flush()
+
+    def plan(self, activity: dict):
+        if activity["activityId"] not in self:
+            self._set(activity, "pending", 0)
+
+    def uploaded(self, activity: dict):
+        _, attempts = self.states.get(int(activity["activityId"]), (None, 0))
+        self._set(activity, "uploaded", attempts + 1)
+        self.commit()
+
+    def failed(self, activity: dict, downloaded: bool = False):
+        _, attempts = self.states.get(int(activity["activityId"]), (None, 0))
+        attempts += 1
+        if attempts >= self.max_attempts:
+            state = "failed"
+        else:
+            state = "downloaded" if downloaded else "pending"
+        self._set(activity, state, attempts)
+        self.commit()
+        return state
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        with self.lock:
+            rows, self.rows = list(self.rows.values()), {}
+        if not rows:
+            return
+        log.debug(f"Writing {len(rows)} work queue changes")
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO work_queue "
+                "(garmin_id, activity, state, attempts, updated) "
+                "VALUES(?, ?, ?, ?, ?) ON CONFLICT(garmin_id) DO UPDATE SET "
+                "state = excluded.state, attempts = excluded.attempts, "
+                "updated = excluded.updated",
+                rows,
+            )
+
+    @classmethod
+    def retry_failed(cls, db: sqlite3.Connection) -> int:
+        """
+        Put failed activities back in the queue, with no attempt.
+        """
+        cls._create(db)
+        with db:
+            cur = db.execute(
+                "UPDATE work_queue SET state = 'pending', attempts = 0 "
+                "WHERE state = 'failed'"
+            )
+        return cur.rowcount
+
+    @classmethod
+    def clear(cls, db: sqlite3.Connection):
+        cls._create(db)
+        with db:
+            db.execute("DELETE FROM work_queue")
@@ -1,6 +1,9 @@
 import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Union
+from typing import BinaryIO, Union
 
 import pendulum
 import requests
@@ -10,11 +13,36 @@ from packaging.version import Version
 from requests_oauthlib import OAuth2Session
 from rich import print
 
+from garmin_to_fittrackee.cache import MetadataCache
 from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.profiling import profiled
+from garmin_to_fittrackee.retry import Requester
+from garmin_to_fittrackee.transport import (
+    DEFAULT_POOL_SIZE,
+    configure_session,
+    shared_session,
+)
 from garmin_to_fittrackee.workout import Workout
 
 log = Log(__name__)
 
+# Maximum of workouts per page allowed by Fittrackee API
+MAX_PER_PAGE = 100
+
+
+class IncompleteListingError(requests.RequestException):
+    pass
+
+
+def base_url(host: str) -> str:
+    """
+    URL of a Fittrackee instance. host is a domain, reached with https,
+    or a full URL like http://127.0.0.1:5000 for a local instance.
+    """
+    if "://" in host:
+        return host.rstrip("/")
+    return f"https://{host}"
+
 
 class Fittrackee:
     def __init__(
@@ -25,6 +53,9 @@ class Fittrackee:
         host: str = None,
         timezone: str = None,
         verify: bool = True,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        transport: str = "requests",
+        requester: Requester = None,
     ):
         log.debug("Initializing FitTrackeeConnector")
         self.config_path = config_path
@@ -34,6 +65,9 @@ class Fittrackee:
         self.client_secret = client_secret
         self.api_url = None
         self.sports = None
+        self.pool_size = pool_size
+        self.transport = transport
+        self.requester = requester or Requester()
         if timezone is None:
             dt = pendulum.now()
             timezone = dt.timezone.name
@@ -75,7 +109,7 @@ class Fittrackee:
             self.client_id = config["fittrackee"]["client_id"]
             self.client_secret = config["fittrackee"]["client_secret"]
             self.host = config["fittrackee"]["host"]
-            self.api_url = f"https://{self.host}/api"
+            self.api_url = f"{base_url(self.host)}/api"
 
     def __auth(self):
         """
@@ -93,12 +127,13 @@ class Fittrackee:
             return self.__get_refreshing_client()
 
     def __web_application_flow(self):
-        authorize_url = f"https://{self.host}/profile/apps/authorize"
-        self.api_url = f"https://{self.host}/api"
+        authorize_url = f"{base_url(self.host)}/profile/apps/authorize"
+        self.api_url = f"{base_url(self.host)}/api"
 
         redirect_uri = "https://localhost/"
         scope = "workouts:read workouts:write profile:read"
         oauth = OAuth2Session(self.client_id, redirect_uri=redirect_uri, scope=scope)
+        configure_session(oauth, pool_size=self.pool_size, transport=self.transport)
         authorization_url, state = oauth.authorization_url(authorize_url)
         print(f"Please go to {authorization_url} and authorize access.\n")
         authorization_response = typer.prompt(
@@ -130,17 +165,39 @@ class Fittrackee:
             auto_refresh_kwargs=refresh_params,
             token_updater=self.__token_update,
         )
-        return client
+        return configure_session(
+            client, pool_size=self.pool_size, transport=self.transport
+        )
 
     def __token_update(self, token):
         log.debug("New token receive. Save it")
         self.tokens = token
         self.__save_config()
 
+    @profiled("fittrackee.access_token")
+    def access_token(self, force_refresh: bool = False) -> str:
+        """
+        Return a valid access token for clients not using the OAuth2
+        session, refreshing it when it expires in less than a minute.
+        """
+        if force_refresh or self.tokens.get("expires_at", 0) - 60 < time.time():
+            log.debug("Refreshing FitTrackee access token")
+            token = self.client.refresh_token(
+                f"{self.api_url}/oauth/token",
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+            )
+            self.__token_update(token)
+        return self.tokens["access_token"]
+
+    def __request(self, method: str, url: str, **kwargs):
+        return self.requester.request(self.client, method, url, **kwargs)
+
+    @profiled("fittrackee.is_workout_present")
     def is_workout_present(self):
         try:
-            r = self.client.get(
-                f"{self.api_url}/workouts", params={"per_page": 1, "page": 1}
+            r = self.__request(
+                "GET", f"{self.api_url}/workouts", params={"per_page": 1, "page": 1}
             )
             r.raise_for_status()
         except requests.exceptions.HTTPError as error:
@@ -159,44 +216,99 @@ class Fittrackee:
         log.debug(f"Count workkouts: {len(results['data']['workouts'])}")
         return len(results["data"]["workouts"]) != 0
 
-    def get_all_workouts(self, pagination: int = 50):
+    @profiled("fittrackee.get_workouts_page")
+    def __get_workouts_page(self, page: int, per_page: int):
+        try:
+            r = self.__request(
+                "GET",
+                f"{self.api_url}/workouts",
+                params={"per_page": per_page, "page": page},
+            )
+            r.raise_for_status()
+        except requests.exceptions.HTTPError as error:
+            error_code = error.response.status_code
+            log.debug(error.response.headers)
+            log.error(
+                "Failed to get all workouts."
+                f"Return code {error_code}. Error {error.response.text}"
+            )
+            return
+        except requests.RequestException as e:
+            log.error(str(e))
+            return
+        results = r.json()
         workouts = []
-        log.info(f"Get all workout from fittrackee (in page of {pagination})")
-        results = {"pagination": {"has_next": True}}
-        page = 1
-        while results["pagination"]["has_next"]:
-            try:
-                r = self.client.get(
-                    f"{self.api_url}/workouts",
-                    params={"per_page": pagination, "page": page},
-                )
-                r.raise_for_status()
-            except requests.exceptions.HTTPError as error:
-                error_code = error.response.status_code
-                log.debug(error.response.headers)
-                log.error(
-                    "Failed to get all workouts."
-                    f"Return code {error_code}. Error {error.response.text}"
+        for workout in results["data"]["workouts"]:
+            workout_object = object.__new__(Workout)
+            workout_object.__dict__ = workout
+            workout_object.set_present_in_fittrackee()
+            workouts.append(workout_object)
+        log.debug(f"Fetched page {page} of workouts")
+        return results.get("pagination", {}), workouts
+
+    def __iter_pages(self, per_page: int, workers: int):
+        """
+        Yield lists of workouts, or None when a page can't be fetched.
+        The first page gives the number of pages, others are fetched in
+        parallel with at most 2 * workers pages waiting in memory.
+        """
+        first = self.__get_workouts_page(1, per_page)
+        if first is None:
+            yield None
+            return
+        pagination, workouts = first
+        yield workouts
+        pages = pagination.get("pages", 1)
+        if pages < 2:
+            return
+        log.debug(f"{pages} pages of workouts to fetch")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = deque()
+            next_page = 2
+            while next_page <= pages or futures:
+                while next_page <= pages and len(futures) < 2 * workers:
+                    futures.append(
+                        executor.submit(self.__get_workouts_page, next_page, per_page)
+                    )
+                    next_page += 1
+                result = futures.popleft().result()
+                if result is None:
+                    for future in futures:
+                        future.cancel()
+                    yield None
+                    return
+                yield result[1]
+
+    def iter_workouts(self, per_page: int = MAX_PER_PAGE, workers: int = 4):
+        """
+        Yield every workout as pages arrive, keeping memory flat.
+        Raise IncompleteListingError at the first page which can't be
+        fetched, after the workouts of the previous pages.
+        """
+        count = 0
+        for workouts in self.__iter_pages(per_page, workers):
+            if workouts is None:
+                raise IncompleteListingError(
+                    f"Workouts listing stopped after {count} workouts"
                 )
+            count += len(workouts)
+            yield from workouts
+
+    def get_all_workouts(self, pagination: int = MAX_PER_PAGE, workers: int = 4):
+        workouts = []
+        log.info(f"Get all workout from fittrackee (in page of {pagination})")
+        for page in self.__iter_pages(pagination, workers):
+            if page is None:
                 return
-            except requests.RequestException as e:
-                log.error(str(e))
-                return
-            results = r.json()
-            for workout in results["data"]["workouts"]:
-                workout_object = object.__new__(Workout)
-                workout_object.__dict__ = workout
-                workout_object.set_present_in_fittrackee()
-                workouts.append(workout_object)
-            log.debug(
-                f"Fetched page {page} of workouts (fetched {len(workouts)} so far)"
-            )
-            page += 1
-            return workouts
+            workouts.extend(page)
+        log.debug(f"Fetched {len(workouts)} workouts")
+        return workouts
 
+    @profiled("fittrackee.get_last_workout")
     def get_last_workout(self):
         try:
-            r = self.client.get(
+            r = self.__request(
+                "GET",
                 f"{self.api_url}/workouts",
                 params={"per_page": 1, "page": 1, "order": "desc"},
             )
@@ -219,23 +331,41 @@ class Fittrackee:
             workout_object.set_present_in_fittrackee()
             return workout_object
 
+    @profiled("fittrackee.upload_workout")
     def upload_workout(
-        self, file: Union[str, Path], sport_id: int, notes: str = None, name: str = ""
+        self,
+        file: Union[str, Path, BinaryIO],
+        sport_id: int,
+        notes: str = None,
+        name: str = "",
+        filename: str = None,
     ):
         """
         Higly inspired of https://github.com/jat255/strava-to-fittrackee/blob/main/strava_to_fittrackee/s2f.py#L805
+        file is a path or a file object. With a file object, filename
+        is needed so Fittrackee knows the format.
         """
-        if not Path(file).is_file():
-            log.error(f"{file} is not exist or is not a file")
+        if isinstance(file, (str, Path)):
+            if not Path(file).is_file():
+                log.error(f"{file} is not exist or is not a file")
+                return
+            with Path(file).open("rb") as stream:
+                return self.__post_workout(
+                    stream, Path(file).name, sport_id=sport_id, name=name
+                )
+        if filename is None:
+            log.error("A filename is needed to upload a file object")
             return
+        return self.__post_workout(file, filename, sport_id=sport_id, name=name)
 
-        log.debug(f"posting {file} to FitTrackee")
+    def __post_workout(self, stream: BinaryIO, filename: str, sport_id: int, name):
+        log.debug(f"posting {filename} to FitTrackee")
         data = {"sport_id": sport_id, "notes": "", "title": name}
-        gpx = Path(file)
         try:
-            r = self.client.post(
+            r = self.__request(
+                "POST",
                 f"{self.api_url}/workouts",
-                files=dict(file=gpx.open("rb")),
+                files=dict(file=(filename, stream)),
                 data=dict(data=json.dumps(data)),
             )
             r.raise_for_status()
@@ -243,7 +373,7 @@ class Fittrackee:
             error_code = error.response.status_code
             log.debug(error.response.headers)
             log.error(
-                f"Failed to post {file}."
+                f"Failed to post {filename}."
                 f"Return code {error_code}. Error {error.response.text}"
             )
             return
@@ -258,35 +388,64 @@ class Fittrackee:
         log.info(f"Activity added on Fittrackee with id {workout.id}")
         return workout
 
-    def get_sports(self):
+    @profiled("fittrackee.get_sports")
+    def get_sports(self, cache: MetadataCache = None, max_age: float = None):
         """
-        Needed only during development
+        Sports of the instance, from cache when given.
         """
-        r = self.client.get(f"{self.api_url}/sports")
+        url = f"{self.api_url}/sports"
+        if cache is not None:
+            return cache.get(
+                url,
+                lambda headers: self.__request("GET", url, headers=headers),
+                max_age=max_age,
+            )
+        r = self.__request("GET", url)
         results = r.json()
         return results
 
     def delete_workout(self, workout_id: int):
+        self.remove_workout(workout_id)
+
+    @profiled("fittrackee.remove_workout")
+    def remove_workout(self, workout_id: int) -> bool:
+        """
+        Same as delete_workout, returning whether the workout is gone.
+        A workout already deleted counts as removed.
+        """
         try:
-            r = self.client.delete(f"{self.api_url}/workouts/{workout_id}")
+            r = self.__request("DELETE", f"{self.api_url}/workouts/{workout_id}")
+            if r.status_code == 404:
+                log.debug(f"Workout {workout_id} already deleted")
+                return True
             r.raise_for_status()
         except requests.exceptions.HTTPError as error:
             error_code = error.response.status_code
             log.debug(error.response.headers)
             log.error(
-                "Failed to get sports's list."
+                f"Failed to delete workout {workout_id}."
                 f"Return code {error_code}. Error {error.response.text}"
             )
-            return
+            return False
         except requests.RequestException as e:
             log.error(str(e))
-            return
+            return False
         log.warning(f"Workout {workout_id} deleted")
+        return True
 
     @staticmethod
-    def get_instance_config(host: str):
+    def get_instance_config(
+        host: str, cache: MetadataCache = None, max_age: float = None
+    ):
+        url = f"{base_url(host)}/api/config"
         try:
-            r = requests.get(f"https://{host}/api/config")
+            if cache is not None:
+                return cache.get(
+                    url,
+                    lambda headers: shared_session().get(url, headers=headers),
+                    max_age=max_age,
+                )
+            r = shared_session().get(url)
             r.raise_for_status()
         except requests.exceptions.HTTPError as error:
             error_code = error.response.status_code
@@ -302,11 +461,17 @@ class Fittrackee:
         return r.json()
 
     @staticmethod
-    def is_instance_is_supported(host: str):
-        config = Fittrackee.get_instance_config(host=host)
-        return (
-            config
-            and "data" in config
-            and "version" in config["data"]
-            and Version(config["data"]["version"]) >= Version("0.7.29")
-        )
+    def is_instance_is_supported(host: str, cache: MetadataCache = None):
+        def supported(config):
+            return (
+                config
+                and "data" in config
+                and "version" in config["data"]
+                and Version(config["data"]["version"]) >= Version("0.7.29")
+            )
+
+        config = Fittrackee.get_instance_config(host=host, cache=cache)
+        if not supported(config) and cache is not None:
+            # The instance may have been upgraded since it was cached
+            config = Fittrackee.get_instance_config(host=host, cache=cache, max_age=0)
+        return supported(config)
@@ -0,0 +1,61 @@
+import sqlite3
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+# Formats Fittrackee can import, by order of preference.
+UPLOADABLE_FORMATS = ["original", "gpx", "tcx"]
+# GPX only contains the track, useless without GPS data.
+WITHOUT_GPS_FORMATS = ["original", "tcx"]
+
+
+class FormatNegotiator:
+    """
+    Choose which formats to download for an activity, from its metadata
+    and the format which worked for the same sport last time.
+    """
+
+    def __init__(self, preferences: dict = None):
+        self.preferences = preferences or {}
+
+    @classmethod
+    def load(cls, db: sqlite3.Connection):
+        cur = db.cursor()
+        cur.execute(
+            "CREATE TABLE IF NOT EXISTS "
+            "format_preferences(garmin_type_id INTEGER PRIMARY KEY, format TEXT)"
+        )
+        rows = cur.execute("SELECT garmin_type_id, format FROM format_preferences")
+        return cls(dict(rows))
+
+    @staticmethod
+    def has_gps(activity: dict) -> bool:
+        if "hasPolyline" in activity:
+            return bool(activity["hasPolyline"])
+        return activity.get("startLatitude") is not None
+
+    def candidates(self, activity: dict) -> list:
+        if self.has_gps(activity):
+            formats = list(UPLOADABLE_FORMATS)
+        else:
+            formats = list(WITHOUT_GPS_FORMATS)
+        preferred = self.preferences.get(activity["activityType"]["typeId"])
+        if preferred in formats:
+            formats.remove(preferred)
+            formats.insert(0, preferred)
+        return formats
+
+    def record(self, activity: dict, fileformat: str, db: sqlite3.Connection = None):
+        type_id = activity["activityType"]["typeId"]
+        if self.preferences.get(type_id) == fileformat:
+            return
+        log.debug(f"{fileformat} is now the preferred format of sport {type_id}")
+        self.preferences[type_id] = fileformat
+        if db is not None:
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO format_preferences "
+                    "(garmin_type_id, format) VALUES(?, ?)",
+                    (type_id, fileformat),
+                )
@@ -1,36 +1,137 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
-import yaml
 from rich.logging import RichHandler
 
-home = str(Path.home())
-config_path = f"{home}/.config/garmin-to-fittrackee"
+from garmin_to_fittrackee.context import default_config_path
+
+DEFAULT_FORMAT = "%(message)s %(module)s %(funcName)s"
+JSON_FORMAT = "json"
+
+# Attributes of every LogRecord, the others come from extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {
+    "message",
+    "asctime",
+    "taskName",
+}
+
+_listener = None
+
+
+@lru_cache(maxsize=1)
+def load_log_config() -> dict:
+    """
+    Read the log section of config.yml, once.
+    """
+    config_path = os.environ.get("CONFIG_PATH", default_config_path())
+    config_file = Path(f"{config_path}/config.yml")
+    if not (config_file.exists() and config_file.is_file()):
+        return {}
+    import yaml
+
+    with config_file.open("r", encoding="utf-8") as file:
+        config = yaml.safe_load(file)
+    if not isinstance(config, dict) or not isinstance(config.get("log"), dict):
+        return {}
+    return config["log"]
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object by line, with the fields given with extra={...}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),  # noqa: UP017
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def build_handler(fmt: str = DEFAULT_FORMAT) -> logging.Handler:
+    if fmt == JSON_FORMAT:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter())
+        return handler
+    handler = RichHandler(rich_tracebacks=True)
+    handler.setFormatter(logging.Formatter(fmt))
+    return handler
+
+
+def configure_logging(
+    level: str = None,
+    fmt: str = None,
+    use_queue: bool = None,
+    handler: logging.Handler = None,
+    force: bool = False,
+):
+    """
+    Configure the root logger once. Explicit arguments win over config.yml.
+    With use_queue, records go through a QueueHandler and are rendered by a
+    QueueListener thread, so logging never blocks workers.
+    """
+    global _listener
+    root = logging.getLogger()
+    if getattr(root, "_garmin_to_fittrackee", False) and not force:
+        return
+    config = load_log_config()
+    level = level or config.get("level", "INFO")
+    fmt = fmt or config.get("format", DEFAULT_FORMAT)
+    if use_queue is None:
+        use_queue = config.get("queue", True)
+    if handler is None:
+        handler = build_handler(fmt)
+
+    stop_listener()
+    for previous in list(root.handlers):
+        if getattr(previous, "_garmin_to_fittrackee", False):
+            root.removeHandler(previous)
+    if use_queue:
+        records = queue.SimpleQueue()
+        _listener = QueueListener(records, handler, respect_handler_level=True)
+        _listener.start()
+        handler = QueueHandler(records)
+    handler._garmin_to_fittrackee = True
+    root.addHandler(handler)
+    root.setLevel(level)
+    root._garmin_to_fittrackee = True
+
+
+def stop_listener():
+    """
+    Flush queued records and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_listener)
 
 
 class Log:
+    """
+    Logger of a module. Nothing is configured here, so importing a module
+    never reads config.yml: the CLI calls configure_logging() when a
+    command starts. level is ignored and only kept for compatibility.
+    """
+
     def __new__(self, name: str = "default", level: str = None):
-        config_file = Path(f"{config_path}/config.yml")
-        if config_file.exists() and config_file.is_file():
-            with config_file.open("r", encoding="utf-8") as file:
-                config = yaml.safe_load(file)
-            if (
-                config is not None
-                and "log" in config
-                and "level" in config["log"]
-                and level is None
-            ):
-                level = config["log"]["level"]
-            else:
-                level = "INFO"
-        elif level is None:
-            level = "INFO"
-
-        log = logging.basicConfig(
-            level=level,
-            format="%(message)s %(module)s %(funcName)s",
-            handlers=[RichHandler(rich_tracebacks=True)],
-        )
-        log = logging.getLogger(name=name)
-
-        return log
+        return logging.getLogger(name=name)
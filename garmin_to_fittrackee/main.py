@@ -1,63 +1,37 @@
-import os
-import sqlite3
 from pathlib import Path
 from typing import Annotated
 from urllib.parse import urlparse
 
-import pendulum
 import typer
-import yaml
-from garminconnect import Garmin
 
-from garmin_to_fittrackee.fittrackee import Fittrackee
-from garmin_to_fittrackee.logs import Log
-from garmin_to_fittrackee.sports import Sports
+from garmin_to_fittrackee.context import AppContext
+from garmin_to_fittrackee.logs import (
+    DEFAULT_FORMAT,
+    JSON_FORMAT,
+    Log,
+    configure_logging,
+)
 
 log = Log(name=__name__)
 
 app = typer.Typer()
 
-GarminActivityFormatExtension = {
-    "ActivityDownloadFormat.ORIGINAL": ".zip",
-    "ActivityDownloadFormat.TCX": ".tcx",
-    "ActivityDownloadFormat.GPX": ".gpx",
-    "ActivityDownloadFormat.KML": ".kml",
-    "ActivityDownloadFormat.CSV": ".CSV",
-}
+LOG_OUTPUTS = ["text", JSON_FORMAT]
 
-GarminActivityFormat = {
-    "original": Garmin.ActivityDownloadFormat.ORIGINAL,
-    "tcx": Garmin.ActivityDownloadFormat.TCX,
-    "gpx": Garmin.ActivityDownloadFormat.GPX,
-    "kml": Garmin.ActivityDownloadFormat.KML,
-    "csv": Garmin.ActivityDownloadFormat.CSV,
-}
-
-
-def default_config_path():
-    home = str(Path.home())
-    return f"{home}/.config/garmin-to-fittrackee"
-
-
-def default_database_path():
-    home = str(Path.home())
-    return f"{home}/.local/share/garmin_to_fittrackee"
-
-
-config_path = os.environ.get("CONFIG_PATH", default_config_path())
-database_path = os.environ.get("DATABASE_PATH", default_database_path())
-default_tmp_path = os.environ.get("TMP_PATH", "/tmp")
-Path(config_path).mkdir(parents=True, exist_ok=True)
+ctx = AppContext()
 
 setup = typer.Typer()
 app.add_typer(setup, name="setup")
+sports = typer.Typer()
+app.add_typer(sports, name="sports")
 
-if Path(f"{config_path}/config.yml").is_file():
-    log.debug("Import config")
-    with open(f"{config_path}/config.yml") as file:
-        config = yaml.safe_load(file)
 
-    db = sqlite3.connect(f"{config['sqlite']['path']}/db.sqlite3")
+@app.callback()
+def main():
+    """
+    Synchronise Garmin Connect activities to Fittrackee.
+    """
+    configure_logging()
 
 
 @app.command()
@@ -76,149 +50,463 @@ def sync(
         typer.Option(
             help=(
                 "File format download from Garmin."
-                "Can be original, gpx, tcx, kml, csv. Default is all."
+                "Can be original, gpx, tcx, kml, csv. "
+                "Default is chosen from the activity."
             )
         ),
     ] = None,
     interactive: Annotated[
         bool, typer.Option(help="Can ask question during the sync")
     ] = True,
+    download_workers: Annotated[
+        int, typer.Option(help="Number of activities downloaded in parallel")
+    ] = 2,
+    upload_workers: Annotated[
+        int, typer.Option(help="Number of workouts uploaded in parallel")
+    ] = 2,
+    host_concurrency: Annotated[
+        int, typer.Option(help="Maximum of concurrent requests sent to one host")
+    ] = 4,
+    http2: Annotated[
+        bool, typer.Option(help="Use HTTP/2 with Fittrackee (needs httpx)")
+    ] = False,
+    rate_limit: Annotated[
+        float,
+        typer.Option(help="Requests per second sent to Fittrackee (0 is unlimited)"),
+    ] = 1.0,
+    engine: Annotated[
+        str,
+        typer.Option(help="Sync engine. Can be threads or async (needs httpx)."),
+    ] = "threads",
+    log_output: Annotated[
+        str,
+        typer.Option(help="Log output. Can be text or json (one object by line)."),
+    ] = None,
+    metrics_file: Annotated[
+        Path,
+        typer.Option(
+            help="Write OpenMetrics of the run in this file (textfile collector)",
+            envvar="METRICS_FILE",
+        ),
+    ] = None,
+    profile: Annotated[
+        bool, typer.Option(help="Print the time spent in each stage at the end")
+    ] = False,
+    profile_stats: Annotated[
+        Path,
+        typer.Option(help="With --profile, write cProfile stats (.pstats) here"),
+    ] = None,
+    profile_trace: Annotated[
+        Path,
+        typer.Option(help="With --profile, write a Chrome trace-event JSON here"),
+    ] = None,
+    max_attempts: Annotated[
+        int,
+        typer.Option(help="Syncs trying an activity before it waits for retry-failed"),
+    ] = 3,
 ):
     """
     Synchronise Garmin's activities in Fittrackee.
     First run, all of gamin's activities will be fetch.
     """
+    _set_log_output(log_output)
     if not config_exists():
         return
 
-    if activity_format and activity_format not in [
-        "original",
-        "tcx",
-        "gpx",
-        "kml",
-        "csv",
-    ]:
-        log.error(f"{activity_format} not in original, tcx, gpx, kml, csv")
+    from contextlib import nullcontext
+
+    from garmin_to_fittrackee import metrics, profiling
+
+    stages = (
+        profiling.profile(profile_stats, profile_trace) if profile else nullcontext()
+    )
+    with stages:
+        synchronizer = _synchronizer(
+            activity_format=activity_format,
+            download_workers=download_workers,
+            upload_workers=upload_workers,
+            host_concurrency=host_concurrency,
+            http2=http2,
+            rate_limit=rate_limit,
+            engine=engine,
+            max_attempts=max_attempts,
+        )
+        try:
+            start_datetime = synchronizer.start_datetime(
+                start_year=start_year, interactive=interactive
+            )
+            synchronizer.run(start_datetime)
+        finally:
+            if metrics_file is not None:
+                metrics.REGISTRY.write_textfile(str(metrics_file))
+
+
+@app.command(name="retry-failed")
+def retry_failed(
+    activity_format: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "File format download from Garmin."
+                "Can be original, gpx, tcx, kml, csv. "
+                "Default is chosen from the activity."
+            )
+        ),
+    ] = None,
+    download_workers: Annotated[
+        int, typer.Option(help="Number of activities downloaded in parallel")
+    ] = 2,
+    upload_workers: Annotated[
+        int, typer.Option(help="Number of workouts uploaded in parallel")
+    ] = 2,
+    rate_limit: Annotated[
+        float,
+        typer.Option(help="Requests per second sent to Fittrackee (0 is unlimited)"),
+    ] = 1.0,
+    log_output: Annotated[
+        str,
+        typer.Option(help="Log output. Can be text or json (one object by line)."),
+    ] = None,
+):
+    """
+    Try again the activities which failed too many times, without listing
+    new ones on Garmin.
+    """
+    _set_log_output(log_output)
+    if not config_exists():
         raise typer.Exit(code=1)
-    fittrackee = Fittrackee(config_path)
-    if fittrackee.is_workout_present():
-        workout = fittrackee.get_last_workout()
-        start_datetime = pendulum.parse(workout.workout_date, strict=False)
-        log.debug(f"Start date is {start_datetime.isoformat()}")
-        start_datetime = start_datetime.add(minutes=1)
-        end_datetime = start_datetime.add(days=1)
-    else:
-        if interactive:
-            log.warning("No workout present on Fittrackee")
-            start_year = int(typer.prompt("What year was your first Garmin activity?"))
-            log.info(f"Okay, fetching activity on Garmin from year {start_year}")
-        elif not interactive and start_year is not None:
-            log.warning(
-                "No workout present on Fittrackee."
-                f"Fetch all workouts on Garmin from year {start_year}"
+
+    from garmin_to_fittrackee.database import WorkQueue
+
+    count = WorkQueue.retry_failed(ctx.db)
+    log.info(f"{count} failed activities put back in the queue")
+    synchronizer = _synchronizer(
+        activity_format=activity_format,
+        download_workers=download_workers,
+        upload_workers=upload_workers,
+        rate_limit=rate_limit,
+    )
+    report = synchronizer.run()
+    if report.failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def daemon(
+    start_year: Annotated[
+        int,
+        typer.Option(
+            help=(
+                "Year of your first record."
+                "Only used when no workouts found on Fittrackee."
             )
-        else:
-            log.error(
-                "Not workout found on Fittrackee and --no-interactive set."
-                "Please specify a year to start with --start-year"
+        ),
+    ] = None,
+    activity_format: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "File format download from Garmin."
+                "Can be original, gpx, tcx, kml, csv. "
+                "Default is chosen from the activity."
             )
-            raise typer.Exit(code=1)
-        if start_year < 1990:
-            log.error(
-                "Garmin was created at the end of the year 1989 only for US army."
-                "I'm sure you don't have GPX file from this date"
+        ),
+    ] = None,
+    min_interval: Annotated[
+        float, typer.Option(help="Seconds between polls when activities arrive")
+    ] = 60,
+    max_interval: Annotated[
+        float, typer.Option(help="Maximum of seconds between polls when idle")
+    ] = 3600,
+    download_workers: Annotated[
+        int, typer.Option(help="Number of activities downloaded in parallel")
+    ] = 2,
+    upload_workers: Annotated[
+        int, typer.Option(help="Number of workouts uploaded in parallel")
+    ] = 2,
+    host_concurrency: Annotated[
+        int, typer.Option(help="Maximum of concurrent requests sent to one host")
+    ] = 4,
+    http2: Annotated[
+        bool, typer.Option(help="Use HTTP/2 with Fittrackee (needs httpx)")
+    ] = False,
+    rate_limit: Annotated[
+        float,
+        typer.Option(help="Requests per second sent to Fittrackee (0 is unlimited)"),
+    ] = 1.0,
+    engine: Annotated[
+        str,
+        typer.Option(help="Sync engine. Can be threads or async (needs httpx)."),
+    ] = "threads",
+    log_output: Annotated[
+        str,
+        typer.Option(help="Log output. Can be text or json (one object by line)."),
+    ] = None,
+    metrics_file: Annotated[
+        Path,
+        typer.Option(
+            help="Write OpenMetrics in this file after each poll",
+            envvar="METRICS_FILE",
+        ),
+    ] = None,
+    metrics_port: Annotated[
+        int,
+        typer.Option(help="Serve OpenMetrics on http://127.0.0.1:PORT/metrics"),
+    ] = None,
+):
+    """
+    Keep Fittrackee up to date: poll Garmin until SIGTERM, more often
+    when new activities arrive. Sessions are kept between polls.
+    """
+    _set_log_output(log_output)
+    if not config_exists():
+        return
+
+    from garmin_to_fittrackee import metrics
+    from garmin_to_fittrackee.daemon import Daemon, PollScheduler
+
+    try:
+        scheduler = PollScheduler(min_interval=min_interval, max_interval=max_interval)
+    except ValueError as e:
+        log.error(str(e))
+        raise typer.Exit(code=1) from None
+    synchronizer = _synchronizer(
+        activity_format=activity_format,
+        download_workers=download_workers,
+        upload_workers=upload_workers,
+        host_concurrency=host_concurrency,
+        http2=http2,
+        rate_limit=rate_limit,
+        engine=engine,
+    )
+    first_start = synchronizer.start_datetime(start_year=start_year, interactive=False)
+
+    def poll():
+        start = first_start
+        if synchronizer.cursor.start_time is not None:
+            start = synchronizer.start_datetime()
+        try:
+            return synchronizer.run(start).uploaded
+        finally:
+            if metrics_file is not None:
+                metrics.REGISTRY.write_textfile(str(metrics_file))
+
+    server = None
+    if metrics_port is not None:
+        server = metrics.REGISTRY.serve(port=metrics_port)
+    try:
+        Daemon(poll, scheduler).run()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+@app.command()
+def replay(
+    workers: Annotated[
+        int, typer.Option(help="Number of workouts uploaded in parallel")
+    ] = 4,
+    rate_limit: Annotated[
+        float,
+        typer.Option(help="Requests per second sent to Fittrackee (0 is unlimited)"),
+    ] = 0.0,
+    replace: Annotated[
+        bool,
+        typer.Option(help="Upload again workouts already on Fittrackee"),
+    ] = False,
+    restart: Annotated[
+        bool,
+        typer.Option(help="Forget the checkpoint of an interrupted replay"),
+    ] = False,
+    log_output: Annotated[
+        str,
+        typer.Option(help="Log output. Can be text or json (one object by line)."),
+    ] = None,
+):
+    """
+    Upload activities of the archive to Fittrackee again, without Garmin.
+    """
+    _set_log_output(log_output)
+    if not config_exists(garmin=False):
+        raise typer.Exit(code=1)
+
+    from garmin_to_fittrackee.archive import ActivityArchive
+    from garmin_to_fittrackee.fittrackee import Fittrackee
+    from garmin_to_fittrackee.replay import Replayer
+    from garmin_to_fittrackee.retry import Requester, TokenBucket
+
+    if not ctx.config.get("archive", {}).get("use"):
+        log.error("No archive to replay. Set one with setup config-tool --archive-path")
+        raise typer.Exit(code=1)
+    fittrackee = Fittrackee(
+        ctx.config_path,
+        pool_size=workers,
+        requester=Requester(bucket=TokenBucket(rate=rate_limit, capacity=300)),
+    )
+    archive = ActivityArchive.load(ctx.config["archive"]["path"], ctx.db)
+    try:
+        replayer = Replayer(ctx, archive, fittrackee, workers=workers, replace=replace)
+    except ValueError as e:
+        log.error(str(e))
+        raise typer.Exit(code=1) from None
+    progress = replayer.run(restart=restart)
+    if progress.failed:
+        log.error(f"{progress.failed} activities not replayed, run replay again")
+        raise typer.Exit(code=1)
+
+
+@app.command(name="sync-all")
+def sync_all(
+    accounts: Annotated[
+        Path,
+        typer.Option(
+            help="YAML list of accounts. Default is accounts.yml in CONFIG_PATH"
+        ),
+    ] = None,
+    activity_format: Annotated[
+        str,
+        typer.Option(
+            help=(
+                "File format download from Garmin."
+                "Can be original, gpx, tcx, kml, csv. "
+                "Default is chosen from the activity."
+            )
+        ),
+    ] = None,
+    download_workers: Annotated[
+        int, typer.Option(help="Activities downloaded in parallel, all accounts")
+    ] = 4,
+    upload_workers: Annotated[
+        int, typer.Option(help="Workouts uploaded in parallel, all accounts")
+    ] = 4,
+    host_concurrency: Annotated[
+        int, typer.Option(help="Maximum of concurrent requests sent to one host")
+    ] = 4,
+    rate_limit: Annotated[
+        float,
+        typer.Option(help="Requests per second sent to Fittrackee (0 is unlimited)"),
+    ] = 1.0,
+    time_budget: Annotated[
+        float,
+        typer.Option(help="Seconds after which no activity is started anymore"),
+    ] = None,
+    log_output: Annotated[
+        str,
+        typer.Option(help="Log output. Can be text or json (one object by line)."),
+    ] = None,
+    metrics_file: Annotated[
+        Path,
+        typer.Option(
+            help="Write OpenMetrics of the run in this file (textfile collector)",
+            envvar="METRICS_FILE",
+        ),
+    ] = None,
+):
+    """
+    Synchronise several accounts with shared download and upload workers.
+    Each account has its own CONFIG_PATH, set up with the setup commands.
+    """
+    _set_log_output(log_output)
+    import time
+    from contextlib import ExitStack
+
+    from garmin_to_fittrackee import metrics
+    from garmin_to_fittrackee.accounts import AccountRouter, load_accounts
+    from garmin_to_fittrackee.pipeline import HostLimiter, SyncPipeline
+    from garmin_to_fittrackee.retry import Requester, TokenBucket
+    from garmin_to_fittrackee.synchronizer import Synchronizer
+
+    accounts_file = accounts or Path(f"{ctx.config_path}/accounts.yml")
+    try:
+        accounts = load_accounts(accounts_file)
+    except (OSError, ValueError) as e:
+        log.error(f"Can't load accounts: {e}")
+        raise typer.Exit(code=1) from None
+
+    started = time.monotonic()
+    # Fittrackee limits requests by client address, shared by every account
+    requester = Requester(bucket=TokenBucket(rate=rate_limit, capacity=300))
+    synchronizers = {}
+    starts = {}
+    for account in accounts:
+        context = AppContext(config_path=account.config_path, tmp_path=ctx.tmp_path)
+        if not config_exists(context):
+            continue
+        try:
+            synchronizer = Synchronizer(
+                context,
+                activity_format=activity_format,
+                download_workers=download_workers,
+                upload_workers=upload_workers,
+                host_concurrency=host_concurrency,
+                requester=requester,
             )
-            raise typer.Exit(code=1)
-        start_datetime = pendulum.datetime(start_year, 1, 1, 0, 0, 0)
-        end_datetime = start_datetime.add(days=1)
-
-    today = pendulum.now()
-    if today.diff(end_datetime, False).in_seconds() > 0:
-        end_datetime = today
-    garmin = Garmin()
-    garmin.login(f"{config_path}/garmintoken")
-    log.debug(
-        f"Condition in while : {today.diff(start_datetime, False).in_seconds()} < 0"
+            starts[account.name] = synchronizer.start_datetime(
+                start_year=account.start_year, interactive=False
+            )
+        except Exception as e:
+            log.error(f"Skip account {account.name}: {e}")
+            continue
+        synchronizers[account.name] = synchronizer
+
+    deadline = started + time_budget if time_budget else None
+    router = AccountRouter(synchronizers, deadline=deadline)
+    pipeline = SyncPipeline(
+        download=router.download,
+        upload=router.upload,
+        download_workers=download_workers,
+        upload_workers=upload_workers,
+        limiter=HostLimiter(default=host_concurrency),
+        download_host="garmin",
+        upload_host="fittrackee",
     )
-    while today.diff(start_datetime, False).in_seconds() < 0:
+    try:
+        with ExitStack() as stack:
+            streams = {}
+            for name, synchronizer in list(synchronizers.items()):
+                try:
+                    streams[name] = stack.enter_context(
+                        synchronizer.session(starts[name])
+                    )
+                except Exception as e:
+                    log.error(f"Skip account {name}: {e}")
+                    del synchronizers[name]
+            pipeline.run(router.jobs(streams), router.on_result)
+    finally:
+        uploaded = sum(s.report.uploaded for s in synchronizers.values())
+        metrics.record_run(started, uploaded)
+        if metrics_file is not None:
+            metrics.REGISTRY.write_textfile(str(metrics_file))
+    for name, synchronizer in synchronizers.items():
+        report = synchronizer.report
         log.info(
-            "Fetching activities on Garmin"
-            f"from {start_datetime.to_formatted_date_string()}"
-            f"to {end_datetime.to_formatted_date_string()}"
-        )
-        activities = garmin.get_activities_by_date(
-            start_datetime.to_date_string(), end_datetime.to_date_string()
+            f"{name}: {report.uploaded} activities uploaded, {report.failed} failed"
+            + (", will resume next run" if synchronizer.incomplete else "")
         )
-        if activities:
-            for activity in activities:
-                cur = db.cursor()
-                res = cur.execute(
-                    f"SELECT garmin_id "
-                    f"FROM activities_ids "
-                    f"WHERE garmin_id='{activity['activityId']}'"
-                )
-                if res.fetchone() is not None:
-                    continue
-                activityType_id = activity["activityType"]["typeId"]
-                fittrackee_sport_id = Sports.get_fittrackee_sport_by_garmin_id(
-                    activityType_id
-                )
-                for _, fileformat in GarminActivityFormat.items():
-                    if (
-                        activity_format
-                        and GarminActivityFormat[activity_format] != fileformat
-                    ):
-                        log.debug(f"{fileformat} is not {activity_format}")
-                        continue
-                    file = _fetch_garmin_activity_file(
-                        garmin=garmin,
-                        activity_id=activity["activityId"],
-                        GarminFileFormat=fileformat,
-                    )
-                    if not file:
-                        continue
+    if len(synchronizers) < len(accounts):
+        log.error(f"{len(accounts) - len(synchronizers)} accounts not synchronised")
+        raise typer.Exit(code=1)
 
-                    workout = fittrackee.upload_workout(
-                        file=file,
-                        sport_id=fittrackee_sport_id,
-                        name=activity.get("activityName"),
-                    )
-                    if workout is not None:
-                        log.debug(f"Deleting {file}")
-                        Path(file).unlink(missing_ok=True)
-                        if config["sqlite"]["use"]:
-                            log.debug(
-                                "Adding workout and activity matches in tool database"
-                            )
-                            log.debug(
-                                f"Using Fittrackee ID {workout.id}"
-                                f"and Garmin ID {activity['activityId']}"
-                            )
-                            data_insert = (workout.id, activity["activityId"])
-                            cur = db.cursor()
-                            cur.execute(
-                                "INSERT INTO activities_ids (fittrackee_id, garmin_id)"
-                                "VALUES(?, ?)",
-                                data_insert,
-                            )
-                            db.commit()
-                        break
-        start_datetime = start_datetime.add(days=2)
-        end_datetime = start_datetime.add(days=1)
-        if today.diff(end_datetime, False).in_seconds() > 0:
-            end_datetime = today
-
-
-def _fetch_garmin_activity_file(garmin, activity_id: int, GarminFileFormat):
-    data = garmin.download_activity(activity_id, GarminFileFormat)
-    file = (
-        f"{default_tmp_path}/{str(activity_id)}"
-        f"{GarminActivityFormatExtension[str(GarminFileFormat)]}"
+
+def _synchronizer(**options):
+    from garmin_to_fittrackee.synchronizer import Synchronizer
+
+    try:
+        return Synchronizer(ctx, **options)
+    except ValueError as e:
+        log.error(str(e))
+        raise typer.Exit(code=1) from None
+
+
+def _set_log_output(log_output: str):
+    if log_output is None:
+        return
+    if log_output not in LOG_OUTPUTS:
+        log.error(f"{log_output} not in {', '.join(LOG_OUTPUTS)}")
+        raise typer.Exit(code=1)
+    configure_logging(
+        fmt=JSON_FORMAT if log_output == JSON_FORMAT else None, force=True
     )
-    with open(file, "wb") as fb:
-        fb.write(data)
-        log.info(f"Activity data downloaded to file {file}")
-    return file
 
 
 def _send_to_fittrackee():
@@ -231,29 +519,101 @@ def reset(
         bool,
         typer.Option(help="Security reason, you need to force the reset"),
     ] = False,
+    dry_run: Annotated[
+        bool,
+        typer.Option(help="Only show what would be deleted"),
+    ] = False,
+    workers: Annotated[
+        int, typer.Option(help="Number of workouts deleted in parallel")
+    ] = 8,
+    rate_limit: Annotated[
+        float,
+        typer.Option(help="Requests per second sent to Fittrackee (0 is unlimited)"),
+    ] = 0.0,
+    log_output: Annotated[
+        str,
+        typer.Option(help="Log output. Can be text or json (one object by line)."),
+    ] = None,
 ):
     """
     Reset database and remove ALL of workouts in Fittrackee. (Usefull for development)
     """
-    if not force:
+    _set_log_output(log_output)
+    if not force and not dry_run:
         log.warning("No force, no chocolate")
         return
+    if not config_exists():
+        return
+
+    from garmin_to_fittrackee.bulk import BulkDeleter
+    from garmin_to_fittrackee.database import MappingWriter, SyncCursor, WorkQueue
+    from garmin_to_fittrackee.fittrackee import Fittrackee, IncompleteListingError
+    from garmin_to_fittrackee.retry import Requester, TokenBucket
+
+    db = ctx.db
+    fittrackee = Fittrackee(
+        ctx.config_path,
+        pool_size=workers,
+        requester=Requester(bucket=TokenBucket(rate=rate_limit, capacity=300)),
+    )
+    # Listing first, deleting while paginating would shift pages
+    try:
+        workout_ids = [workout.id for workout in fittrackee.iter_workouts()]
+    except IncompleteListingError as e:
+        log.error(f"{e}, nothing deleted")
+        raise typer.Exit(code=1) from None
     cur = db.cursor()
-    cur.execute("DROP TABLE activities_ids")
-    db.commit()
-    cur = db.cursor()
-    cur.execute(
-        "CREATE TABLE"
-        "activities_ids(fittrackee_id VARCHAR(255) UNIQUE,"
-        "garmin_id INTEGER(100) UNIQUE"
-        ")"
+    mapped = cur.execute("SELECT COUNT(*) FROM activities_ids").fetchone()[0]
+    log.info(
+        f"{len(workout_ids)} workouts to delete on Fittrackee, "
+        f"{mapped} activity matches in tool database"
+    )
+    if dry_run:
+        return
+    deleter = BulkDeleter(delete=fittrackee.remove_workout, workers=workers)
+    with MappingWriter(db) as writer:
+        progress = deleter.run(workout_ids, on_deleted=writer.remove)
+    SyncCursor.clear(db)
+    WorkQueue.clear(db)
+    if progress.failed:
+        log.error(f"{progress.failed} workouts not deleted")
+        raise typer.Exit(code=1)
+
+
+@sports.command(name="sync")
+def sports_sync():
+    """
+    Check the sports used for Garmin activities against the Fittrackee
+    instance, and keep its sports for the next syncs.
+    """
+    if not config_exists():
+        raise typer.Exit(code=1)
+
+    import requests
+
+    from garmin_to_fittrackee.fittrackee import Fittrackee
+    from garmin_to_fittrackee.sports import FITTRACKEE_SPORTS, SportTable, cache_sports
+
+    fittrackee = Fittrackee(ctx.config_path)
+    try:
+        instance_sports = fittrackee.get_sports(cache=ctx.metadata_cache, max_age=0)[
+            "data"
+        ]["sports"]
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        log.error(f"Can't get the sports of Fittrackee: {e}")
+        raise typer.Exit(code=1) from None
+    table = SportTable.load(ctx.config)
+    problems = table.check(instance_sports)
+    for problem in problems:
+        log.warning(f"{problem}, sport {table.default} will be used instead")
+    for sport in instance_sports:
+        if sport["id"] not in FITTRACKEE_SPORTS:
+            log.info(f"New Fittrackee sport {sport['id']} ({sport['label']})")
+    cache_sports(ctx.db, instance_sports)
+    log.info(
+        f"{len(instance_sports)} sports of Fittrackee kept, "
+        f"{len(problems)} problems found"
     )
-    db.commit()
-    fittrackee = Fittrackee(config_path)
-    workouts = fittrackee.get_all_workouts()
-    if workouts:
-        for workout in workouts:
-            fittrackee.delete_workout(workout.id)
 
 
 @setup.command()
@@ -276,14 +636,18 @@ def garmin(
     ],
     store: bool = True,
 ):
+    import yaml
+    from garminconnect import Garmin
+
+    ctx.ensure_config_path()
     garmin = Garmin(email, password)
     garmin.login()
     if store:
         data = {"garmin": {"username": email, "password": password}}
-        with open(f"{config_path}/garmin.yml", "w") as file:
+        with open(f"{ctx.config_path}/garmin.yml", "w") as file:
             yaml.dump(data, file, default_flow_style=False)
 
-    garmin.garth.dump(f"{config_path}/garmintoken")
+    garmin.garth.dump(f"{ctx.config_path}/garmintoken")
 
 
 @setup.command()
@@ -313,20 +677,25 @@ def fittrackee(
     ],
     force: Annotated[bool, typer.Option(help="Rewrite configuration file")] = False,
 ):
+    from garmin_to_fittrackee.fittrackee import Fittrackee
+
+    ctx.ensure_config_path()
     if force:
         log.warning("Rewrite configuration file")
-        Path(f"{config_path}/fittrackee.yml").unlink(missing_ok=True)
+        Path(f"{ctx.config_path}/fittrackee.yml").unlink(missing_ok=True)
     url = urlparse(fittrackee_domain)
     if url.hostname:
         fittrackee_domain = url.hostname
-    if not Fittrackee.is_instance_is_supported(host=fittrackee_domain):
+    if not Fittrackee.is_instance_is_supported(
+        host=fittrackee_domain, cache=ctx.metadata_cache
+    ):
         log.error(
             "Fittrackee instance isn't supported. "
             "Please update your Fittrackee instance"
         )
         raise typer.Exit(code=1)
     Fittrackee(
-        config_path=config_path,
+        config_path=ctx.config_path,
         client_id=client_id,
         client_secret=client_secret,
         host=fittrackee_domain,
@@ -338,23 +707,41 @@ def config_tool(
     database_path: Annotated[
         str,
         typer.Option(help="Database location. If not exist, path will be created."),
-    ] = database_path,
+    ] = ctx.database_path,
     verbose_level: Annotated[
         str,
         typer.Option(help="Verbose level. Maybe DEBUG, INFO, WARNING, ERROR, CRITICAL"),
     ] = "INFO",
+    log_format: Annotated[
+        str,
+        typer.Option(help="Format of log messages (Python logging format)"),
+    ] = DEFAULT_FORMAT,
+    log_queue: Annotated[
+        bool,
+        typer.Option(help="Write logs from a background thread"),
+    ] = True,
+    archive_path: Annotated[
+        str,
+        typer.Option(help="Keep downloaded activity files in this directory"),
+    ] = None,
 ):
+    import yaml
+
+    from garmin_to_fittrackee.database import connect
+
+    ctx.ensure_config_path()
     data = {
         "sqlite": {"use": True, "path": database_path},
-        "log": {"level": verbose_level},
+        "log": {"level": verbose_level, "format": log_format, "queue": log_queue},
+        "archive": {"use": archive_path is not None, "path": archive_path},
     }
-    with open(f"{config_path}/config.yml", "w") as file:
+    with open(f"{ctx.config_path}/config.yml", "w") as file:
         yaml.dump(data, file, default_flow_style=False)
     log.debug("Create database")
     path = Path(database_path)
     path.mkdir(parents=True, exist_ok=True)
 
-    db = sqlite3.connect(f"{database_path}/db.sqlite3")
+    db = connect(f"{database_path}/db.sqlite3")
     cur = db.cursor()
     cur.execute(
         "CREATE TABLE "
@@ -363,16 +750,21 @@ def config_tool(
     )
 
 
-def config_exists():
+def config_exists(context: AppContext = ctx, garmin: bool = True):
+    """
+    Commands not calling Garmin (replay) pass garmin=False to not need
+    the Garmin tokens.
+    """
     if (
-        not Path(f"{config_path}/garmintoken").is_dir()
-        or not Path(f"{config_path}/fittrackee.yml").is_file()
-        or not Path(f"{config_path}/config.yml").is_file()
+        (garmin and not Path(f"{context.config_path}/garmintoken").is_dir())
+        or not Path(f"{context.config_path}/fittrackee.yml").is_file()
+        or not context.config_file.is_file()
     ):
         log.error(
-            "Config files aren't present."
+            f"Config files aren't present in {context.config_path}. "
             "Start using garmin-to-fittrackee with `setup config-tool`,"
-            "`setup garmin` and `setup fittrackee` command"
+            + ("`setup garmin` and " if garmin else "")
+            + "`setup fittrackee` command"
         )
         return False
     else:
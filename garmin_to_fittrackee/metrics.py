@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: dict = None) -> str:
+    pairs = list(zip(names, values, strict=True)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    kind = "unknown"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(
+                f"{self.name} needs labels {', '.join(self.label_names) or 'none'}"
+            )
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def clear(self):
+        with self.lock:
+            self.values = {}
+
+    def samples(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# TYPE {self.name} {self.kind}",
+            f"# HELP {self.name} {self.documentation}",
+        ]
+        with self.lock:
+            lines += [
+                f"{self.name}{suffix}{labels} {value}"
+                for suffix, labels, value in self.samples()
+            ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield "_total", _labels(self.label_names, key), value
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield "", _labels(self.label_names, key), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            buckets, count, total = self.values.get(
+                key, ([0] * len(self.buckets), 0, 0.0)
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    buckets[i] += 1
+            self.values[key] = (buckets, count + 1, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        return self.values.get(self._key(labels), (None, 0, 0.0))[1]
+
+    def samples(self):
+        for key, (buckets, count, total) in self.values.items():
+            for bound, observed in zip(self.buckets, buckets, strict=True):
+                yield "_bucket", _labels(self.label_names, key, {"le": bound}), observed
+            yield "_bucket", _labels(self.label_names, key, {"le": "+Inf"}), count
+            yield "_count", _labels(self.label_names, key), count
+            yield "_sum", _labels(self.label_names, key), total
+
+
+class Registry:
+    """
+    Metrics of a run, rendered in the OpenMetrics text format.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple = (),
+        buckets: tuple = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+    def render(self) -> str:
+        families = [metric.render() for metric in self.metrics.values()]
+        return "\n".join(families + ["# EOF"]) + "\n"
+
+    def write_textfile(self, path: str):
+        """
+        Write the metrics atomically, for the node exporter textfile collector.
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as file:
+            file.write(self.render())
+        os.replace(tmp, path)
+        log.debug(f"Metrics written in {path}")
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serve the metrics on http://host:port/metrics from a daemon thread.
+        Call shutdown() on the returned server to stop it.
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if urlparse(self.path).path not in ["/", "/metrics"]:
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(f"Metrics request: {format % args}")
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        log.info(f"Metrics served on http://{host}:{server.server_port}/metrics")
+        return server
+
+
+def endpoint(url: str) -> str:
+    """
+    Path of a request without the IDs, to keep one histogram by endpoint.
+    """
+    segments = urlparse(url).path.rstrip("/").split("/")
+    for i, segment in enumerate(segments):
+        if segment.isdigit() or (i > 0 and segments[i - 1] == "workouts"):
+            segments[i] = "{id}"
+    return "/".join(segments) or "/"
+
+
+REGISTRY = Registry()
+ACTIVITIES = REGISTRY.counter(
+    "garmin_to_fittrackee_activities",
+    "Garmin activities by result (seen, skipped, uploaded, failed)",
+    ("result",),
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "garmin_to_fittrackee_request_seconds",
+    "Latency of requests by service and endpoint",
+    ("service", "method", "endpoint"),
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "garmin_to_fittrackee_stage_seconds",
+    "Time spent by activity in each sync stage",
+    ("stage",),
+)
+TRANSFERRED_BYTES = REGISTRY.counter(
+    "garmin_to_fittrackee_transferred_bytes",
+    "Activity files bytes downloaded from Garmin and uploaded to Fittrackee",
+    ("direction",),
+)
+RETRIES = REGISTRY.counter(
+    "garmin_to_fittrackee_retries",
+    "Requests sent again after a failure",
+    ("service",),
+)
+RUN_SECONDS = REGISTRY.gauge(
+    "garmin_to_fittrackee_last_run_seconds", "Duration of the last sync run"
+)
+RUN_TIMESTAMP = REGISTRY.gauge(
+    "garmin_to_fittrackee_last_run_timestamp_seconds",
+    "End of the last sync run, as a Unix timestamp",
+)
+THROUGHPUT = REGISTRY.gauge(
+    "garmin_to_fittrackee_last_run_throughput",
+    "Activities uploaded by second during the last sync run",
+)
+
+
+def record_run(started: float, uploaded: int):
+    """
+    Set the gauges of a run started at started (time.monotonic()).
+    """
+    elapsed = time.monotonic() - started
+    RUN_SECONDS.set(round(elapsed, 3))
+    RUN_TIMESTAMP.set(round(time.time(), 3))
+    THROUGHPUT.set(round(uploaded / elapsed, 3) if elapsed > 0 else 0)
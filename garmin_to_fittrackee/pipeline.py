@@ -0,0 +1,320 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.profiling import span
+
+log = Log(__name__)
+
+_STOP = object()
+
+
+class HostLimiter:
+    """
+    Limit the number of concurrent requests sent to the same host,
+    whatever the number of workers using it.
+    """
+
+    def __init__(self, default: int = 4, limits: dict = None):
+        if default < 1:
+            raise ValueError(f"Host concurrency must be at least 1, not {default}")
+        self.default = default
+        self.limits = limits or {}
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def semaphore(self, host: str):
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(
+                    self.limits.get(host, self.default)
+                )
+            return self.semaphores[host]
+
+    @contextmanager
+    def limit(self, host: str):
+        with self.semaphore(host):
+            yield
+
+
+class Job:
+    def __init__(self, activity: dict, formats: list):
+        self.activity = activity
+        self.formats = list(formats)
+        self.format = None
+        self.file = None
+        self.workout = None
+        # Seconds spent by stage (download, upload...), all formats included
+        self.durations = {}
+
+    @contextmanager
+    def timed(self, stage: str):
+        started = time.perf_counter()
+        try:
+            with span(f"pipeline.{stage}"):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.durations[stage] = self.durations.get(stage, 0.0) + elapsed
+
+
+class SyncPipeline:
+    """
+    Download Garmin activities and upload them to Fittrackee with two
+    bounded pools of workers connected by bounded queues.
+    The caller thread lists the activities and receives the results,
+    so it stays the only one to use the SQLite database.
+    """
+
+    def __init__(
+        self,
+        download,
+        upload,
+        download_workers: int = 2,
+        upload_workers: int = 2,
+        queue_size: int = None,
+        limiter: HostLimiter = None,
+        download_host: str = "garmin",
+        upload_host: str = "fittrackee",
+    ):
+        if download_workers < 1 or upload_workers < 1:
+            raise ValueError("Pipeline needs at least one worker by stage")
+        if queue_size is None:
+            queue_size = 2 * max(download_workers, upload_workers)
+        self.download = download
+        self.upload = upload
+        self.download_workers = download_workers
+        self.upload_workers = upload_workers
+        self.limiter = limiter or HostLimiter()
+        self.download_host = download_host
+        self.upload_host = upload_host
+        self.download_queue = queue.Queue(maxsize=queue_size)
+        self.upload_queue = queue.Queue(maxsize=queue_size)
+        # Jobs sent back by uploaders to try another format.
+        # Unbounded to never block an uploader on a full download queue.
+        self.retry_queue = queue.Queue()
+        self.results = queue.Queue()
+        self.pending = 0
+
+    def run(self, jobs, on_result):
+        """
+        Process every job and call on_result(job) in the caller thread
+        for each of them once it's uploaded or failed.
+        """
+        threads = [
+            threading.Thread(target=self._download_worker, daemon=True)
+            for _ in range(self.download_workers)
+        ] + [
+            threading.Thread(target=self._upload_worker, daemon=True)
+            for _ in range(self.upload_workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for job in jobs:
+                self.pending += 1
+                while True:
+                    try:
+                        self.download_queue.put(job, timeout=0.1)
+                        break
+                    except queue.Full:
+                        self._drain(on_result)
+                self._drain(on_result)
+            while self.pending:
+                self._drain(on_result, block=True)
+        finally:
+            # On error or interruption, jobs not started are dropped, the
+            # ones in progress end and their results are still delivered
+            self._cancel_waiting()
+            for _ in range(self.download_workers):
+                self.download_queue.put(_STOP)
+            for _ in range(self.upload_workers):
+                self.upload_queue.put(_STOP)
+            for thread in threads:
+                thread.join()
+            self._drain(on_result)
+
+    def _cancel_waiting(self):
+        while True:
+            try:
+                self.download_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.pending -= 1
+
+    def _drain(self, on_result, block: bool = False):
+        while True:
+            try:
+                job = self.results.get(block=block, timeout=0.1 if block else None)
+            except queue.Empty:
+                return
+            self.pending -= 1
+            on_result(job)
+            block = False
+
+    def _next_download(self):
+        while True:
+            try:
+                return self.retry_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                return self.download_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _download_worker(self):
+        while True:
+            job = self._next_download()
+            if job is _STOP:
+                return
+            job.file = None
+            while job.formats and job.file is None:
+                job.format = job.formats.pop(0)
+                try:
+                    with (
+                        self.limiter.limit(self.download_host),
+                        job.timed("download"),
+                    ):
+                        job.file = self.download(job.activity, job.format)
+                except Exception as e:
+                    log.error(
+                        f"Failed to download activity {job.activity['activityId']}"
+                        f" in {job.format}: {e}"
+                    )
+            if job.file is None:
+                self.results.put(job)
+            else:
+                self.upload_queue.put(job)
+
+    def _upload_worker(self):
+        while True:
+            job = self.upload_queue.get()
+            if job is _STOP:
+                return
+            try:
+                with self.limiter.limit(self.upload_host), job.timed("upload"):
+                    job.workout = self.upload(job.activity, job.file)
+            except Exception as e:
+                log.error(
+                    f"Failed to upload activity {job.activity['activityId']}: {e}"
+                )
+            if job.workout is None and job.formats:
+                self.retry_queue.put(job)
+            else:
+                self.results.put(job)
+
+
+class AsyncSyncPipeline:
+    """
+    Same job as SyncPipeline on a single event loop: Garmin calls run in
+    an executor, uploads are coroutines, and semaphores bound how many
+    downloads, uploads and jobs are in flight.
+    upload is a coroutine function, download a blocking function.
+    """
+
+    def __init__(
+        self,
+        download,
+        upload,
+        download_workers: int = 2,
+        upload_workers: int = 2,
+        queue_size: int = None,
+    ):
+        if download_workers < 1 or upload_workers < 1:
+            raise ValueError("Pipeline needs at least one worker by stage")
+        if queue_size is None:
+            queue_size = 2 * (download_workers + upload_workers)
+        self.download = download
+        self.upload = upload
+        self.download_workers = download_workers
+        self.upload_workers = upload_workers
+        self.queue_size = queue_size
+
+    def run(self, jobs, on_result, cleanup=None):
+        """
+        Process every job and call on_result(job) in the event loop
+        thread. cleanup is an optional coroutine function awaited at the
+        end, before the loop is closed.
+        """
+        asyncio.run(self._run(iter(jobs), on_result, cleanup))
+
+    async def _run(self, jobs, on_result, cleanup):
+        loop = asyncio.get_running_loop()
+        downloads = asyncio.Semaphore(self.download_workers)
+        uploads = asyncio.Semaphore(self.upload_workers)
+        in_flight = asyncio.Semaphore(self.queue_size)
+        lister = ThreadPoolExecutor(max_workers=1)
+        downloader = ThreadPoolExecutor(max_workers=self.download_workers)
+        tasks = []
+        try:
+            try:
+                while True:
+                    job = await loop.run_in_executor(lister, next, jobs, None)
+                    if job is None:
+                        break
+                    await in_flight.acquire()
+                    tasks.append(
+                        asyncio.create_task(
+                            self._process(
+                                job,
+                                on_result,
+                                downloader,
+                                downloads,
+                                uploads,
+                                in_flight,
+                            )
+                        )
+                    )
+                    for task in tasks:
+                        if task.done():
+                            # Raise errors of on_result as soon as possible
+                            task.result()
+                    tasks = [task for task in tasks if not task.done()]
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # No new job, but the started ones end and report their
+                # result: their workout may already be on Fittrackee
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+        finally:
+            # Don't block the loop on a listing call still running
+            lister.shutdown(wait=False, cancel_futures=True)
+            downloader.shutdown(wait=False)
+            if cleanup is not None:
+                await cleanup()
+
+    async def _process(self, job, on_result, downloader, downloads, uploads, in_flight):
+        loop = asyncio.get_running_loop()
+        try:
+            while job.formats and job.workout is None:
+                job.format = job.formats.pop(0)
+                job.file = None
+                try:
+                    async with downloads:
+                        with job.timed("download"):
+                            job.file = await loop.run_in_executor(
+                                downloader, self.download, job.activity, job.format
+                            )
+                except Exception as e:
+                    log.error(
+                        f"Failed to download activity {job.activity['activityId']}"
+                        f" in {job.format}: {e}"
+                    )
+                if job.file is None:
+                    continue
+                try:
+                    async with uploads:
+                        with job.timed("upload"):
+                            job.workout = await self.upload(job.activity, job.file)
+                except Exception as e:
+                    log.error(
+                        f"Failed to upload activity {job.activity['activityId']}: {e}"
+                    )
+            on_result(job)
+        finally:
+            in_flight.release()
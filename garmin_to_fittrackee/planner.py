@@ -0,0 +1,91 @@
+import pendulum
+
+from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.metrics import REQUEST_SECONDS
+from garmin_to_fittrackee.profiling import span
+
+log = Log(__name__)
+
+
+class RangePlanner:
+    """
+    Plan the date windows used to list activities on Garmin.
+    Start with a large window and shrink it when Garmin returns a lot of
+    activities, grow it again when windows come back sparse.
+    Windows are contiguous and inclusive so no day is skipped.
+    """
+
+    def __init__(
+        self,
+        start: pendulum.DateTime,
+        end: pendulum.DateTime = None,
+        max_days: int = 366,
+        min_days: int = 1,
+        dense_threshold: int = 100,
+    ):
+        if min_days < 1 or max_days < min_days:
+            raise ValueError(f"Invalid window size {min_days}-{max_days} days")
+        if end is None:
+            end = pendulum.now()
+        self.cursor = start.start_of("day")
+        self.end = end.start_of("day")
+        self.min_days = min_days
+        self.max_days = max_days
+        self.dense_threshold = dense_threshold
+        self.window_days = max_days
+        self.calls = 0
+
+    def windows(self):
+        while self.cursor <= self.end:
+            window_end = self.cursor.add(days=self.window_days - 1)
+            if window_end > self.end:
+                window_end = self.end
+            yield self.cursor, window_end
+            self.cursor = window_end.add(days=1)
+
+    def record(self, count: int):
+        """
+        Adapt the size of the next window with the number of activities
+        found in the previous one.
+        """
+        if count >= self.dense_threshold and self.window_days > self.min_days:
+            self.window_days = max(self.min_days, self.window_days // 2)
+            log.debug(f"Dense window ({count}), next window is {self.window_days} days")
+        elif count < self.dense_threshold // 4 and self.window_days < self.max_days:
+            self.window_days = min(self.max_days, self.window_days * 2)
+            log.debug(
+                f"Sparse window ({count}), next window is {self.window_days} days"
+            )
+
+    def pages(self, garmin):
+        """
+        Yield the activities of each window, from the oldest to the newest.
+        """
+        for start, end in self.windows():
+            log.info(
+                "Fetching activities on Garmin "
+                f"from {start.to_formatted_date_string()} "
+                f"to {end.to_formatted_date_string()}"
+            )
+            with (
+                span("garmin.list"),
+                REQUEST_SECONDS.time(
+                    service="garmin", method="GET", endpoint="get_activities_by_date"
+                ),
+            ):
+                activities = garmin.get_activities_by_date(
+                    start.to_date_string(), end.to_date_string()
+                )
+            self.calls += 1
+            activities = activities or []
+            self.record(len(activities))
+            yield sorted(
+                activities, key=lambda activity: activity.get("startTimeGMT") or ""
+            )
+
+    def fetch(self, garmin):
+        """
+        Yield Garmin activities from the oldest to the newest.
+        """
+        for page in self.pages(garmin):
+            yield from page
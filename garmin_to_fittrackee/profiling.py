@@ -0,0 +1,163 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+
+class Span:
+    def __init__(self, name: str, started: float, duration: float, thread: int):
+        self.name = name
+        self.started = started
+        self.duration = duration
+        self.thread = thread
+
+
+class Profiler:
+    """
+    Record timing spans of the sync stages, from any thread.
+    Spans cost nothing while the profiler is disabled.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def enable(self):
+        self.spans = []
+        self.origin = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def span(self, name: str):
+        if not self.enabled:
+            return nullcontext()
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            span = Span(
+                name,
+                started - self.origin,
+                time.perf_counter() - started,
+                threading.get_ident(),
+            )
+            with self.lock:
+                self.spans.append(span)
+
+    def summary(self) -> list:
+        """
+        Count, total, mean and max seconds by span name, slowest first.
+        """
+        stats = {}
+        for span in self.spans:
+            count, total, slowest = stats.get(span.name, (0, 0.0, 0.0))
+            stats[span.name] = (
+                count + 1,
+                total + span.duration,
+                max(slowest, span.duration),
+            )
+        rows = [
+            (name, count, total, total / count, slowest)
+            for name, (count, total, slowest) in stats.items()
+        ]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def print_summary(self):
+        from rich.console import Console
+        from rich.table import Table
+
+        table = Table(title="Time spent by stage")
+        for column in ["Stage", "Calls", "Total (s)", "Mean (s)", "Max (s)"]:
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        for name, count, total, mean, slowest in self.summary():
+            table.add_row(
+                name, str(count), f"{total:.3f}", f"{mean:.3f}", f"{slowest:.3f}"
+            )
+        Console(stderr=True).print(table)
+
+    def write_trace(self, path: str):
+        """
+        Write the spans in the Chrome trace event format,
+        to open with chrome://tracing or https://ui.perfetto.dev.
+        """
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": round(span.started * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": pid,
+                "tid": span.thread,
+            }
+            for span in self.spans
+        ]
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+        log.info(f"Trace of {len(events)} spans written in {path}")
+
+
+PROFILER = Profiler()
+
+
+def span(name: str):
+    return PROFILER.span(name)
+
+
+def profiled(name: str):
+    """
+    Decorator recording each call of a function as a span.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with PROFILER.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def profile(stats_path: str = None, trace_path: str = None):
+    """
+    Enable spans, and cProfile when stats_path is given, for the block.
+    cProfile only sees the calling thread: the listing and the database
+    writes with the threads engine, everything with the async engine.
+    """
+    profiler = None
+    if stats_path:
+        import cProfile
+
+        profiler = cProfile.Profile()
+    PROFILER.enable()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield PROFILER
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(stats_path)
+            log.info(f"Profile written in {stats_path}")
+        PROFILER.disable()
+        PROFILER.print_summary()
+        if trace_path:
+            PROFILER.write_trace(trace_path)
@@ -0,0 +1,130 @@
+from garmin_to_fittrackee import metrics
+from garmin_to_fittrackee.archive import ActivityArchive
+from garmin_to_fittrackee.bulk import Progress
+from garmin_to_fittrackee.context import AppContext
+from garmin_to_fittrackee.database import ReplayCheckpoint
+from garmin_to_fittrackee.fittrackee import Fittrackee
+from garmin_to_fittrackee.formats import UPLOADABLE_FORMATS
+from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.pipeline import HostLimiter, Job, SyncPipeline
+from garmin_to_fittrackee.sports import SportTable
+from garmin_to_fittrackee.synchronizer import ActivityFile, activity_file
+
+log = Log(__name__)
+
+
+class Replayer:
+    """
+    Upload archived activities to Fittrackee again, without any Garmin
+    call. Activities matching a workout in activities_ids are skipped,
+    unless replace is set: their workout is then uploaded again and the
+    previous one deleted.
+    """
+
+    def __init__(
+        self,
+        ctx: AppContext,
+        archive: ActivityArchive,
+        fittrackee: Fittrackee,
+        workers: int = 4,
+        replace: bool = False,
+    ):
+        if workers < 1:
+            raise ValueError(f"Replay needs at least one worker, not {workers}")
+        self.ctx = ctx
+        self.db = ctx.db
+        self.archive = archive
+        self.fittrackee = fittrackee
+        self.workers = workers
+        self.replace = replace
+        self.sports = SportTable.load(ctx.config, self.db)
+        self.checkpoint = None
+        self.progress = None
+        self.previous = {}
+
+    def jobs(self, activities: list, mapping: dict):
+        for activity in activities:
+            garmin_id = int(activity["activityId"])
+            if garmin_id in self.checkpoint:
+                continue
+            if garmin_id in mapping and not self.replace:
+                continue
+            formats = [
+                fileformat
+                for fileformat in UPLOADABLE_FORMATS
+                if (garmin_id, fileformat) in self.archive
+            ]
+            if not formats:
+                log.warning(f"No archived file of activity {garmin_id} to upload")
+                continue
+            if garmin_id in mapping:
+                self.previous[garmin_id] = mapping[garmin_id]
+            yield Job(activity=activity, formats=formats)
+
+    def download(self, activity: dict, fileformat: str) -> ActivityFile:
+        data = self.archive.read(activity["activityId"], fileformat)
+        if data is None:
+            return
+        return activity_file(activity["activityId"], fileformat, data, self.ctx)
+
+    def upload(self, activity: dict, file: ActivityFile):
+        with file.payload:
+            workout = self.fittrackee.upload_workout(
+                file=file.payload,
+                filename=file.filename,
+                sport_id=self.sports.resolve(activity["activityType"]["typeId"]),
+                name=activity.get("activityName"),
+            )
+        previous = self.previous.get(int(activity["activityId"]))
+        if workout is not None and previous is not None:
+            self.fittrackee.remove_workout(previous)
+        return workout
+
+    def on_result(self, job: Job):
+        garmin_id = int(job.activity["activityId"])
+        self.previous.pop(garmin_id, None)
+        if job.workout is None:
+            self.progress.update(success=False)
+            metrics.ACTIVITIES.inc(result="failed")
+            log.error(f"Activity {garmin_id} not replayed")
+            return
+        self.checkpoint.add(garmin_id, job.workout.id)
+        self.progress.update()
+        metrics.ACTIVITIES.inc(result="replayed")
+        log.debug(f"Activity {garmin_id} replayed as workout {job.workout.id}")
+
+    def run(self, restart: bool = False) -> Progress:
+        """
+        Replay the archive, from the checkpoint of an interrupted replay
+        unless restart is set. The checkpoint is cleared once every
+        activity is replayed.
+        """
+        self.checkpoint = ReplayCheckpoint.load(self.db)
+        if restart:
+            self.checkpoint.clear()
+        mapping = {
+            int(garmin_id): fittrackee_id
+            for fittrackee_id, garmin_id in self.db.execute(
+                "SELECT fittrackee_id, garmin_id FROM activities_ids"
+            )
+            if garmin_id is not None
+        }
+        activities = self.archive.activities(self.db)
+        self.sports.resolve_many(activities)
+        jobs = list(self.jobs(activities, mapping))
+        log.info(f"{len(jobs)} archived activities to replay")
+        self.progress = Progress(total=len(jobs), label="activities")
+        pipeline = SyncPipeline(
+            download=self.download,
+            upload=self.upload,
+            download_workers=2,
+            upload_workers=self.workers,
+            limiter=HostLimiter(default=self.workers),
+            upload_host=self.fittrackee.host,
+        )
+        with self.checkpoint:
+            pipeline.run(iter(jobs), self.on_result)
+        self.progress.report()
+        if not self.progress.failed:
+            self.checkpoint.clear()
+        return self.progress
@@ -0,0 +1,240 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.metrics import REQUEST_SECONDS, RETRIES, endpoint
+
+log = Log(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# (connect, read) seconds, unless the caller gives a timeout
+DEFAULT_TIMEOUT = (10, 60)
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+def not_sent(error: requests.RequestException) -> bool:
+    """
+    Whether the request failed before reaching the server: the connection
+    couldn't be opened. A connection aborted or reset after it was sent
+    may have been processed.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError) or not error.args:
+        return False
+    # MaxRetryError of urllib3 keeps the original error in reason
+    reason = getattr(error.args[0], "reason", error.args[0])
+    return isinstance(reason, NewConnectionError)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter, respecting Retry-After.
+    POST requests are only retried when they never reached the server.
+    """
+
+    def __init__(
+        self,
+        retries: int = 4,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        statuses: set = None,
+        post_statuses: set = None,
+    ):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses or {429, 500, 502, 503, 504}
+        self.post_statuses = post_statuses or {429, 503}
+
+    def should_retry(self, method: str, response=None, error=None) -> bool:
+        if error is not None:
+            if method.upper() in IDEMPOTENT_METHODS:
+                return isinstance(error, (requests.ConnectionError, requests.Timeout))
+            return not_sent(error)
+        if method.upper() in IDEMPOTENT_METHODS:
+            return response.status_code in self.statuses
+        return response.status_code in self.post_statuses
+
+    @staticmethod
+    def retry_after(response) -> float:
+        if response is None:
+            return None
+        value = response.headers.get("Retry-After")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def delay(self, attempt: int, response=None) -> float:
+        retry_after = self.retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. rate is the number of requests per second,
+    capacity the allowed burst. A rate of 0 disables the limit.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+    def reserve(self) -> float:
+        """
+        Take a token and return 0, or return how long to wait for one.
+        """
+        with self.lock:
+            return self._wait_time()
+
+    def _wait_time(self) -> float:
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stop sending requests for reset_timeout seconds after threshold
+    consecutive failures, then let one request test the server.
+    """
+
+    def __init__(self, threshold: int = 5, reset_timeout: float = 60.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: one request goes, next failure opens it again
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.opened_at is None:
+                log.warning(
+                    f"{self.failures} failures in a row, "
+                    f"pause requests for {self.reset_timeout}s"
+                )
+                self.opened_at = time.monotonic()
+
+
+class Requester:
+    """
+    Send requests through the rate limiter and the circuit breaker,
+    retrying them with the retry policy. The last response is returned
+    once retries are exhausted so callers can raise_for_status().
+    """
+
+    def __init__(
+        self,
+        policy: RetryPolicy = None,
+        bucket: TokenBucket = None,
+        breaker: CircuitBreaker = None,
+        service: str = "fittrackee",
+    ):
+        self.policy = policy or RetryPolicy()
+        # Fittrackee default limit is 300 requests per 5 minutes
+        self.bucket = bucket or TokenBucket(rate=1.0, capacity=300)
+        self.breaker = breaker or CircuitBreaker()
+        self.service = service
+        self.retries = 0
+
+    @staticmethod
+    def _rewind(kwargs):
+        for value in (kwargs.get("files") or {}).values():
+            stream = value[1] if isinstance(value, tuple) else value
+            if hasattr(stream, "seek"):
+                stream.seek(0)
+
+    def request(self, session: requests.Session, method: str, url: str, **kwargs):
+        kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Too many failures, not sending {method} {url}")
+            self.bucket.acquire()
+            self._rewind(kwargs)
+            response = error = None
+            try:
+                with REQUEST_SECONDS.time(
+                    service=self.service, method=method, endpoint=endpoint(url)
+                ):
+                    response = session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            if error is None and response.status_code < 500:
+                self.breaker.record_success()
+            elif error is None or isinstance(error, requests.ConnectionError):
+                self.breaker.record_failure()
+            delay = self.policy.delay(attempt, response)
+            if response is not None and response.status_code == 429:
+                self.bucket.pause(delay)
+            if attempt >= self.policy.retries or not self.policy.should_retry(
+                method, response=response, error=error
+            ):
+                if error is not None:
+                    raise error
+                return response
+            reason = error or f"status {response.status_code}"
+            log.warning(f"{method} {url} failed ({reason}), retry in {delay:.1f}s")
+            self.retries += 1
+            RETRIES.inc(service=self.service)
+            attempt += 1
+            time.sleep(delay)
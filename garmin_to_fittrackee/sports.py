@@ -1,7 +1,219 @@
+import sqlite3
+
 from garmin_to_fittrackee.logs import Log
 
 log = Log(__name__)
 
+# Fittrackee sports, by ID
+FITTRACKEE_SPORTS = {
+    1: "Cycling (Sport)",
+    2: "Cycling (Transport)",
+    3: "Hiking",
+    4: "Mountain Biking",
+    5: "Running",
+    6: "Walking",
+    7: "Mountain Biking (Electric)",
+    8: "Trail",
+    9: "Skiing (Alpine)",
+    10: "Skiing (Cross Country)",
+    11: "Rowing",
+    12: "Snowshoes",
+    13: "Cycling (Virtual)",
+    14: "Mountaineering",
+    15: "Paragliding",
+    16: "Open Water Swimming",
+    17: "Cycling (Trekking)",
+}
+
+# Fittrackee sport of Garmin activity types, by Garmin type ID
+GARMIN_SPORTS = {
+    # Road cycling
+    2: 1,  # cycle
+    10: 1,  # road_cycle
+    21: 1,  # track_cycling
+    22: 1,  # recumbent_cycling
+    197: 1,  # hand_cycling
+    # Mountain bike
+    5: 4,  # mountain_biking
+    19: 4,  # cyclocross
+    20: 4,  # downhill_biking
+    143: 4,  # gravel_cycling
+    # E-Mountain bike
+    175: 7,  # e_bike_mountain
+    # Virtual cycling
+    25: 13,  # indoor_cycling
+    152: 13,  # virtual_ride
+    176: 13,  # e_bike_fitness
+    198: 13,  # indoor_hand_cycling
+    # Running
+    1: 5,  # running
+    7: 5,  # street_running
+    8: 5,  # track_running
+    18: 5,  # treadmill_running
+    153: 5,  # virtual_run
+    154: 5,  # obstacle_run
+    156: 5,  # indoor_running
+    181: 5,  # ultra_run
+    # Hiking
+    3: 3,  # hiking
+    # Walking
+    9: 6,  # walking
+    15: 6,  # casual_walking
+    16: 6,  # speed_walking
+    # Snowshoes
+    167: 12,  # snow_shoe_ws
+    # Skiing (Alpine)
+    172: 9,  # resort_skiing_snowboarding_ws
+    251: 9,  # resort_skiing
+    252: 9,  # resort_snowboarding
+    # Skiing (Cross Country)
+    168: 10,  # skating_ws
+    169: 10,  # backcountry_skiing_snowboarding_ws
+    170: 10,  # skate_skiing_ws
+    171: 10,  # cross_country_skiing_ws
+    203: 10,  # backcountry_skiing
+    204: 10,  # backcountry_snowboarding
+    # Mountaineering
+    37: 14,  # mountaineering
+    # Open Water Swimming
+    28: 16,  # open_water_swimming
+    # Trail
+    6: 8,  # trail_running
+    # Rowing
+    32: 11,  # indoor_rowing
+    237: 11,  # rowing_v2
+}
+
+DEFAULT_SPORT = 1
+
+
+class SportTable:
+    """
+    Fittrackee sport ID of Garmin activity types, built once from
+    GARMIN_SPORTS and the sports section of config.yml:
+
+        sports:
+          default: 1
+          overrides:
+            4: 2
+
+    Types without a match get the default sport. Sports the instance
+    doesn't offer (see `sports sync`) fall back to the default too.
+    """
+
+    def __init__(
+        self,
+        mapping: dict = None,
+        default: int = DEFAULT_SPORT,
+        available: set = None,
+    ):
+        self.mapping = dict(GARMIN_SPORTS if mapping is None else mapping)
+        self.default = default
+        if available is not None:
+            for type_id, sport_id in list(self.mapping.items()):
+                if sport_id not in available:
+                    log.warning(
+                        f"Sport {sport_id} of Garmin type {type_id} isn't available "
+                        f"on Fittrackee, sport {default} used instead"
+                    )
+                    self.mapping[type_id] = default
+        self.unknown = set()
+
+    @classmethod
+    def load(
+        cls, config: dict, db: sqlite3.Connection = None, instance_sports: list = None
+    ):
+        """
+        instance_sports (data.sports of /api/sports) are the sports
+        available, else the ones kept by `sports sync` in db.
+        """
+        section = config.get("sports") or {}
+        mapping = dict(GARMIN_SPORTS)
+        for type_id, sport_id in (section.get("overrides") or {}).items():
+            mapping[int(type_id)] = int(sport_id)
+        if instance_sports:
+            available = [
+                sport["id"] for sport in instance_sports if sport.get("is_active", True)
+            ]
+        else:
+            available = cached_sports(db) if db is not None else None
+        return cls(
+            mapping,
+            default=int(section.get("default", DEFAULT_SPORT)),
+            available=set(available) if available else None,
+        )
+
+    def resolve(self, garmin_type_id: int) -> int:
+        sport_id = self.mapping.get(garmin_type_id)
+        if sport_id is None:
+            if garmin_type_id not in self.unknown:
+                self.unknown.add(garmin_type_id)
+                log.warning(
+                    f"No Fittrackee sport for Garmin type {garmin_type_id}, "
+                    f"sport {self.default} used"
+                )
+            return self.default
+        return sport_id
+
+    def resolve_many(self, activities: list) -> list:
+        """
+        Fittrackee sport ID of each activity of a page.
+        """
+        return [
+            self.resolve(activity["activityType"]["typeId"]) for activity in activities
+        ]
+
+    def check(self, sports: list) -> list:
+        """
+        Problems of the table against the sports of an instance
+        (data.sports of /api/sports).
+        """
+        offered = {sport["id"]: sport for sport in sports}
+        problems = []
+        for sport_id in sorted(set(self.mapping.values()) | {self.default}):
+            sport = offered.get(sport_id)
+            if sport is None:
+                problems.append(f"Sport {sport_id} doesn't exist on the instance")
+            elif not sport.get("is_active", True):
+                problems.append(f"Sport {sport_id} ({sport['label']}) is disabled")
+        return problems
+
+
+def _create(db: sqlite3.Connection):
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS fittrackee_sports("
+        "id INTEGER PRIMARY KEY, label TEXT, is_active INTEGER)"
+    )
+
+
+def cache_sports(db: sqlite3.Connection, sports: list):
+    """
+    Keep the sports of the instance, used to build the next tables.
+    """
+    _create(db)
+    with db:
+        db.execute("DELETE FROM fittrackee_sports")
+        db.executemany(
+            "INSERT INTO fittrackee_sports (id, label, is_active) VALUES(?, ?, ?)",
+            [
+                (sport["id"], sport["label"], sport.get("is_active", True))
+                for sport in sports
+            ],
+        )
+
+
+def cached_sports(db: sqlite3.Connection) -> dict:
+    """
+    Labels of the active sports of the instance by ID, empty before
+    the first `sports sync`.
+    """
+    _create(db)
+    rows = db.execute("SELECT id, label FROM fittrackee_sports WHERE is_active")
+    return dict(rows)
+
+
+DEFAULT_TABLE = SportTable()
+
 
 class Sports:
     @staticmethod
@@ -9,130 +221,4 @@ class Sports:
         if not isinstance(garmin_sport_id, int):
             log.critical(f"garmin_sport_id {garmin_sport_id} is not an int")
             raise ValueError(f"garmin_sport_id {garmin_sport_id} is not an int")
-        match garmin_sport_id:
-            # Bike cases
-            case 2 | 10 | 21 | 22 | 197:
-                """
-                2 reference cycle
-                10 reference road_cycle
-                21 reference track_cycling
-                22 reference recumbent_cycling
-                197 reference hand_cycling
-                """
-                log.debug(f"Road cycling match with garmin sport id {garmin_sport_id}")
-                return 1
-            case 5 | 19 | 20 | 143:
-                """
-                5 reference mountain_biking
-                19 reference cyclocross
-                20 reference downhill_biking
-                143 reference gravel_cycling
-                """
-                log.debug(f"Mountain bike match with garmin sport id {garmin_sport_id}")
-                return 4
-            case 175:
-                """
-                175 reference e_bike_mountain
-                """
-                log.debug(
-                    f"E-Mountain bike match with garmin sport id {garmin_sport_id}"
-                )
-                return 7
-            case 25 | 152 | 176 | 198:
-                """
-                25 reference indoor_cycling
-                152 reference virtual_ride
-                176 reference e_bike_fitness
-                198 reference indoor_hand_cycling
-                """
-                log.debug(
-                    f"Virtual cycling match with garmin sport id {garmin_sport_id}"
-                )
-                return 13
-            # Running cases
-            case 1 | 7 | 8 | 18 | 153 | 154 | 156 | 181:
-                """
-                1 reference running
-                7 reference street_running
-                8 reference track_running
-                18 reference treadmill_running
-                153 reference virtual_run
-                154 reference obstacle_run
-                156 reference indoor_running
-                181 reference ultra_run
-                """
-                log.debug(f"Running match with garmin sport id {garmin_sport_id}")
-                return 5
-            # Hiking cases
-            case 3:
-                log.debug(f"Hiking match with garmin sport id {garmin_sport_id}")
-                return 3
-            # Walking case
-            case 9 | 15 | 16:
-                """
-                9 reference walking
-                15 reference casual_walking
-                16 reference speed_walking
-                """
-                log.debug(f"Walking match with garmin sport id {garmin_sport_id}")
-                return 6
-            # Winter sport cases
-            case 167:
-                """
-                167 reference snow_shoe_ws
-                """
-                log.debug(f"Snowshoes match with garmin sport id {garmin_sport_id}")
-                return 12
-            case 172 | 251 | 252:
-                """
-                172 reference resort_skiing_snowboarding_ws
-                251 reference resort_skiing
-                252 reference resort_snowboarding
-                """
-                log.debug(
-                    f"Skiing (Alpine) match with garmin sport id {garmin_sport_id}"
-                )
-                return 9
-            case 168 | 169 | 170 | 171 | 203 | 204:
-                """
-                168 reference skating_ws
-                169 reference backcountry_skiing_snowboarding_ws
-                170 reference skate_skiing_ws
-                171 reference cross_country_skiing_ws
-                203 reference backcountry_skiing
-                204 reference backcountry_snowboarding
-                """
-                log.debug(
-                    "Skiing (Cross Country) matchwith garmin sport id {garmin_sport_id}"
-                )
-                return 10
-            # Mountaineering case
-            case 37:
-                log.debug(
-                    f"Mountaineering match with garmin sport id {garmin_sport_id}"
-                )
-                return 14
-            # Open Water swimming case
-            case 28:
-                log.debug(
-                    f"Open Water Swimming match with garmin sport id {garmin_sport_id}"
-                )
-                return 16
-            # Trail case
-            case 6:
-                log.debug(f"Trail match with garmin sport id {garmin_sport_id}")
-                return 8
-            # Rowing case
-            case 32 | 237:
-                """
-                32 reference indoor_rowing
-                237 reference rowing_v2
-                """
-                log.debug(f"Rowing match with garmin sport id {garmin_sport_id}")
-                return 11
-            case _:
-                log.error(
-                    f"Not Fittrackee match with garmin sport id {garmin_sport_id}"
-                )
-                log.error("Set to cycling road")
-                return 1
+        return DEFAULT_TABLE.resolve(garmin_sport_id)
@@ -0,0 +1,443 @@
+import time
+from contextlib import contextmanager
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, NamedTuple
+
+import pendulum
+import requests
+import typer
+from garminconnect import Garmin
+
+from garmin_to_fittrackee import metrics, profiling
+from garmin_to_fittrackee.archive import ActivityArchive
+from garmin_to_fittrackee.context import AppContext
+from garmin_to_fittrackee.database import (
+    ActivityIndex,
+    MappingWriter,
+    SyncCursor,
+    WorkQueue,
+)
+from garmin_to_fittrackee.fittrackee import Fittrackee
+from garmin_to_fittrackee.formats import FormatNegotiator
+from garmin_to_fittrackee.logs import Log
+from garmin_to_fittrackee.pipeline import (
+    AsyncSyncPipeline,
+    HostLimiter,
+    Job,
+    SyncPipeline,
+)
+from garmin_to_fittrackee.planner import RangePlanner
+from garmin_to_fittrackee.retry import Requester, TokenBucket
+from garmin_to_fittrackee.sports import SportTable
+from garmin_to_fittrackee.transport import configure_garmin
+
+log = Log(__name__)
+
+GarminActivityFormatExtension = {
+    "original": ".zip",
+    "tcx": ".tcx",
+    "gpx": ".gpx",
+    "kml": ".kml",
+    "csv": ".CSV",
+}
+
+ENGINES = ["threads", "async"]
+
+
+class ActivityFile(NamedTuple):
+    filename: str
+    payload: BinaryIO
+    size: int
+
+
+class SyncReport(NamedTuple):
+    processed: int
+    uploaded: int
+    failed: int
+
+
+def download_activity(garmin, activity_id: int, fileformat: str) -> bytes:
+    with (
+        profiling.span("garmin.download"),
+        metrics.REQUEST_SECONDS.time(
+            service="garmin", method="GET", endpoint="download_activity"
+        ),
+    ):
+        data = garmin.download_activity(
+            activity_id, Garmin.ActivityDownloadFormat[fileformat.upper()]
+        )
+    if data:
+        metrics.TRANSFERRED_BYTES.inc(len(data), direction="download")
+    return data
+
+
+def activity_file(
+    activity_id: int, fileformat: str, data: bytes, ctx: AppContext
+) -> ActivityFile:
+    """
+    Activity data in a spooled file, kept in memory and only written in
+    TMP_PATH when bigger than SPOOL_MAX_SIZE.
+    """
+    filename = f"{activity_id}{GarminActivityFormatExtension[fileformat]}"
+    payload = SpooledTemporaryFile(  # noqa: SIM115
+        max_size=ctx.spool_max_size, dir=ctx.tmp_path
+    )
+    payload.write(data)
+    payload.seek(0)
+    return ActivityFile(filename=filename, payload=payload, size=len(data))
+
+
+def fetch_activity_file(
+    garmin, activity_id: int, fileformat: str, ctx: AppContext
+) -> ActivityFile:
+    """
+    Download an activity in a spooled file.
+    """
+    data = download_activity(garmin, activity_id, fileformat)
+    if not data:
+        return
+    log.debug(f"Activity data downloaded ({len(data)} bytes) for {activity_id}")
+    return activity_file(activity_id, fileformat, data, ctx)
+
+
+def activity_fields(job: Job, status: str) -> dict:
+    """
+    Fields of the record logged for each activity, one by line in json.
+    """
+    return {
+        "status": status,
+        "garmin_id": job.activity["activityId"],
+        "fittrackee_id": job.workout.id if job.workout is not None else None,
+        "format": job.format,
+        "bytes": job.file.size if job.file is not None else 0,
+        "download_seconds": round(job.durations.get("download", 0.0), 3),
+        "upload_seconds": round(job.durations.get("upload", 0.0), 3),
+        "db_seconds": round(job.durations.get("db", 0.0), 3),
+    }
+
+
+class Synchronizer:
+    """
+    Synchronise the activities of one account. Clients, database and
+    indexes are kept between runs, so a long running process only logs
+    in once.
+    """
+
+    def __init__(
+        self,
+        ctx: AppContext,
+        activity_format: str = None,
+        download_workers: int = 2,
+        upload_workers: int = 2,
+        host_concurrency: int = 4,
+        http2: bool = False,
+        rate_limit: float = 1.0,
+        engine: str = "threads",
+        requester: Requester = None,
+        max_attempts: int = 3,
+    ):
+        if activity_format and activity_format not in GarminActivityFormatExtension:
+            raise ValueError(
+                f"{activity_format} not in {', '.join(GarminActivityFormatExtension)}"
+            )
+        if engine not in ENGINES:
+            raise ValueError(f"{engine} not in {', '.join(ENGINES)}")
+        self.ctx = ctx
+        self.activity_format = activity_format
+        self.download_workers = download_workers
+        self.upload_workers = upload_workers
+        self.host_concurrency = host_concurrency
+        self.engine = engine
+        self.config = ctx.config
+        self.db = ctx.db
+        self.fittrackee = Fittrackee(
+            ctx.config_path,
+            pool_size=max(upload_workers, host_concurrency),
+            transport="http2" if http2 else "requests",
+            requester=requester
+            or Requester(bucket=TokenBucket(rate=rate_limit, capacity=300)),
+        )
+        self.cursor = SyncCursor.load(self.db)
+        self.queue = WorkQueue.load(self.db, max_attempts=max_attempts)
+        self.negotiator = FormatNegotiator.load(self.db)
+        self.index = ActivityIndex.load(self.db)
+        self.sports = SportTable.load(
+            self.config, self.db, instance_sports=self._instance_sports()
+        )
+        self.archive = None
+        if self.config.get("archive", {}).get("use"):
+            self.archive = ActivityArchive.load(self.config["archive"]["path"], self.db)
+        self.garmin = None
+        self.writer = None
+        self.report = SyncReport(processed=0, uploaded=0, failed=0)
+        self.incomplete = False
+
+    def _instance_sports(self) -> list:
+        # Cached on disk, instances are asked at most once by METADATA_TTL
+        try:
+            sports = self.fittrackee.get_sports(cache=self.ctx.metadata_cache)
+            return list(sports["data"]["sports"])
+        except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+            log.warning(f"Can't get the sports of Fittrackee: {e}")
+            return None
+
+    def login(self) -> Garmin:
+        if self.garmin is None:
+            garmin = Garmin()
+            with profiling.span("garmin.login"):
+                garmin.login(f"{self.ctx.config_path}/garmintoken")
+            configure_garmin(
+                garmin, pool_size=max(self.download_workers, self.host_concurrency)
+            )
+            self.garmin = garmin
+        return self.garmin
+
+    def start_datetime(self, start_year: int = None, interactive: bool = True):
+        """
+        Where to start listing Garmin activities: the local cursor, else
+        the last workout on Fittrackee, else the first day of start_year.
+        """
+        if self.cursor.start_time is not None:
+            log.debug(
+                f"Resume after activity {self.cursor.garmin_id} "
+                f"of {self.cursor.start_time}"
+            )
+            # Garmin lists by local date, start a day earlier for time zones
+            return pendulum.parse(self.cursor.start_time, tz="UTC").subtract(days=1)
+        if self.fittrackee.is_workout_present():
+            workout = self.fittrackee.get_last_workout()
+            start_datetime = pendulum.parse(workout.workout_date, strict=False)
+            log.debug(f"Start date is {start_datetime.isoformat()}")
+            return start_datetime.add(minutes=1)
+        if interactive:
+            log.warning("No workout present on Fittrackee")
+            start_year = int(typer.prompt("What year was your first Garmin activity?"))
+            log.info(f"Okay, fetching activity on Garmin from year {start_year}")
+        elif not interactive and start_year is not None:
+            log.warning(
+                "No workout present on Fittrackee."
+                f"Fetch all workouts on Garmin from year {start_year}"
+            )
+        else:
+            log.error(
+                "Not workout found on Fittrackee and --no-interactive set."
+                "Please specify a year to start with --start-year"
+            )
+            raise typer.Exit(code=1)
+        if start_year < 1990:
+            log.error(
+                "Garmin was created at the end of the year 1989 only for US army."
+                "I'm sure you don't have GPX file from this date"
+            )
+            raise typer.Exit(code=1)
+        return pendulum.datetime(start_year, 1, 1, 0, 0, 0)
+
+    def _job(self, activity: dict) -> Job:
+        if self.activity_format:
+            formats = [self.activity_format]
+        else:
+            formats = self.negotiator.candidates(activity)
+        return Job(activity=activity, formats=formats)
+
+    def retried(self) -> list:
+        """
+        Activities left in the work queue by previous runs, read before
+        the pipeline starts: the listing may run on another thread.
+        """
+        activities = []
+        for activity in self.queue.retried():
+            if activity["activityId"] in self.index:
+                # Uploaded by a run which stopped before writing the queue
+                self.queue.uploaded(activity)
+                continue
+            activities.append(activity)
+        if activities:
+            log.info(f"{len(activities)} activities of previous runs tried again")
+        return activities
+
+    def jobs(self, planner: RangePlanner = None, retried: list = ()):
+        """
+        Retried activities first, then the new ones listed by planner.
+        Only the listing and in-memory planning happen here, the work
+        queue is written by on_result.
+        """
+        queued = set()
+        for activity in retried:
+            queued.add(int(activity["activityId"]))
+            yield self._job(activity)
+        if planner is None:
+            return
+        for page in planner.pages(self.garmin):
+            activities = self.index.filter(page)
+            metrics.ACTIVITIES.inc(len(page), result="seen")
+            metrics.ACTIVITIES.inc(len(page) - len(activities), result="skipped")
+            for activity in page:
+                self.cursor.seen(activity)
+            # Unknown types are reported here, not from the workers
+            self.sports.resolve_many(activities)
+            for activity in activities:
+                garmin_id = int(activity["activityId"])
+                # Failed ones wait for retry-failed
+                if garmin_id in queued or self.queue.state(garmin_id) == "failed":
+                    continue
+                self.queue.plan(activity)
+                yield self._job(activity)
+
+    def download(self, activity: dict, fileformat: str) -> ActivityFile:
+        activity_id = activity["activityId"]
+        if self.archive is None:
+            return fetch_activity_file(
+                garmin=self.garmin,
+                activity_id=activity_id,
+                fileformat=fileformat,
+                ctx=self.ctx,
+            )
+        with profiling.span("archive.read"):
+            data = self.archive.read(activity_id, fileformat)
+        if data is not None:
+            log.debug(f"Activity {activity_id} ({fileformat}) read from archive")
+        else:
+            data = download_activity(self.garmin, activity_id, fileformat)
+            if not data:
+                return
+            with profiling.span("archive.store"):
+                self.archive.store(activity_id, fileformat, data, activity=activity)
+        return activity_file(activity_id, fileformat, data, self.ctx)
+
+    def upload(self, activity: dict, file: ActivityFile):
+        with file.payload:
+            return self.fittrackee.upload_workout(
+                file=file.payload,
+                filename=file.filename,
+                sport_id=self.sports.resolve(activity["activityType"]["typeId"]),
+                name=activity.get("activityName"),
+            )
+
+    def _async_pipeline(self):
+        try:
+            from garmin_to_fittrackee.async_fittrackee import AsyncFittrackee
+        except ImportError:
+            log.error(
+                "The async engine needs httpx. "
+                'Install it with pip install "garmin-to-fittrackee[async]"'
+            )
+            raise typer.Exit(code=1) from None
+        # httpx clients are bound to the event loop of the run
+        async_fittrackee = AsyncFittrackee(
+            self.fittrackee,
+            max_connections=max(self.upload_workers, self.host_concurrency),
+        )
+
+        async def upload(activity, file):
+            with file.payload:
+                data = file.payload.read()
+            return await async_fittrackee.upload_workout(
+                data,
+                filename=file.filename,
+                sport_id=self.sports.resolve(activity["activityType"]["typeId"]),
+                name=activity.get("activityName"),
+            )
+
+        pipeline = AsyncSyncPipeline(
+            download=self.download,
+            upload=upload,
+            download_workers=self.download_workers,
+            upload_workers=self.upload_workers,
+        )
+        return pipeline, {"cleanup": async_fittrackee.close}
+
+    def _pipeline(self):
+        if self.engine == "async":
+            return self._async_pipeline()
+        pipeline = SyncPipeline(
+            download=self.download,
+            upload=self.upload,
+            download_workers=self.download_workers,
+            upload_workers=self.upload_workers,
+            limiter=HostLimiter(default=self.host_concurrency),
+            download_host="garmin",
+            upload_host=self.fittrackee.host,
+        )
+        return pipeline, {}
+
+    @contextmanager
+    def session(self, start=None, end=None):
+        """
+        Yield the jobs to synchronise activities from start to end (now by
+        default), to run in a pipeline calling on_result. Without start,
+        only the activities of the work queue are tried again. The cursor
+        is saved when the block ends without error, unless the listing
+        was incomplete.
+        """
+        planner = None
+        if start is not None:
+            planner = RangePlanner(start=start, end=end or pendulum.now())
+        self.login()
+        self.cursor.begin()
+        self.report = SyncReport(processed=0, uploaded=0, failed=0)
+        self.incomplete = False
+        try:
+            with MappingWriter(self.db) as self.writer, self.queue:
+                yield self.jobs(planner, self.retried())
+        finally:
+            if self.archive is not None:
+                self.archive.flush(self.db)
+        # Only once every listed activity is processed
+        if not self.incomplete:
+            self.cursor.save(self.db)
+        if planner is not None:
+            log.debug(f"Listed Garmin activities in {planner.calls} calls")
+
+    def on_result(self, job: Job):
+        self.report = self.report._replace(processed=self.report.processed + 1)
+        for stage, seconds in job.durations.items():
+            metrics.STAGE_SECONDS.observe(seconds, stage=stage)
+        if self.archive is not None:
+            self.archive.commit(self.db)
+        if job.workout is None:
+            self.report = self.report._replace(failed=self.report.failed + 1)
+            state = self.queue.failed(job.activity, downloaded=job.file is not None)
+            metrics.ACTIVITIES.inc(result="failed")
+            log.error(
+                f"Activity {job.activity['activityId']} not synchronised"
+                + (", see retry-failed" if state == "failed" else ", tried next sync"),
+                extra=activity_fields(job, status="failed"),
+            )
+            return
+        with job.timed("db"):
+            self.negotiator.record(job.activity, job.format, self.db)
+            if self.config["sqlite"]["use"]:
+                log.debug("Adding workout and activity matches in tool database")
+                log.debug(
+                    f"Using Fittrackee ID {job.workout.id}"
+                    f"and Garmin ID {job.activity['activityId']}"
+                )
+                self.writer.add(job.workout.id, job.activity["activityId"])
+            self.index.add(job.activity["activityId"])
+            self.queue.uploaded(job.activity)
+        self.report = self.report._replace(uploaded=self.report.uploaded + 1)
+        metrics.STAGE_SECONDS.observe(job.durations["db"], stage="db")
+        metrics.ACTIVITIES.inc(result="uploaded")
+        metrics.TRANSFERRED_BYTES.inc(job.file.size, direction="upload")
+        fields = activity_fields(job, status="synchronised")
+        log.info(
+            f"Activity {fields['garmin_id']} synchronised as workout "
+            f"{fields['fittrackee_id']} ({fields['format']}, "
+            f"{fields['bytes']} bytes, download {fields['download_seconds']}s,"
+            f" upload {fields['upload_seconds']}s, db {fields['db_seconds']}s)",
+            extra=fields,
+        )
+
+    def run(self, start=None, end=None) -> SyncReport:
+        """
+        Synchronise activities from start to end (now by default), or
+        only the work queue without start.
+        """
+        started = time.monotonic()
+        pipeline, run_options = self._pipeline()
+        try:
+            with self.session(start, end) as jobs:
+                pipeline.run(jobs, self.on_result, **run_options)
+        finally:
+            metrics.record_run(started, self.report.uploaded)
+        return self.report
@@ -0,0 +1,130 @@
+from functools import lru_cache
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.exceptions import NewConnectionError
+
+from garmin_to_fittrackee.logs import Log
+
+log = Log(__name__)
+
+DEFAULT_POOL_SIZE = 10
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    Send requests of a requests session with httpx, to use HTTP/2.
+    Needs httpx with HTTP/2 support (the http2 extra).
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        import httpx
+
+        super().__init__()
+        self.client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(
+                max_connections=pool_size, max_keepalive_connections=pool_size
+            ),
+        )
+
+    def send(
+        self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
+    ):
+        import httpx
+
+        try:
+            r = self.client.request(
+                request.method,
+                request.url,
+                headers=dict(request.headers),
+                content=request.body,
+                timeout=timeout,
+            )
+        except httpx.ConnectTimeout as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request) from e
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request) from e
+        except httpx.ConnectError as e:
+            # Not sent, like a connection error of urllib3
+            raise requests.exceptions.ConnectionError(
+                NewConnectionError(None, str(e)), request=request
+            ) from e
+        except httpx.HTTPError as e:
+            raise requests.exceptions.ConnectionError(e, request=request) from e
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.reason = r.reason_phrase
+        # httpx already decoded the body
+        response.headers = CaseInsensitiveDict(
+            (key, value)
+            for key, value in r.headers.items()
+            if key.lower() != "content-encoding"
+        )
+        response.encoding = r.encoding
+        response.url = request.url
+        response.request = request
+        response._content = r.content
+        response.connection = self
+        return response
+
+    def close(self):
+        self.client.close()
+
+
+def build_adapter(
+    pool_size: int = DEFAULT_POOL_SIZE, transport: str = "requests", max_retries=0
+):
+    if transport == "http2":
+        try:
+            return HTTP2Adapter(pool_size=pool_size)
+        except ImportError:
+            log.warning("httpx with http2 extra isn't installed. Fallback on HTTP/1.1")
+    elif transport != "requests":
+        raise ValueError(f"Unknown transport {transport}")
+    return HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        pool_block=True,
+        max_retries=max_retries,
+    )
+
+
+def configure_session(
+    session: requests.Session,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    transport: str = "requests",
+    max_retries=0,
+):
+    """
+    Mount a pooled adapter sized for the number of workers and keep
+    connections alive with compressed responses.
+    """
+    adapter = build_adapter(
+        pool_size=pool_size, transport=transport, max_retries=max_retries
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+    )
+    return session
+
+
+@lru_cache(maxsize=1)
+def shared_session() -> requests.Session:
+    """
+    Session for requests without authentication (instance configuration).
+    """
+    return configure_session(requests.Session())
+
+
+def configure_garmin(garmin, pool_size: int = DEFAULT_POOL_SIZE):
+    session = getattr(getattr(garmin, "garth", None), "sess", None)
+    if session is None:
+        log.debug("Garmin client doesn't expose a requests session")
+        return
+    # Keep the retry policy set by garth
+    max_retries = session.get_adapter("https://").max_retries
+    configure_session(session, pool_size=pool_size, max_retries=max_retries)
@@ -0,0 +1,19 @@
+import pytest
+import yaml
+
+from garmin_to_fittrackee.context import AppContext
+from garmin_to_fittrackee.database import connect
+
+
+@pytest.fixture
+def ctx(tmp_path):
+    config = {"log": {"level": "INFO"}, "sqlite": {"path": str(tmp_path), "use": True}}
+    (tmp_path / "config.yml").write_text(yaml.dump(config))
+    db = connect(f"{tmp_path}/db.sqlite3")
+    db.execute(
+        "CREATE TABLE "
+        "activities_ids(fittrackee_id VARCHAR(255) UNIQUE,"
+        "garmin_id INTEGER(100) UNIQUE)"
+    )
+    db.close()
+    return AppContext(config_path=str(tmp_path), tmp_path=str(tmp_path))
@@ -0,0 +1,116 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from garmin_to_fittrackee.accounts import Account, AccountRouter, load_accounts
+from garmin_to_fittrackee.pipeline import Job, SyncPipeline
+
+
+class FakeSynchronizer:
+    def __init__(self):
+        self.incomplete = False
+        self.downloaded = []
+        self.results = []
+
+    def download(self, activity, fileformat):
+        self.downloaded.append(activity["activityId"])
+        return SimpleNamespace(size=3)
+
+    def upload(self, activity, file):
+        return SimpleNamespace(id=f"workout-{activity['activityId']}")
+
+    def on_result(self, job):
+        self.results.append(job.activity["activityId"])
+
+
+def stream(first, count):
+    for activity_id in range(first, first + count):
+        yield Job(activity={"activityId": activity_id}, formats=["gpx"])
+
+
+def test_load_accounts(tmp_path):
+    path = tmp_path / "accounts.yml"
+    path.write_text(
+        "accounts:\n"
+        "  - name: alice\n"
+        "    config_path: /srv/alice\n"
+        "    start_year: 2015\n"
+        "  - config_path: /srv/bob\n"
+    )
+    assert load_accounts(path) == [
+        Account(name="alice", config_path="/srv/alice", start_year=2015),
+        Account(name="bob", config_path="/srv/bob"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "accounts:\n  - name: alice\n",
+        "accounts:\n  - config_path: /a/alice\n  - config_path: /b/alice\n",
+    ],
+)
+def test_load_accounts_invalid(tmp_path, content):
+    path = tmp_path / "accounts.yml"
+    path.write_text(content)
+    with pytest.raises(ValueError):
+        load_accounts(path)
+
+
+def test_jobs_take_accounts_in_turn():
+    router = AccountRouter({"alice": FakeSynchronizer(), "bob": FakeSynchronizer()})
+    jobs = router.jobs({"alice": stream(100, 3), "bob": stream(200, 1)})
+    ids = [job.activity["activityId"] for job in jobs]
+    assert ids == [100, 200, 101, 102]
+
+
+def test_results_go_to_the_owner():
+    alice, bob = FakeSynchronizer(), FakeSynchronizer()
+    router = AccountRouter({"alice": alice, "bob": bob})
+    pipeline = SyncPipeline(download=router.download, upload=router.upload)
+    pipeline.run(
+        router.jobs({"alice": stream(100, 5), "bob": stream(200, 5)}),
+        router.on_result,
+    )
+    assert sorted(alice.results) == list(range(100, 105))
+    assert sorted(bob.results) == list(range(200, 205))
+    assert sorted(bob.downloaded) == list(range(200, 205))
+    assert router.owners == {}
+
+
+def test_accounts_sharing_activities():
+    # Two profiles of the same Garmin account, uploading to two instances
+    alice, bob = FakeSynchronizer(), FakeSynchronizer()
+    router = AccountRouter({"alice": alice, "bob": bob})
+    pipeline = SyncPipeline(download=router.download, upload=router.upload)
+    pipeline.run(
+        router.jobs({"alice": stream(100, 5), "bob": stream(100, 5)}),
+        router.on_result,
+    )
+    assert sorted(alice.results) == list(range(100, 105))
+    assert sorted(bob.results) == list(range(100, 105))
+    assert router.owners == {}
+
+
+def test_deadline_leaves_accounts_incomplete():
+    alice, bob = FakeSynchronizer(), FakeSynchronizer()
+    router = AccountRouter({"alice": alice, "bob": bob}, deadline=time.monotonic())
+    jobs = router.jobs({"alice": stream(100, 3), "bob": stream(200, 3)})
+    assert list(jobs) == []
+    assert alice.incomplete
+    assert bob.incomplete
+
+
+def test_listing_error_only_stops_its_account():
+    def broken():
+        yield from stream(100, 1)
+        raise ConnectionError("Garmin is down")
+
+    alice, bob = FakeSynchronizer(), FakeSynchronizer()
+    router = AccountRouter({"alice": alice, "bob": bob})
+    jobs = router.jobs({"alice": broken(), "bob": stream(200, 2)})
+    ids = [job.activity["activityId"] for job in jobs]
+    assert ids == [100, 200, 201]
+    assert alice.incomplete
+    assert not bob.incomplete
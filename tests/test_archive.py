@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from garmin_to_fittrackee import archive as archive_module
+from garmin_to_fittrackee.archive import ActivityArchive
+from garmin_to_fittrackee.database import connect
+
+GPX = b"<gpx>" + b"<trkpt lat='47.2' lon='-1.6'/>" * 200 + b"</gpx>"
+
+
+@pytest.fixture
+def db(tmp_path):
+    return connect(f"{tmp_path}/db.sqlite3")
+
+
+def objects(tmp_path):
+    return [
+        path for path in (tmp_path / "archive" / "objects").rglob("*") if path.is_file()
+    ]
+
+
+def test_store_and_read(tmp_path, db):
+    archive = ActivityArchive.load(tmp_path / "archive", db)
+    entry = archive.store(1, "gpx", GPX)
+    assert entry.size == len(GPX)
+    assert entry.stored < entry.size
+    assert (1, "gpx") in archive
+    assert archive.read(1, "gpx") == GPX
+    assert archive.read(1, "tcx") is None
+    assert archive.formats(1) == ["gpx"]
+
+
+def test_same_content_stored_once(tmp_path, db):
+    archive = ActivityArchive.load(tmp_path / "archive", db)
+    first = archive.store(1, "gpx", GPX)
+    second = archive.store(2, "tcx", GPX)
+    assert first.digest == second.digest
+    assert len(objects(tmp_path)) == 1
+    assert archive.read(2, "tcx") == GPX
+
+
+def test_incompressible_data_stored_raw(tmp_path, db):
+    archive = ActivityArchive.load(tmp_path / "archive", db)
+    data = os.urandom(1024)
+    entry = archive.store(1, "original", data)
+    assert entry.codec == "raw"
+    assert archive.read(1, "original") == data
+
+
+def test_zlib_without_zstandard(tmp_path, db, mocker):
+    mocker.patch.object(archive_module, "zstandard", None)
+    archive = ActivityArchive.load(tmp_path / "archive", db)
+    assert archive.store(1, "gpx", GPX).codec == "zlib"
+    assert archive.read(1, "gpx") == GPX
+
+
+def test_flush_indexes_in_database(tmp_path, db):
+    archive = ActivityArchive.load(tmp_path / "archive", db, batch_size=2)
+    archive.store(1, "gpx", GPX)
+    archive.commit(db)
+    assert db.execute("SELECT COUNT(*) FROM archive").fetchone()[0] == 0
+    archive.store(2, "gpx", GPX + b" ")
+    archive.commit(db)
+    assert db.execute("SELECT COUNT(*) FROM archive").fetchone()[0] == 2
+
+    reloaded = ActivityArchive.load(tmp_path / "archive", db)
+    assert len(reloaded) == 2
+    assert reloaded.garmin_ids() == [1, 2]
+    assert reloaded.read(2, "gpx") == GPX + b" "
+
+
+def test_corrupted_file_is_not_returned(tmp_path, db):
+    archive = ActivityArchive.load(tmp_path / "archive", db)
+    archive.store(1, "gpx", GPX)
+    (path,) = objects(tmp_path)
+    path.write_bytes(b"garbage")
+    assert archive.read(1, "gpx") is None
+
+
+def test_activity_metadata(tmp_path, db):
+    archive = ActivityArchive.load(tmp_path / "archive", db)
+    activity = {
+        "activityId": 1,
+        "activityName": "Morning run",
+        "activityType": {"typeId": 1},
+        "startTimeGMT": "2024-01-01 08:00:00",
+        "distance": 10000.0,
+    }
+    archive.store(1, "gpx", GPX, activity=activity)
+    archive.flush(db)
+    (archived,) = archive.activities(db)
+    assert archived["activityName"] == "Morning run"
+    assert "distance" not in archived
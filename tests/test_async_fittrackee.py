@@ -0,0 +1,129 @@
+import asyncio
+import json
+import threading
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from garmin_to_fittrackee.retry import CircuitBreaker, RetryPolicy, TokenBucket
+
+httpx = pytest.importorskip("httpx")
+
+from garmin_to_fittrackee.async_fittrackee import AsyncFittrackee  # noqa: E402
+
+all_workouts = Path(f"{Path().resolve()}/tests/files/all_workouts.json").read_text()
+post_workout_responses = Path(
+    f"{Path().resolve()}/tests/files/post_gpx_responses.json"
+).read_text()
+
+
+def client(handler, retries: int = 0):
+    fittrackee = mock.Mock()
+    fittrackee.api_url = "https://dev.localhost.tld/api"
+    fittrackee.access_token.return_value = "queeL7pah9tieniexeisoo5kux3ohsa"
+    return AsyncFittrackee(
+        fittrackee,
+        policy=RetryPolicy(retries=retries, backoff=0),
+        bucket=TokenBucket(rate=0, capacity=1),
+        breaker=CircuitBreaker(),
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def run(coroutine_function):
+    async def main(fittrackee):
+        async with fittrackee:
+            return await coroutine_function(fittrackee)
+
+    return main
+
+
+def test_upload_workout():
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(201, text=post_workout_responses)
+
+    fittrackee = client(handler)
+    workout = asyncio.run(
+        run(lambda f: f.upload_workout(b"<gpx/>", "1.gpx", sport_id=1))(fittrackee)
+    )
+    assert type(workout).__name__ == "Workout"
+    assert workout.present_in_garmin is True
+    assert requests[0].headers["Authorization"].startswith("Bearer ")
+    assert b'filename="1.gpx"' in requests[0].content
+
+
+def test_upload_workout_retried_on_unavailable():
+    responses = [httpx.Response(503), httpx.Response(201, text=post_workout_responses)]
+    fittrackee = client(lambda request: responses.pop(0), retries=2)
+    workout = asyncio.run(
+        run(lambda f: f.upload_workout(b"<gpx/>", "1.gpx", sport_id=1))(fittrackee)
+    )
+    assert workout is not None
+    assert fittrackee.retries == 1
+
+
+def test_upload_workout_refresh_token_on_unauthorized():
+    responses = [httpx.Response(401), httpx.Response(201, text=post_workout_responses)]
+    fittrackee = client(lambda request: responses.pop(0))
+    workout = asyncio.run(
+        run(lambda f: f.upload_workout(b"<gpx/>", "1.gpx", sport_id=1))(fittrackee)
+    )
+    assert workout is not None
+    fittrackee.fittrackee.access_token.assert_any_call(force_refresh=True)
+
+
+def test_token_not_fetched_on_event_loop():
+    threads = []
+
+    def access_token(force_refresh=False):
+        threads.append(threading.current_thread())
+        return "queeL7pah9tieniexeisoo5kux3ohsa"
+
+    fittrackee = client(
+        lambda request: httpx.Response(201, text=post_workout_responses)
+    )
+    fittrackee.fittrackee.access_token.side_effect = access_token
+    asyncio.run(
+        run(lambda f: f.upload_workout(b"<gpx/>", "1.gpx", sport_id=1))(fittrackee)
+    )
+    assert threads
+    assert threading.main_thread() not in threads
+
+
+def test_get_last_workout():
+    fittrackee = client(lambda request: httpx.Response(200, text=all_workouts))
+    workout = asyncio.run(run(lambda f: f.get_last_workout())(fittrackee))
+    assert type(workout).__name__ == "Workout"
+
+
+def test_get_workouts_http_error():
+    fittrackee = client(lambda request: httpx.Response(500))
+    assert asyncio.run(run(lambda f: f.get_workouts())(fittrackee)) is None
+
+
+def test_delete_workout():
+    fittrackee = client(lambda request: httpx.Response(204))
+    assert asyncio.run(run(lambda f: f.delete_workout("abc"))(fittrackee)) is True
+
+
+def test_delete_workout_connection_error():
+    def handler(request):
+        raise httpx.ConnectError("refused")
+
+    fittrackee = client(handler)
+    assert asyncio.run(run(lambda f: f.delete_workout("abc"))(fittrackee)) is False
+
+
+def test_get_workouts_params():
+    params = []
+
+    def handler(request):
+        params.append(dict(request.url.params))
+        return httpx.Response(200, text=json.dumps({"data": {"workouts": []}}))
+
+    asyncio.run(run(lambda f: f.get_workouts(page=3, per_page=10))(client(handler)))
+    assert params == [{"per_page": "10", "page": "3"}]
@@ -0,0 +1,49 @@
+import io
+
+import garminconnect
+import yaml
+
+from benchmarks.fakes import (
+    FakeFittrackee,
+    FakeGarmin,
+    date_range,
+    synthetic_activities,
+)
+from benchmarks.sync import write_config
+from garmin_to_fittrackee.fittrackee import Fittrackee
+from garmin_to_fittrackee.retry import Requester, TokenBucket
+
+
+def test_fake_garmin_filters_by_date():
+    start, end = date_range(years=1)
+    garmin = FakeGarmin(synthetic_activities(100, start, end))
+    first_day = garmin.dates[0]
+    activities = garmin.get_activities_by_date(first_day, first_day)
+    assert activities
+    assert all(a["startTimeGMT"].startswith(first_day) for a in activities)
+    assert len(garmin.get_activities_by_date("1990-01-01", "2100-01-01")) == 100
+    payload = garmin.download_activity(
+        activities[0]["activityId"], garminconnect.Garmin.ActivityDownloadFormat.GPX
+    )
+    assert garmin.bytes_sent == len(payload)
+    assert garmin.calls["get_activities_by_date"] == 2
+
+
+def test_fake_fittrackee_with_client(tmp_path, monkeypatch):
+    monkeypatch.setenv("OAUTHLIB_INSECURE_TRANSPORT", "1")
+    with FakeFittrackee() as api:
+        write_config(tmp_path, api.url)
+        assert yaml.safe_load((tmp_path / "fittrackee.yml").read_text())
+        fittrackee = Fittrackee(
+            str(tmp_path), requester=Requester(bucket=TokenBucket(rate=0, capacity=1))
+        )
+        assert not fittrackee.is_workout_present()
+        workout = fittrackee.upload_workout(
+            io.BytesIO(b"<gpx/>"), sport_id=1, filename="1.gpx"
+        )
+        assert [w.id for w in fittrackee.get_all_workouts()] == [workout.id]
+        assert fittrackee.remove_workout(workout.id)
+        stats = api.stats()
+    assert stats["requests"]["POST /api/workouts"] == 1
+    assert stats["requests"]["DELETE /api/workouts/{id}"] == 1
+    assert stats["workouts"] == 0
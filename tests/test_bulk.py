@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+from garmin_to_fittrackee.bulk import BulkDeleter, Progress
+
+
+def test_bulk_delete_every_workout():
+    deleted = []
+    callers = set()
+
+    def on_deleted(workout_id):
+        callers.add(threading.current_thread())
+        deleted.append(workout_id)
+
+    deleter = BulkDeleter(delete=lambda workout_id: True, workers=4)
+    progress = deleter.run([f"workout-{i}" for i in range(100)], on_deleted)
+    assert sorted(deleted) == sorted(f"workout-{i}" for i in range(100))
+    assert progress.done == 100
+    assert callers == {threading.current_thread()}
+
+
+def test_bulk_delete_failures():
+    def delete(workout_id):
+        if workout_id == 2:
+            raise RuntimeError("boom")
+        return workout_id != 3
+
+    deleted = []
+    progress = BulkDeleter(delete=delete, workers=2).run([1, 2, 3, 4], deleted.append)
+    assert sorted(deleted) == [1, 4]
+    assert progress.failed == 2
+
+
+def test_bulk_delete_nothing():
+    progress = BulkDeleter(delete=lambda workout_id: True).run([])
+    assert progress.done == 0
+
+
+def test_bulk_delete_needs_workers():
+    with pytest.raises(ValueError):
+        BulkDeleter(delete=None, workers=0)
+
+
+def test_progress_eta(mocker):
+    monotonic = mocker.patch("garmin_to_fittrackee.bulk.time.monotonic")
+    monotonic.return_value = 0
+    progress = Progress(total=10, interval=3600)
+    monotonic.return_value = 2
+    progress.update()
+    progress.update()
+    assert progress.throughput() == 1
+    assert progress.eta() == 8
+
+
+def test_progress_unknown_eta():
+    assert Progress(total=10).eta() is None
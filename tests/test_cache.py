@@ -0,0 +1,70 @@
+import pytest
+import requests
+import requests_mock
+
+from garmin_to_fittrackee.cache import MetadataCache
+
+URL = "https://dev.localhost.tld/api/config"
+
+
+def fetch(headers):
+    return requests.get(URL, headers=headers)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return MetadataCache(tmp_path, ttl=60)
+
+
+def test_fresh_response_from_cache(cache):
+    with requests_mock.Mocker() as m:
+        m.get(URL, json={"version": "1"})
+        assert cache.get(URL, fetch) == {"version": "1"}
+        assert cache.get(URL, fetch) == {"version": "1"}
+        assert m.call_count == 1
+
+
+def test_shared_between_instances(tmp_path, cache):
+    with requests_mock.Mocker() as m:
+        m.get(URL, json={"version": "1"})
+        cache.get(URL, fetch)
+        assert MetadataCache(tmp_path).get(URL, fetch) == {"version": "1"}
+        assert m.call_count == 1
+
+
+def test_revalidated_with_etag(cache):
+    with requests_mock.Mocker() as m:
+        m.get(URL, json={"version": "1"}, headers={"ETag": '"v1"'})
+        cache.get(URL, fetch)
+        m.get(URL, status_code=304)
+        assert cache.get(URL, fetch, max_age=0) == {"version": "1"}
+        assert m.last_request.headers["If-None-Match"] == '"v1"'
+        # Revalidated, fresh again
+        assert cache.get(URL, fetch) == {"version": "1"}
+        assert m.call_count == 2
+
+
+def test_expired_response_replaced(tmp_path):
+    cache = MetadataCache(tmp_path, ttl=0)
+    with requests_mock.Mocker() as m:
+        m.get(URL, json={"version": "1"})
+        cache.get(URL, fetch)
+        m.get(URL, json={"version": "2"})
+        assert cache.get(URL, fetch) == {"version": "2"}
+
+
+def test_stale_response_when_unreachable(cache):
+    with requests_mock.Mocker() as m:
+        m.get(URL, json={"version": "1"})
+        cache.get(URL, fetch)
+        m.get(URL, exc=requests.exceptions.ConnectionError)
+        assert cache.get(URL, fetch, max_age=0) == {"version": "1"}
+        m.get(URL, status_code=500)
+        assert cache.get(URL, fetch, max_age=0) == {"version": "1"}
+
+
+def test_error_without_cached_response(cache):
+    with requests_mock.Mocker() as m:
+        m.get(URL, status_code=500)
+        with pytest.raises(requests.HTTPError):
+            cache.get(URL, fetch)
@@ -0,0 +1,68 @@
+import os
+import signal
+
+import pytest
+
+from garmin_to_fittrackee.daemon import Daemon, PollScheduler
+
+
+def test_scheduler_backs_off_when_idle():
+    scheduler = PollScheduler(min_interval=10, max_interval=50, factor=2)
+    assert [scheduler.next(0) for _ in range(4)] == [20, 40, 50, 50]
+    assert scheduler.next(3) == 10
+
+
+def test_scheduler_checks_intervals():
+    with pytest.raises(ValueError):
+        PollScheduler(min_interval=0)
+    with pytest.raises(ValueError):
+        PollScheduler(min_interval=10, max_interval=5)
+
+
+def test_daemon_polls_until_stopped(mocker):
+    found = iter([2, 0, 0])
+    intervals = []
+
+    def poll():
+        value = next(found)
+        if daemon.polls == 3:
+            daemon.stop()
+        return value
+
+    daemon = Daemon(poll, PollScheduler(min_interval=0.01, max_interval=0.04))
+    wait = mocker.patch.object(daemon.stopping, "wait", side_effect=intervals.append)
+    daemon.run()
+    assert daemon.polls == 3
+    assert wait.call_count == 2
+    assert intervals == [0.01, 0.02]
+
+
+def test_daemon_survives_poll_errors():
+    def poll():
+        if daemon.polls == 2:
+            daemon.stop()
+            return 0
+        raise RuntimeError("Garmin is down")
+
+    daemon = Daemon(poll, PollScheduler(min_interval=0.001, max_interval=0.001))
+    daemon.run()
+    assert daemon.polls == 2
+
+
+def test_daemon_stops_on_sigterm():
+    def poll():
+        os.kill(os.getpid(), signal.SIGTERM)
+        return 1
+
+    previous = signal.getsignal(signal.SIGTERM)
+    daemon = Daemon(poll, PollScheduler(min_interval=60))
+    daemon.run()
+    assert daemon.polls == 1
+    assert signal.getsignal(signal.SIGTERM) is previous
+
+
+def test_second_signal_interrupts():
+    daemon = Daemon(lambda: 0)
+    daemon.stop(signal.SIGTERM)
+    with pytest.raises(KeyboardInterrupt):
+        daemon.stop(signal.SIGTERM)
@@ -0,0 +1,165 @@
+import sqlite3
+
+import pytest
+
+from garmin_to_fittrackee.database import (
+    ActivityIndex,
+    MappingWriter,
+    SyncCursor,
+    WorkQueue,
+    connect,
+)
+
+
+@pytest.fixture
+def db():
+    db = sqlite3.connect(":memory:")
+    db.execute(
+        "CREATE TABLE "
+        "activities_ids(fittrackee_id VARCHAR(255) UNIQUE,"
+        "garmin_id INTEGER(100) UNIQUE)"
+    )
+    db.executemany(
+        "INSERT INTO activities_ids (fittrackee_id, garmin_id) VALUES(?, ?)",
+        [("Ab6jry6Gbntn4Z33tEttgj", 12345), ("eechieshocifah4ohquaiphiThiF9io", 67)],
+    )
+    db.commit()
+    return db
+
+
+def test_activity_index_load(db):
+    index = ActivityIndex.load(db)
+    assert len(index) == 2
+    assert 12345 in index
+    assert "67" in index
+    assert 1 not in index
+
+
+def test_activity_index_filter(db):
+    index = ActivityIndex.load(db)
+    page = [{"activityId": 12345}, {"activityId": 8}, {"activityId": 67}]
+    assert index.filter(page) == [{"activityId": 8}]
+
+
+def test_activity_index_add(db):
+    index = ActivityIndex.load(db)
+    index.add(8)
+    assert 8 in index
+    index.discard(8)
+    assert 8 not in index
+
+
+def count_rows(db):
+    return db.execute("SELECT COUNT(*) FROM activities_ids").fetchone()[0]
+
+
+def test_mapping_writer_batches_rows(db):
+    writer = MappingWriter(db, batch_size=3, interval=3600)
+    writer.add("a", 1)
+    writer.add("b", 2)
+    assert count_rows(db) == 2
+    writer.add("c", 3)
+    assert count_rows(db) == 5
+    assert writer.rows == []
+
+
+def test_mapping_writer_flushes_on_interval(db):
+    writer = MappingWriter(db, batch_size=100, interval=0)
+    writer.add("a", 1)
+    assert count_rows(db) == 3
+
+
+def test_mapping_writer_flushes_on_interrupt(db):
+    with pytest.raises(KeyboardInterrupt), MappingWriter(db, interval=3600) as writer:
+        writer.add("a", 1)
+        raise KeyboardInterrupt
+    assert count_rows(db) == 3
+
+
+def test_mapping_writer_ignores_duplicates(db):
+    with MappingWriter(db) as writer:
+        writer.add("a", 12345)
+        writer.add("b", 2)
+    assert count_rows(db) == 3
+
+
+def test_connect_uses_wal(tmp_path):
+    db = connect(f"{tmp_path}/db.sqlite3")
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_mapping_writer_removes_rows(db):
+    with MappingWriter(db) as writer:
+        writer.remove("Ab6jry6Gbntn4Z33tEttgj")
+        writer.remove("unknown")
+    assert count_rows(db) == 1
+
+
+def activity(garmin_id, start_time):
+    return {"activityId": garmin_id, "startTimeGMT": start_time}
+
+
+def test_sync_cursor_empty(db):
+    cursor = SyncCursor.load(db)
+    assert cursor.start_time is None
+    cursor.save(db)
+    assert SyncCursor.load(db).start_time is None
+
+
+def test_sync_cursor_moves_to_newest(db):
+    cursor = SyncCursor.load(db)
+    cursor.seen(activity(2, "2024-01-02 08:00:00"))
+    cursor.seen(activity(3, "2024-01-03 08:00:00"))
+    cursor.seen(activity(1, "2024-01-01 08:00:00"))
+    cursor.seen({"activityId": 4, "startTimeGMT": None})
+    cursor.save(db)
+    cursor = SyncCursor.load(db)
+    assert (cursor.start_time, cursor.garmin_id) == ("2024-01-03 08:00:00", 3)
+
+
+def test_sync_cursor_clear(db):
+    cursor = SyncCursor.load(db)
+    cursor.seen(activity(1, "2024-01-01 08:00:00"))
+    cursor.save(db)
+    SyncCursor.clear(db)
+    assert SyncCursor.load(db).start_time is None
+
+
+def test_work_queue_states(db):
+    queue = WorkQueue.load(db, max_attempts=2)
+    for garmin_id in [3, 1, 2]:
+        queue.plan(activity(garmin_id, f"2024-01-0{garmin_id} 08:00:00"))
+    queue.uploaded(activity(1, "2024-01-01 08:00:00"))
+    assert queue.failed(activity(2, "2024-01-02 08:00:00"), downloaded=True) == (
+        "downloaded"
+    )
+    assert queue.failed(activity(3, "2024-01-03 08:00:00")) == "pending"
+    assert queue.failed(activity(3, "2024-01-03 08:00:00")) == "failed"
+    # Planning again doesn't reset an activity
+    queue.plan(activity(3, "2024-01-03 08:00:00"))
+    queue.flush()
+
+    queue = WorkQueue.load(db)
+    assert queue.counts() == {"pending": 0, "downloaded": 1, "uploaded": 1, "failed": 1}
+    assert [retried["activityId"] for retried in queue.retried()] == [2]
+
+
+def test_work_queue_batches_rows(db):
+    queue = WorkQueue.load(db, batch_size=2, interval=3600)
+    queue.plan(activity(1, "2024-01-01 08:00:00"))
+    queue.plan(activity(2, "2024-01-02 08:00:00"))
+    # Planning never writes, it may run on the listing thread
+    assert db.execute("SELECT COUNT(*) FROM work_queue").fetchone() == (0,)
+    queue.uploaded(activity(1, "2024-01-01 08:00:00"))
+    assert db.execute("SELECT COUNT(*) FROM work_queue").fetchone() == (2,)
+
+
+def test_work_queue_retry_failed(db):
+    with WorkQueue.load(db, max_attempts=1) as queue:
+        queue.failed(activity(1, "2024-01-01 08:00:00"))
+    assert WorkQueue.retry_failed(db) == 1
+    queue = WorkQueue.load(db)
+    assert queue.states == {1: ("pending", 0)}
+    WorkQueue.clear(db)
+    assert WorkQueue.load(db).states == {}
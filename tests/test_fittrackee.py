@@ -1,3 +1,5 @@
+import io
+import json
 from pathlib import Path
 from unittest import mock
 
@@ -8,7 +10,9 @@ import requests_mock
 import typer
 import yaml
 
-from garmin_to_fittrackee.fittrackee import Fittrackee
+from garmin_to_fittrackee.cache import MetadataCache
+from garmin_to_fittrackee.fittrackee import Fittrackee, IncompleteListingError, base_url
+from garmin_to_fittrackee.retry import Requester, TokenBucket
 
 config_fittrackee_yaml = Path(f"{Path().resolve()}/tests/files/config_fittrackee.yaml")
 
@@ -22,17 +26,31 @@ config_fittrackee_yaml = yaml.dump(data)
 
 @pytest.fixture
 def fittrackee(mocker):
+    mocker.patch("garmin_to_fittrackee.retry.time.sleep")
     with mock.patch("pathlib.Path.is_file", return_value=True):
         mocker.patch(
             "pathlib.Path.open", mocker.mock_open(read_data=config_fittrackee_yaml)
         )
-        return Fittrackee("config/")
+        return Fittrackee(
+            "config/", requester=Requester(bucket=TokenBucket(rate=0, capacity=1))
+        )
 
 
 def test_fittrackee(fittrackee):
     assert (fittrackee.host) == "dev.localhost.tld"
 
 
+@pytest.mark.parametrize(
+    "host,expected",
+    [
+        ("fittrackee.example.com", "https://fittrackee.example.com"),
+        ("http://127.0.0.1:5000/", "http://127.0.0.1:5000"),
+    ],
+)
+def test_base_url(host, expected):
+    assert base_url(host) == expected
+
+
 def test_fittrackee_first_run(mocker):
     mocker.patch("pathlib.Path.is_file", return_value=False)
     mocker.patch("pathlib.Path.open", mocker.mock_open())
@@ -89,6 +107,63 @@ def test_get_all_workouts(fittrackee):
         assert type(workouts[1]).__name__ == "Workout"
 
 
+def workouts_page(page: int, pages: int, per_page: int = 2):
+    workouts = json.loads(all_workouts)
+    for index, workout in enumerate(workouts["data"]["workouts"]):
+        workout["id"] = f"{page}-{index}"
+    workouts["pagination"].update(
+        {"page": page, "pages": pages, "has_next": page < pages}
+    )
+    return workouts
+
+
+def paginated_workouts(pages: int):
+    def callback(request, context):
+        page = int(request.qs["page"][0])
+        return workouts_page(page, pages)
+
+    return callback
+
+
+def test_get_all_workouts_every_page(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.get("https://dev.localhost.tld/api/workouts", json=paginated_workouts(7))
+        workouts = fittrackee.get_all_workouts()
+        assert len(workouts) == 14
+        assert [workout.id for workout in workouts][::2] == [
+            f"{page}-0" for page in range(1, 8)
+        ]
+        assert m.request_history[0].qs["per_page"] == ["100"]
+
+
+def test_get_all_workouts_page_error(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.get("https://dev.localhost.tld/api/workouts", json=paginated_workouts(5))
+        m.get(
+            "https://dev.localhost.tld/api/workouts?page=3",
+            status_code=401,
+        )
+        assert fittrackee.get_all_workouts() is None
+
+
+def test_iter_workouts(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.get("https://dev.localhost.tld/api/workouts", json=paginated_workouts(3))
+        workouts = fittrackee.iter_workouts(per_page=2, workers=2)
+        assert next(workouts).id == "1-0"
+        assert len(list(workouts)) == 5
+
+
+def test_iter_workouts_page_error(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.get("https://dev.localhost.tld/api/workouts", json=paginated_workouts(5))
+        m.get("https://dev.localhost.tld/api/workouts?page=3", status_code=401)
+        workouts = []
+        with pytest.raises(IncompleteListingError):
+            workouts.extend(fittrackee.iter_workouts(per_page=2, workers=2))
+        assert len(workouts) == 4
+
+
 def test_get_all_workouts_http_error(fittrackee):
     with requests_mock.Mocker() as m:
         m.get("https://dev.localhost.tld/api/workouts", status_code=401)
@@ -188,6 +263,33 @@ def test_delete_workout(fittrackee):
         assert workout is None
 
 
+def test_remove_workout(fittrackee):
+    workout_id = "eechieshocifah4ohquaiphiThiF9io"
+    with requests_mock.Mocker() as m:
+        m.delete(
+            f"https://dev.localhost.tld/api/workouts/{workout_id}", status_code=204
+        )
+        assert fittrackee.remove_workout(workout_id=workout_id) is True
+
+
+def test_remove_workout_already_deleted(fittrackee):
+    workout_id = "eechieshocifah4ohquaiphiThiF9io"
+    with requests_mock.Mocker() as m:
+        m.delete(
+            f"https://dev.localhost.tld/api/workouts/{workout_id}", status_code=404
+        )
+        assert fittrackee.remove_workout(workout_id=workout_id) is True
+
+
+def test_remove_workout_http_error(fittrackee):
+    workout_id = "eechieshocifah4ohquaiphiThiF9io"
+    with requests_mock.Mocker() as m:
+        m.delete(
+            f"https://dev.localhost.tld/api/workouts/{workout_id}", status_code=403
+        )
+        assert fittrackee.remove_workout(workout_id=workout_id) is False
+
+
 def test_delete_workout_http_error(fittrackee):
     workout_id = "eechieshocifah4ohquaiphiThiF9io"
     with requests_mock.Mocker() as m:
@@ -261,6 +363,74 @@ def test_upload_connection_error(mocker, fittrackee):
         assert workout is None
 
 
+def test_upload_workout_file_object(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.post(
+            "https://dev.localhost.tld/api/workouts",
+            text=post_workout_responses,
+            status_code=201,
+        )
+        workout = fittrackee.upload_workout(
+            file=io.BytesIO(saint_herblain_gpx.encode()),
+            filename="Saint-herblain.gpx",
+            sport_id=1,
+        )
+        assert type(workout).__name__ == "Workout"
+        assert b'filename="Saint-herblain.gpx"' in m.last_request.body
+
+
+def test_upload_workout_file_object_without_filename(fittrackee):
+    workout = fittrackee.upload_workout(
+        file=io.BytesIO(saint_herblain_gpx.encode()), sport_id=1
+    )
+    assert workout is None
+
+
+def test_upload_workout_retry_on_unavailable(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.post(
+            "https://dev.localhost.tld/api/workouts",
+            [
+                {"status_code": 503, "headers": {"Retry-After": "1"}},
+                {"text": post_workout_responses, "status_code": 201},
+            ],
+        )
+        workout = fittrackee.upload_workout(
+            file=io.BytesIO(saint_herblain_gpx.encode()),
+            filename="Saint-herblain.gpx",
+            sport_id=1,
+        )
+        assert type(workout).__name__ == "Workout"
+        assert m.call_count == 2
+        assert b"<gpx" in m.last_request.body
+
+
+def test_upload_workout_no_retry_on_bad_gateway(fittrackee):
+    with requests_mock.Mocker() as m:
+        m.post("https://dev.localhost.tld/api/workouts", status_code=502)
+        workout = fittrackee.upload_workout(
+            file=io.BytesIO(saint_herblain_gpx.encode()),
+            filename="Saint-herblain.gpx",
+            sport_id=1,
+        )
+        assert workout is None
+        assert m.call_count == 1
+
+
+def test_access_token(fittrackee):
+    assert fittrackee.access_token() == fittrackee.tokens["access_token"]
+
+
+def test_access_token_refresh(mocker, fittrackee):
+    save = mocker.patch("pathlib.Path.open", mocker.mock_open())
+    refreshed = dict(fittrackee.tokens, access_token="Ohsh9jau6ohdeethahp6te1eehivahB")
+    mocker.patch(
+        "requests_oauthlib.OAuth2Session.refresh_token", return_value=refreshed
+    )
+    assert fittrackee.access_token(force_refresh=True) == refreshed["access_token"]
+    save.assert_called_once()
+
+
 # def test_fittrackee_token_update(fittrackee):
 #    token = {
 #        "access_token": "hoh2eu6eikee6Aisi1beez5ue5FieJohn4oeyoo3re2maic7Mee4Phohl",
@@ -332,3 +502,50 @@ def test_is_instance_is_supported_bad_version():
         )
         is_supported = Fittrackee.is_instance_is_supported(host="dev.localhost.tld")
         assert is_supported is False
+
+
+def test_is_instance_is_supported_cached(tmp_path):
+    cache = MetadataCache(tmp_path)
+    with requests_mock.Mocker() as m:
+        m.get(
+            "https://dev.localhost.tld/api/config",
+            text=get_instance_config_response,
+            status_code=200,
+        )
+        assert Fittrackee.is_instance_is_supported("dev.localhost.tld", cache=cache)
+        assert Fittrackee.is_instance_is_supported("dev.localhost.tld", cache=cache)
+        assert m.call_count == 1
+
+
+def test_is_instance_is_supported_refreshed_when_outdated(tmp_path):
+    cache = MetadataCache(tmp_path)
+    with requests_mock.Mocker() as m:
+        m.get(
+            "https://dev.localhost.tld/api/config",
+            text=get_instance_config_bad_response,
+            status_code=200,
+        )
+        assert not Fittrackee.is_instance_is_supported("dev.localhost.tld", cache=cache)
+        # Upgraded since
+        m.get(
+            "https://dev.localhost.tld/api/config",
+            text=get_instance_config_response,
+            status_code=200,
+        )
+        assert Fittrackee.is_instance_is_supported("dev.localhost.tld", cache=cache)
+
+
+def test_get_sports_cached(fittrackee, tmp_path, mocker):
+    # The fixture mocks Path.open, needed by the cache
+    mocker.stopall()
+    cache = MetadataCache(tmp_path)
+    with requests_mock.Mocker() as m:
+        m.get(
+            "https://dev.localhost.tld/api/sports",
+            text=get_sports_json,
+            status_code=200,
+        )
+        fittrackee.get_sports(cache=cache)
+        sports = fittrackee.get_sports(cache=cache)
+        assert sports["data"]["sports"][0]["label"] == "Cycling (Sport)"
+        assert m.call_count == 1
@@ -0,0 +1,47 @@
+import sqlite3
+
+from garmin_to_fittrackee.formats import FormatNegotiator
+
+
+def activity(type_id: int = 1, has_polyline: bool = True):
+    return {
+        "activityId": 12345,
+        "activityType": {"typeId": type_id},
+        "hasPolyline": has_polyline,
+    }
+
+
+def test_candidates_with_gps():
+    negotiator = FormatNegotiator()
+    assert negotiator.candidates(activity()) == ["original", "gpx", "tcx"]
+
+
+def test_candidates_without_gps():
+    negotiator = FormatNegotiator()
+    assert negotiator.candidates(activity(has_polyline=False)) == ["original", "tcx"]
+
+
+def test_candidates_never_kml_or_csv():
+    negotiator = FormatNegotiator()
+    assert "kml" not in negotiator.candidates(activity())
+    assert "csv" not in negotiator.candidates(activity())
+
+
+def test_has_gps_from_start_position():
+    assert FormatNegotiator.has_gps({"startLatitude": 47.2}) is True
+    assert FormatNegotiator.has_gps({"startLatitude": None}) is False
+
+
+def test_preferred_format_first():
+    negotiator = FormatNegotiator()
+    negotiator.record(activity(type_id=10), "gpx")
+    assert negotiator.candidates(activity(type_id=10)) == ["gpx", "original", "tcx"]
+    assert negotiator.candidates(activity(type_id=1))[0] == "original"
+
+
+def test_preferred_format_persisted():
+    db = sqlite3.connect(":memory:")
+    negotiator = FormatNegotiator.load(db)
+    negotiator.record(activity(type_id=10), "tcx", db)
+    negotiator = FormatNegotiator.load(db)
+    assert negotiator.preferences == {10: "tcx"}
@@ -1,6 +1,18 @@
+import json
+import logging
+from logging.handlers import QueueHandler
 from pathlib import Path
 
-from garmin_to_fittrackee.logs import Log
+import pytest
+
+from garmin_to_fittrackee.logs import (
+    JSON_FORMAT,
+    Log,
+    build_handler,
+    configure_logging,
+    load_log_config,
+    stop_listener,
+)
 
 config_yaml = Path(f"{Path().resolve()}/tests/files/config.yml").read_text()
 
@@ -38,3 +50,57 @@ def test_log_without_args_without_config(mocker):
 def test_log_info():
     log = Log(name="test", level="INFO")
     assert log.level == 0
+
+
+@pytest.fixture
+def fresh_logging():
+    load_log_config.cache_clear()
+    yield
+    load_log_config.cache_clear()
+    configure_logging(use_queue=False, force=True)
+
+
+def test_log_config_read_once(mocker, fresh_logging):
+    mocker.patch("pathlib.Path.exists", return_value=True)
+    mocker.patch("pathlib.Path.is_file", return_value=True)
+    opened = mocker.patch("pathlib.Path.open", mocker.mock_open(read_data=config_yaml))
+    configure_logging(use_queue=False, force=True)
+    configure_logging(use_queue=False, force=True)
+    assert load_log_config() == {"level": "DEBUG"}
+    assert opened.call_count == 1
+
+
+def test_log_through_queue(fresh_logging):
+    records = []
+
+    class ListHandler(logging.Handler):
+        def emit(self, record):
+            records.append(record.getMessage())
+
+    configure_logging(handler=ListHandler(), use_queue=True, force=True)
+    root = logging.getLogger()
+    assert any(isinstance(h, QueueHandler) for h in root.handlers)
+    Log(name="test").warning("from a worker")
+    stop_listener()
+    assert records == ["from a worker"]
+
+
+def test_log_format(fresh_logging):
+    configure_logging(fmt="%(levelname)s %(message)s", use_queue=False, force=True)
+    handler = [
+        h for h in logging.getLogger().handlers if hasattr(h, "_garmin_to_fittrackee")
+    ]
+    assert len(handler) == 1
+    record = logging.LogRecord("test", logging.INFO, "", 0, "hello", None, None)
+    assert handler[0].format(record) == "INFO hello"
+
+
+def test_json_format():
+    handler = build_handler(JSON_FORMAT)
+    record = logging.LogRecord("test", logging.INFO, "", 0, "hello %s", ("you",), None)
+    record.garmin_id = 42
+    data = json.loads(handler.format(record))
+    assert data["message"] == "hello you"
+    assert data["level"] == "INFO"
+    assert data["garmin_id"] == 42
+    assert "args" not in data
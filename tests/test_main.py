@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+from typer.testing import CliRunner
+
+from garmin_to_fittrackee import main
+from garmin_to_fittrackee.database import SyncCursor
+from garmin_to_fittrackee.fittrackee import IncompleteListingError
+
+
+@pytest.fixture
+def fittrackee(mocker, ctx):
+    mocker.patch.object(main, "ctx", ctx)
+    mocker.patch.object(main, "config_exists", return_value=True)
+    return mocker.patch("garmin_to_fittrackee.fittrackee.Fittrackee").return_value
+
+
+def listing(count, complete=True):
+    yield from (SimpleNamespace(id=f"workout-{i}") for i in range(count))
+    if not complete:
+        raise IncompleteListingError(f"Workouts listing stopped after {count}")
+
+
+def test_reset_deletes_every_workout(ctx, fittrackee):
+    fittrackee.iter_workouts.return_value = listing(3)
+    result = CliRunner().invoke(main.app, ["reset", "--force"])
+    assert result.exit_code == 0
+    assert fittrackee.remove_workout.call_count == 3
+
+
+def test_reset_aborts_on_incomplete_listing(ctx, fittrackee):
+    cursor = SyncCursor.load(ctx.db)
+    cursor.seen({"activityId": 1, "startTimeGMT": "2024-01-01 08:00:00"})
+    cursor.save(ctx.db)
+    fittrackee.iter_workouts.return_value = listing(2, complete=False)
+    result = CliRunner().invoke(main.app, ["reset", "--force"])
+    assert result.exit_code == 1
+    fittrackee.remove_workout.assert_not_called()
+    assert SyncCursor.load(ctx.db).garmin_id == 1
@@ -0,0 +1,90 @@
+import urllib.request
+
+import pytest
+
+from garmin_to_fittrackee.metrics import CONTENT_TYPE, Registry, endpoint
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_render(registry):
+    counter = registry.counter("activities", "Activities by result", ("result",))
+    counter.inc(result="uploaded")
+    counter.inc(2, result="uploaded")
+    counter.inc(result="failed")
+    assert counter.get(result="uploaded") == 3
+    assert registry.render() == (
+        "# TYPE activities counter\n"
+        "# HELP activities Activities by result\n"
+        'activities_total{result="uploaded"} 3\n'
+        'activities_total{result="failed"} 1\n'
+        "# EOF\n"
+    )
+
+
+def test_counter_needs_its_labels(registry):
+    counter = registry.counter("activities", "Activities by result", ("result",))
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+def test_metric_registered_once(registry):
+    registry.gauge("last_run", "Last run")
+    with pytest.raises(ValueError):
+        registry.gauge("last_run", "Last run")
+
+
+def test_histogram_buckets(registry):
+    histogram = registry.histogram("latency", "Latency", buckets=(0.1, 1.0))
+    for value in [0.05, 0.5, 5.0]:
+        histogram.observe(value)
+    assert histogram.count() == 3
+    lines = registry.render().splitlines()
+    assert 'latency_bucket{le="0.1"} 1' in lines
+    assert 'latency_bucket{le="1.0"} 2' in lines
+    assert 'latency_bucket{le="+Inf"} 3' in lines
+    assert "latency_count 3" in lines
+    assert "latency_sum 5.55" in lines
+
+
+def test_labels_escaped(registry):
+    counter = registry.counter("errors", "Errors", ("reason",))
+    counter.inc(reason='bad "quote"')
+    assert 'errors_total{reason="bad \\"quote\\""} 1' in registry.render()
+
+
+def test_write_textfile(registry, tmp_path):
+    registry.gauge("last_run", "Last run").set(12.5)
+    path = tmp_path / "garmin_to_fittrackee.prom"
+    registry.write_textfile(str(path))
+    assert "last_run 12.5" in path.read_text()
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_serve(registry):
+    registry.counter("activities", "Activities").inc()
+    server = registry.serve(port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/metrics"
+        with urllib.request.urlopen(url) as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert "activities_total 1" in response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize(
+    "url,expected",
+    [
+        ("https://example.com/api/workouts", "/api/workouts"),
+        ("https://example.com/api/workouts/Ab3dE", "/api/workouts/{id}"),
+        ("https://example.com/api/workouts/Ab3dE/gpx", "/api/workouts/{id}/gpx"),
+        ("https://example.com/api/users/12?page=2", "/api/users/{id}"),
+    ],
+)
+def test_endpoint(url, expected):
+    assert endpoint(url) == expected
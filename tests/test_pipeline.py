@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from garmin_to_fittrackee.pipeline import (
+    AsyncSyncPipeline,
+    HostLimiter,
+    Job,
+    SyncPipeline,
+)
+
+
+def test_pipeline_uploads_every_job():
+    results = []
+    pipeline = SyncPipeline(
+        download=lambda activity, fileformat: f"{activity['activityId']}.gpx",
+        upload=lambda activity, file: f"workout-{activity['activityId']}",
+        download_workers=3,
+        upload_workers=2,
+    )
+    jobs = [Job(activity={"activityId": i}, formats=["gpx"]) for i in range(50)]
+    pipeline.run(jobs, results.append)
+    assert sorted(job.workout for job in results) == sorted(
+        f"workout-{i}" for i in range(50)
+    )
+
+
+def test_pipeline_tries_next_format_when_upload_fails():
+    results = []
+    pipeline = SyncPipeline(
+        download=lambda activity, fileformat: fileformat,
+        upload=lambda activity, file: "workout" if file == "gpx" else None,
+    )
+    pipeline.run(
+        [Job(activity={"activityId": 1}, formats=["kml", "gpx"])], results.append
+    )
+    assert results[0].workout == "workout"
+    assert results[0].format == "gpx"
+
+
+def test_pipeline_times_each_stage():
+    results = []
+
+    def download(activity, fileformat):
+        time.sleep(0.01)
+        return fileformat
+
+    pipeline = SyncPipeline(
+        download=download,
+        upload=lambda activity, file: "workout" if file == "gpx" else None,
+    )
+    pipeline.run(
+        [Job(activity={"activityId": 1}, formats=["kml", "gpx"])], results.append
+    )
+    # Both formats were downloaded
+    assert results[0].durations["download"] >= 0.02
+    assert "upload" in results[0].durations
+
+
+def test_pipeline_reports_failed_jobs():
+    results = []
+
+    def download(activity, fileformat):
+        raise RuntimeError("Garmin is down")
+
+    pipeline = SyncPipeline(download=download, upload=lambda activity, file: None)
+    pipeline.run([Job(activity={"activityId": 1}, formats=["gpx"])], results.append)
+    assert results[0].workout is None
+    assert results[0].file is None
+
+
+def test_pipeline_result_callback_runs_in_caller_thread():
+    threads = []
+    pipeline = SyncPipeline(
+        download=lambda activity, fileformat: "file",
+        upload=lambda activity, file: "workout",
+    )
+    jobs = [Job(activity={"activityId": i}, formats=["gpx"]) for i in range(5)]
+    pipeline.run(jobs, lambda job: threads.append(threading.current_thread()))
+    assert set(threads) == {threading.current_thread()}
+
+
+def test_interrupted_pipeline_reports_every_upload():
+    results = []
+    uploaded = []
+
+    def upload(activity, file):
+        time.sleep(0.01)
+        uploaded.append(activity["activityId"])
+        return "workout"
+
+    def jobs():
+        for i in range(20):
+            yield Job(activity={"activityId": i}, formats=["gpx"])
+        raise KeyboardInterrupt
+
+    pipeline = SyncPipeline(
+        download=lambda activity, fileformat: "file",
+        upload=upload,
+        queue_size=8,
+    )
+    with pytest.raises(KeyboardInterrupt):
+        pipeline.run(jobs(), results.append)
+    # Waiting jobs are dropped, started ones are all reported
+    assert len(uploaded) < 20
+    assert sorted(job.activity["activityId"] for job in results) == sorted(uploaded)
+
+
+def test_host_limiter_bounds_concurrency():
+    limiter = HostLimiter(default=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def request():
+        with limiter.limit("fittrackee"):
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_pipeline_needs_workers():
+    with pytest.raises(ValueError):
+        SyncPipeline(download=None, upload=None, download_workers=0)
+
+
+def test_async_pipeline_uploads_every_job():
+    results = []
+
+    async def upload(activity, file):
+        return f"workout-{activity['activityId']}"
+
+    pipeline = AsyncSyncPipeline(
+        download=lambda activity, fileformat: "file",
+        upload=upload,
+        download_workers=3,
+        upload_workers=10,
+    )
+    jobs = [Job(activity={"activityId": i}, formats=["gpx"]) for i in range(50)]
+    pipeline.run(jobs, results.append)
+    assert sorted(job.workout for job in results) == sorted(
+        f"workout-{i}" for i in range(50)
+    )
+
+
+def test_async_pipeline_tries_next_format():
+    results = []
+    cleaned = []
+
+    async def upload(activity, file):
+        return "workout" if file == "tcx" else None
+
+    async def cleanup():
+        cleaned.append(True)
+
+    def download(activity, fileformat):
+        if fileformat == "original":
+            raise RuntimeError("Garmin is down")
+        return fileformat
+
+    pipeline = AsyncSyncPipeline(download=download, upload=upload)
+    pipeline.run(
+        [Job(activity={"activityId": 1}, formats=["original", "gpx", "tcx"])],
+        results.append,
+        cleanup=cleanup,
+    )
+    assert results[0].format == "tcx"
+    assert cleaned == [True]
+
+
+def test_interrupted_async_pipeline_reports_every_upload():
+    results = []
+    uploaded = []
+
+    async def upload(activity, file):
+        # Sent, waiting for the response
+        uploaded.append(activity["activityId"])
+        await asyncio.sleep(0.01)
+        return "workout"
+
+    def jobs():
+        for i in range(20):
+            yield Job(activity={"activityId": i}, formats=["gpx"])
+        raise RuntimeError("Garmin is down")
+
+    pipeline = AsyncSyncPipeline(
+        download=lambda activity, fileformat: "file",
+        upload=upload,
+        queue_size=8,
+    )
+    with pytest.raises(RuntimeError):
+        pipeline.run(jobs(), results.append)
+    # Every started upload ends and is reported
+    assert uploaded
+    assert sorted(job.activity["activityId"] for job in results) == sorted(uploaded)
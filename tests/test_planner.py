@@ -0,0 +1,70 @@
+from unittest import mock
+
+import pendulum
+import pytest
+
+from garmin_to_fittrackee.planner import RangePlanner
+
+
+def test_windows_are_contiguous():
+    planner = RangePlanner(
+        start=pendulum.datetime(2020, 1, 1),
+        end=pendulum.datetime(2020, 3, 10),
+        max_days=30,
+    )
+    windows = list(planner.windows())
+    assert windows[0][0] == pendulum.datetime(2020, 1, 1)
+    assert windows[-1][1] == pendulum.datetime(2020, 3, 10)
+    for (_, previous_end), (start, _) in zip(windows, windows[1:], strict=False):
+        assert start == previous_end.add(days=1)
+
+
+def test_multi_year_backfill_uses_few_calls():
+    garmin = mock.Mock()
+    garmin.get_activities_by_date.return_value = [{"activityId": 1}]
+    planner = RangePlanner(
+        start=pendulum.datetime(2012, 1, 1), end=pendulum.datetime(2024, 12, 31)
+    )
+    activities = list(planner.fetch(garmin))
+    assert planner.calls == 13
+    assert len(activities) == 13
+
+
+def test_dense_window_is_split():
+    planner = RangePlanner(
+        start=pendulum.datetime(2020, 1, 1),
+        end=pendulum.datetime(2020, 12, 31),
+        max_days=64,
+        dense_threshold=10,
+    )
+    planner.record(10)
+    assert planner.window_days == 32
+    planner.record(0)
+    assert planner.window_days == 64
+
+
+def test_window_never_below_min_days():
+    planner = RangePlanner(
+        start=pendulum.datetime(2020, 1, 1), max_days=2, dense_threshold=1
+    )
+    planner.record(5)
+    planner.record(5)
+    assert planner.window_days == 1
+
+
+def test_fetch_sorts_activities():
+    garmin = mock.Mock()
+    garmin.get_activities_by_date.return_value = [
+        {"activityId": 2, "startTimeGMT": "2020-01-02 10:00:00"},
+        {"activityId": 1, "startTimeGMT": "2020-01-01 10:00:00"},
+    ]
+    planner = RangePlanner(
+        start=pendulum.datetime(2020, 1, 1), end=pendulum.datetime(2020, 1, 5)
+    )
+    activities = list(planner.fetch(garmin))
+    assert [activity["activityId"] for activity in activities] == [1, 2]
+
+
+def test_invalid_window_size():
+    with pytest.raises(ValueError):
+        RangePlanner(start=pendulum.datetime(2020, 1, 1), max_days=1, min_days=2)
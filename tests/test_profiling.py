@@ -0,0 +1,52 @@
+import json
+import pstats
+
+from garmin_to_fittrackee.profiling import PROFILER, Profiler, profile, profiled
+
+
+def test_spans_ignored_when_disabled():
+    profiler = Profiler()
+    with profiler.span("garmin.list"):
+        pass
+    assert profiler.spans == []
+
+
+def test_summary():
+    profiler = Profiler()
+    profiler.enable()
+    for _ in range(3):
+        with profiler.span("fittrackee.upload_workout"):
+            pass
+    with profiler.span("garmin.list"):
+        pass
+    summary = {row[0]: row for row in profiler.summary()}
+    assert summary["fittrackee.upload_workout"][1] == 3
+    assert summary["garmin.list"][1] == 1
+
+
+def test_write_trace(tmp_path):
+    profiler = Profiler()
+    profiler.enable()
+    with profiler.span("garmin.download"):
+        pass
+    path = tmp_path / "trace.json"
+    profiler.write_trace(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert events[0]["name"] == "garmin.download"
+    assert events[0]["cat"] == "garmin"
+    assert events[0]["ph"] == "X"
+
+
+def test_profile_writes_stats(tmp_path):
+    @profiled("test.work")
+    def work():
+        return sum(range(1000))
+
+    stats_path = tmp_path / "sync.pstats"
+    trace_path = tmp_path / "trace.json"
+    with profile(str(stats_path), str(trace_path)):
+        assert work() == 499500
+    assert not PROFILER.enabled
+    assert [row[0] for row in PROFILER.summary()] == ["test.work"]
+    assert pstats.Stats(str(stats_path)).total_calls > 0
+    assert trace_path.exists()
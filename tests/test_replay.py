@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from garmin_to_fittrackee.archive import ActivityArchive
+from garmin_to_fittrackee.main import config_exists
+from garmin_to_fittrackee.replay import Replayer
+
+
+@pytest.fixture
+def archive(tmp_path, ctx):
+    archive = ActivityArchive.load(tmp_path / "archive", ctx.db)
+    for i in range(1, 6):
+        activity = {
+            "activityId": i,
+            "activityName": f"Activity {i}",
+            "activityType": {"typeId": 1},
+            "startTimeGMT": f"2024-01-0{i} 08:00:00",
+            "hasPolyline": True,
+        }
+        archive.store(i, "gpx", f"<gpx>{i}</gpx>".encode(), activity=activity)
+    archive.flush(ctx.db)
+    return archive
+
+
+@pytest.fixture
+def fittrackee():
+    client = MagicMock()
+    client.host = "fittrackee.example.com"
+    client.upload_workout.side_effect = lambda **kwargs: SimpleNamespace(
+        id=f"new-{kwargs['filename']}"
+    )
+    return client
+
+
+def mapping(db) -> dict:
+    return dict(db.execute("SELECT garmin_id, fittrackee_id FROM activities_ids"))
+
+
+def test_replay_uploads_missing_workouts(ctx, archive, fittrackee):
+    with ctx.db:
+        ctx.db.execute("INSERT INTO activities_ids VALUES('old-1', 1)")
+    progress = Replayer(ctx, archive, fittrackee).run()
+    assert progress.done == 4
+    assert fittrackee.upload_workout.call_count == 4
+    fittrackee.remove_workout.assert_not_called()
+    assert mapping(ctx.db)[1] == "old-1"
+    assert mapping(ctx.db)[2] == "new-2.gpx"
+    assert ctx.db.execute("SELECT COUNT(*) FROM replay_checkpoint").fetchone() == (0,)
+
+
+def test_replace_deletes_previous_workout(ctx, archive, fittrackee):
+    with ctx.db:
+        ctx.db.execute("INSERT INTO activities_ids VALUES('old-1', 1)")
+    progress = Replayer(ctx, archive, fittrackee, replace=True).run()
+    assert progress.done == 5
+    fittrackee.remove_workout.assert_called_once_with("old-1")
+    assert mapping(ctx.db)[1] == "new-1.gpx"
+
+
+def test_interrupted_replay_resumes(ctx, archive, fittrackee):
+    def upload_workout(**kwargs):
+        if kwargs["filename"] == "3.gpx":
+            return None
+        return SimpleNamespace(id=f"new-{kwargs['filename']}")
+
+    fittrackee.upload_workout.side_effect = upload_workout
+    progress = Replayer(ctx, archive, fittrackee, replace=True).run()
+    assert progress.failed == 1
+    assert ctx.db.execute("SELECT COUNT(*) FROM replay_checkpoint").fetchone() == (4,)
+
+    fittrackee.upload_workout.reset_mock(side_effect=True)
+    fittrackee.upload_workout.return_value = SimpleNamespace(id="new-3.gpx")
+    progress = Replayer(ctx, archive, fittrackee, replace=True).run()
+    assert progress.done == 1
+    assert fittrackee.upload_workout.call_args.kwargs["filename"] == "3.gpx"
+    assert len(mapping(ctx.db)) == 5
+    assert ctx.db.execute("SELECT COUNT(*) FROM replay_checkpoint").fetchone() == (0,)
+
+
+def test_replay_needs_no_garmin_tokens(tmp_path, ctx):
+    (tmp_path / "fittrackee.yml").write_text("{}")
+    assert config_exists(ctx, garmin=False)
+    assert not config_exists(ctx)
@@ -0,0 +1,201 @@
+import socket
+import threading
+
+import pytest
+import requests
+import requests_mock
+
+from garmin_to_fittrackee.metrics import REQUEST_SECONDS, RETRIES
+from garmin_to_fittrackee.retry import (
+    DEFAULT_TIMEOUT,
+    CircuitBreaker,
+    CircuitOpenError,
+    Requester,
+    RetryPolicy,
+    TokenBucket,
+)
+
+url = "https://dev.localhost.tld/api/workouts"
+
+
+@pytest.fixture
+def sleep(mocker):
+    return mocker.patch("garmin_to_fittrackee.retry.time.sleep")
+
+
+@pytest.fixture
+def requester():
+    return Requester(bucket=TokenBucket(rate=0, capacity=1))
+
+
+def test_retry_then_success(sleep, requester):
+    with requests_mock.Mocker() as m:
+        m.get(url, [{"status_code": 502}, {"status_code": 200, "json": {}}])
+        r = requester.request(requests.Session(), "GET", url)
+        assert r.status_code == 200
+        assert requester.retries == 1
+
+
+def test_default_timeout(requester):
+    with requests_mock.Mocker() as m:
+        m.get(url, json={})
+        requester.request(requests.Session(), "GET", url)
+        assert m.last_request.timeout == DEFAULT_TIMEOUT
+        requester.request(requests.Session(), "GET", url, timeout=5)
+        assert m.last_request.timeout == 5
+
+
+def test_retry_metrics(sleep, requester):
+    retries = RETRIES.get(service="fittrackee")
+    requests_count = REQUEST_SECONDS.count(
+        service="fittrackee", method="GET", endpoint="/api/workouts"
+    )
+    with requests_mock.Mocker() as m:
+        m.get(url, [{"status_code": 502}, {"status_code": 200, "json": {}}])
+        requester.request(requests.Session(), "GET", url)
+    assert RETRIES.get(service="fittrackee") == retries + 1
+    assert (
+        REQUEST_SECONDS.count(
+            service="fittrackee", method="GET", endpoint="/api/workouts"
+        )
+        == requests_count + 2
+    )
+
+
+def test_retry_exhausted_returns_last_response(sleep):
+    requester = Requester(
+        policy=RetryPolicy(retries=2), bucket=TokenBucket(rate=0, capacity=1)
+    )
+    with requests_mock.Mocker() as m:
+        m.get(url, status_code=500)
+        r = requester.request(requests.Session(), "GET", url)
+        assert r.status_code == 500
+        assert m.call_count == 3
+
+
+def test_no_retry_on_client_error(sleep, requester):
+    with requests_mock.Mocker() as m:
+        m.get(url, status_code=404)
+        assert requester.request(requests.Session(), "GET", url).status_code == 404
+        assert m.call_count == 1
+
+
+def test_connection_error_raised_after_retries(sleep, requester):
+    with requests_mock.Mocker() as m:
+        m.get(url, exc=requests.exceptions.ConnectionError())
+        with pytest.raises(requests.exceptions.ConnectionError):
+            requester.request(requests.Session(), "GET", url)
+        assert m.call_count == 5
+
+
+def test_post_not_retried_on_read_timeout(sleep, requester):
+    with requests_mock.Mocker() as m:
+        m.post(url, exc=requests.exceptions.ReadTimeout())
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            requester.request(requests.Session(), "POST", url)
+        assert m.call_count == 1
+
+
+@pytest.fixture
+def dropping_server():
+    """
+    Server reading each request then closing the connection without
+    answering, as a crash after processing an upload.
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+    server.settimeout(0.1)
+    received = []
+    stop = threading.Event()
+
+    def serve():
+        while not stop.is_set():
+            try:
+                connection, _ = server.accept()
+            except TimeoutError:
+                continue
+            with connection:
+                received.append(connection.recv(65536))
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}/api/workouts", received
+    stop.set()
+    thread.join()
+    server.close()
+
+
+def test_post_not_retried_once_sent(sleep, requester, dropping_server):
+    server_url, received = dropping_server
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requester.request(
+            requests.Session(), "POST", server_url, files={"file": b"<gpx/>"}
+        )
+    assert len(received) == 1
+
+
+def test_post_retried_when_not_sent(sleep, requester):
+    server = socket.create_server(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    server.close()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requester.request(requests.Session(), "POST", f"http://127.0.0.1:{port}/")
+    assert requester.retries == 4
+
+
+def test_retry_after_is_respected(sleep, requester):
+    sleep.side_effect = lambda seconds: setattr(requester.bucket, "paused_until", 0)
+    with requests_mock.Mocker() as m:
+        m.get(
+            url,
+            [
+                {"status_code": 429, "headers": {"Retry-After": "7"}},
+                {"status_code": 200},
+            ],
+        )
+        requester.request(requests.Session(), "GET", url)
+    sleep.assert_any_call(7.0)
+
+
+def test_retry_after_http_date():
+    response = requests.Response()
+    response.headers["Retry-After"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert RetryPolicy.retry_after(response) == 0.0
+
+
+def test_backoff_is_bounded():
+    policy = RetryPolicy(backoff=1, max_backoff=10)
+    assert all(0 <= policy.delay(attempt) <= 10 for attempt in range(10))
+
+
+def test_token_bucket_limits_burst(sleep):
+    bucket = TokenBucket(rate=1, capacity=2)
+    bucket.acquire()
+    bucket.acquire()
+    sleep.assert_not_called()
+    sleep.side_effect = lambda seconds: setattr(bucket, "tokens", 1)
+    bucket.acquire()
+    sleep.assert_called_once()
+
+
+def test_circuit_breaker_opens(sleep):
+    breaker = CircuitBreaker(threshold=2, reset_timeout=60)
+    requester = Requester(
+        policy=RetryPolicy(retries=0),
+        bucket=TokenBucket(rate=0, capacity=1),
+        breaker=breaker,
+    )
+    with requests_mock.Mocker() as m:
+        m.get(url, status_code=503)
+        requester.request(requests.Session(), "GET", url)
+        requester.request(requests.Session(), "GET", url)
+        with pytest.raises(CircuitOpenError):
+            requester.request(requests.Session(), "GET", url)
+        assert m.call_count == 2
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.failures == 0
@@ -1,6 +1,17 @@
+import json
+import sqlite3
+from pathlib import Path
+
 import pytest
 
-from garmin_to_fittrackee.sports import Sports
+from garmin_to_fittrackee.sports import (
+    Sports,
+    SportTable,
+    cache_sports,
+    cached_sports,
+)
+
+get_sports_json = Path(f"{Path().resolve()}/tests/files/get_sports.json").read_text()
 
 
 def test_get_fittrackee_sport_by_garmin_id_2():
@@ -81,3 +92,39 @@ def test_get_fittrackee_sport_by_garmin_id_wrong_id():
 def test_get_fittrackee_sport_by_garmin_id_wrong():
     with pytest.raises(ValueError, match=r"garmin_sport_id Hello is not an int"):
         Sports.get_fittrackee_sport_by_garmin_id("Hello")
+
+
+def test_sport_table_overrides():
+    table = SportTable.load({"sports": {"default": 2, "overrides": {"4": 17, 2: 2}}})
+    assert table.resolve(4) == 17
+    assert table.resolve(2) == 2
+    assert table.resolve(1) == 5
+    assert table.resolve(358) == 2
+
+
+def test_sport_table_resolve_many(caplog):
+    table = SportTable()
+    page = [{"activityType": {"typeId": type_id}} for type_id in [1, 358, 5, 358]]
+    assert table.resolve_many(page) == [5, 1, 4, 1]
+    assert table.unknown == {358}
+    assert caplog.text.count("Garmin type 358") == 1
+
+
+def test_sport_table_check():
+    sports = json.loads(get_sports_json)["data"]["sports"]
+    assert SportTable().check(sports) == []
+    sports = [sport for sport in sports if sport["id"] != 16]
+    sports[0]["is_active"] = False
+    assert SportTable().check(sports) == [
+        "Sport 1 (Cycling (Sport)) is disabled",
+        "Sport 16 doesn't exist on the instance",
+    ]
+
+
+def test_sport_table_uses_cached_sports():
+    db = sqlite3.connect(":memory:")
+    assert SportTable.load({}, db).resolve(28) == 16
+    sports = json.loads(get_sports_json)["data"]["sports"]
+    cache_sports(db, [sport for sport in sports if sport["id"] != 16])
+    assert set(cached_sports(db)) == set(range(1, 18)) - {16}
+    assert SportTable.load({}, db).resolve(28) == 1
@@ -0,0 +1,59 @@
+import subprocess
+import sys
+
+# Cumulative import time of garmin_to_fittrackee.main, in microseconds
+IMPORT_BUDGET_US = 500_000
+
+HEAVY_MODULES = [
+    "garminconnect",
+    "pendulum",
+    "requests",
+    "requests_oauthlib",
+    "sqlite3",
+    "yaml",
+]
+
+
+def run_python(code: str, tmp_path, *options):
+    return subprocess.run(
+        [sys.executable, *options, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={"HOME": str(tmp_path), "PATH": ""},
+    )
+
+
+def test_main_import_is_lazy(tmp_path):
+    result = run_python(
+        "import sys, garmin_to_fittrackee.main\n"
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+        tmp_path,
+    )
+    assert result.stdout.strip() == ""
+    assert not (tmp_path / ".config").exists()
+
+
+def test_main_import_with_config(tmp_path):
+    config_path = tmp_path / ".config" / "garmin-to-fittrackee"
+    config_path.mkdir(parents=True)
+    (config_path / "config.yml").write_text("log:\n  level: DEBUG\n")
+    result = run_python(
+        "import sys, threading, garmin_to_fittrackee.main\n"
+        "print('yaml' in sys.modules, threading.active_count())",
+        tmp_path,
+    )
+    # config.yml is only read, and the log listener started, by a command
+    assert result.stdout.split() == ["False", "1"]
+
+
+def test_main_import_time(tmp_path):
+    result = run_python(
+        "import garmin_to_fittrackee.main", tmp_path, "-X", "importtime"
+    )
+    for line in result.stderr.splitlines():
+        _, cumulative, module = line.split("|")
+        if module.strip() == "garmin_to_fittrackee.main":
+            assert int(cumulative) < IMPORT_BUDGET_US
+            return
+    raise AssertionError("garmin_to_fittrackee.main not found in importtime output")
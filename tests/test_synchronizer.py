@@ -0,0 +1,149 @@
+from types import SimpleNamespace
+
+import garminconnect
+import pendulum
+import pytest
+
+from benchmarks.fakes import FakeGarmin, synthetic_activities
+from garmin_to_fittrackee.database import WorkQueue
+from garmin_to_fittrackee.synchronizer import Synchronizer
+
+START = pendulum.datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def garmin(mocker):
+    fake = FakeGarmin(
+        synthetic_activities(20, START, START.add(days=30)),
+        payloads={"ORIGINAL": b"zip", "GPX": b"gpx", "TCX": b"tcx"},
+    )
+
+    class Garmin:
+        ActivityDownloadFormat = garminconnect.Garmin.ActivityDownloadFormat
+
+        def __new__(cls):
+            return fake
+
+    mocker.patch("garmin_to_fittrackee.synchronizer.Garmin", Garmin)
+    mocker.patch("garmin_to_fittrackee.synchronizer.configure_garmin")
+    return fake
+
+
+@pytest.fixture
+def fittrackee(mocker):
+    client = mocker.patch("garmin_to_fittrackee.synchronizer.Fittrackee").return_value
+    client.host = "fittrackee.example.com"
+    client.upload_workout.side_effect = lambda **kwargs: SimpleNamespace(
+        id=f"workout-{kwargs['filename']}"
+    )
+    return client
+
+
+def test_run_uploads_and_moves_cursor(ctx, garmin, fittrackee):
+    synchronizer = Synchronizer(ctx, rate_limit=0)
+    report = synchronizer.run(START, end=START.add(days=40))
+    assert report.uploaded == 20
+    assert report.failed == 0
+    assert fittrackee.upload_workout.call_count == 20
+    assert len(synchronizer.index) == 20
+    last = garmin.activities[-1]
+    assert synchronizer.cursor.garmin_id == last["activityId"]
+
+    # Everything is already synchronised, nothing to upload
+    report = synchronizer.run(synchronizer.start_datetime(), end=START.add(days=40))
+    assert report.processed == 0
+    assert garmin.calls["login"] == 1
+    fittrackee.is_workout_present.assert_not_called()
+
+
+def test_async_engine(ctx, garmin, fittrackee, mocker):
+    class AsyncFittrackee:
+        def __init__(self, fittrackee, max_connections):
+            pass
+
+        async def upload_workout(self, data, filename, sport_id, name):
+            return SimpleNamespace(id=f"workout-{filename}")
+
+        async def close(self):
+            pass
+
+    mocker.patch(
+        "garmin_to_fittrackee.async_fittrackee.AsyncFittrackee", AsyncFittrackee
+    )
+    synchronizer = Synchronizer(ctx, engine="async", rate_limit=0)
+    # Small batches so the work queue is written during the run
+    synchronizer.queue.batch_size = 2
+    report = synchronizer.run(START, end=START.add(days=40))
+    assert report.uploaded == 20
+    assert report.failed == 0
+    assert synchronizer.queue.counts()["uploaded"] == 20
+    assert WorkQueue.load(ctx.db).counts()["uploaded"] == 20
+
+
+def test_start_datetime_from_cursor(ctx, garmin, fittrackee):
+    synchronizer = Synchronizer(ctx)
+    synchronizer.cursor.start_time = "2024-03-10 06:00:00"
+    assert synchronizer.start_datetime() == pendulum.datetime(2024, 3, 9, 6)
+
+
+def test_failed_activity_stays_in_queue(ctx, garmin, fittrackee):
+    failing = garmin.activities[5]["activityId"]
+
+    def upload_workout(**kwargs):
+        if kwargs["filename"].startswith(str(failing)):
+            return None
+        return SimpleNamespace(id=f"workout-{kwargs['filename']}")
+
+    fittrackee.upload_workout.side_effect = upload_workout
+    synchronizer = Synchronizer(
+        ctx, activity_format="gpx", rate_limit=0, max_attempts=2
+    )
+    report = synchronizer.run(START, end=START.add(days=40))
+    assert report.failed == 1
+    # The failure waits in the work queue, the cursor moves on
+    assert synchronizer.queue.state(failing) == "downloaded"
+    assert synchronizer.cursor.garmin_id == garmin.activities[-1]["activityId"]
+
+    report = synchronizer.run(synchronizer.start_datetime(), end=START.add(days=40))
+    assert report.processed == 1
+    assert synchronizer.queue.state(failing) == "failed"
+
+    # Only retry-failed tries it again
+    report = synchronizer.run(synchronizer.start_datetime(), end=START.add(days=40))
+    assert report.processed == 0
+    fittrackee.upload_workout.side_effect = None
+    fittrackee.upload_workout.return_value = SimpleNamespace(id="workout")
+    WorkQueue.retry_failed(ctx.db)
+    synchronizer = Synchronizer(ctx, activity_format="gpx", rate_limit=0)
+    report = synchronizer.run()
+    assert report.uploaded == 1
+    assert synchronizer.queue.counts() == {
+        "pending": 0,
+        "downloaded": 0,
+        "uploaded": 20,
+        "failed": 0,
+    }
+
+
+def test_invalid_options(ctx):
+    with pytest.raises(ValueError):
+        Synchronizer(ctx, activity_format="fit")
+    with pytest.raises(ValueError):
+        Synchronizer(ctx, engine="processes")
+
+
+def test_archive_avoids_garmin_downloads(tmp_path, ctx, garmin, fittrackee):
+    ctx.config["archive"] = {"use": True, "path": str(tmp_path / "archive")}
+    synchronizer = Synchronizer(ctx, activity_format="gpx", rate_limit=0)
+    synchronizer.run(START, end=START.add(days=40))
+    assert garmin.calls["download_activity"] == 20
+    assert len(synchronizer.archive) == 20
+
+    # After a reset, files come from the archive
+    with ctx.db:
+        ctx.db.execute("DELETE FROM activities_ids")
+        ctx.db.execute("DELETE FROM sync_cursor")
+    synchronizer = Synchronizer(ctx, activity_format="gpx", rate_limit=0)
+    report = synchronizer.run(START, end=START.add(days=40))
+    assert report.uploaded == 20
+    assert garmin.calls["download_activity"] == 20
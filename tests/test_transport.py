@@ -0,0 +1,60 @@
+from unittest import mock
+
+import pytest
+import requests
+import requests_mock
+from requests.adapters import HTTPAdapter
+
+from garmin_to_fittrackee.transport import (
+    build_adapter,
+    configure_garmin,
+    configure_session,
+    shared_session,
+)
+
+
+def test_configure_session_pool_size():
+    session = configure_session(requests.Session(), pool_size=8)
+    adapter = session.get_adapter("https://dev.localhost.tld")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter._pool_maxsize == 8
+    assert session.headers["Connection"] == "keep-alive"
+    assert "gzip" in session.headers["Accept-Encoding"]
+
+
+def test_configured_session_sends_requests():
+    session = configure_session(requests.Session())
+    with requests_mock.Mocker() as m:
+        m.get("https://dev.localhost.tld/api/config", json={"status": "success"})
+        assert session.get("https://dev.localhost.tld/api/config").ok
+
+
+def test_http2_fallback_without_httpx():
+    with mock.patch.dict("sys.modules", {"httpx": None}):
+        adapter = build_adapter(transport="http2")
+    assert isinstance(adapter, HTTPAdapter)
+
+
+def test_unknown_transport():
+    with pytest.raises(ValueError):
+        build_adapter(transport="carrier-pigeon")
+
+
+def test_shared_session_is_reused():
+    assert shared_session() is shared_session()
+
+
+def test_configure_garmin_keeps_retries():
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(max_retries=3))
+    garmin = mock.Mock()
+    garmin.garth.sess = session
+    configure_garmin(garmin, pool_size=4)
+    adapter = session.get_adapter("https://connectapi.garmin.com")
+    assert adapter.max_retries.total == 3
+    assert adapter._pool_maxsize == 4
+
+
+def test_configure_garmin_without_session():
+    garmin = mock.Mock(spec=[])
+    configure_garmin(garmin)